@@ -0,0 +1,181 @@
+import argparse
+import asyncio
+import hashlib
+import logging
+import os.path
+import sqlite3
+import time
+from datetime import datetime
+from typing import List, NamedTuple, Optional
+
+from core.config import (
+    BACKUP_DIR,
+    BACKUP_INTERVAL,
+    BACKUP_KEEP,
+    BACKUP_PAGES,
+    BACKUP_SLEEP,
+    DB_DIR,
+    DB_NAME
+)
+from core.db import get_db_path
+
+
+class BackupError(Exception):
+    pass
+
+
+class Snapshot(NamedTuple):
+    path: str
+    pages: int
+    duration: float  # s
+
+
+def create_snapshot(
+        db_path: Optional[str] = None,
+        path: str = BACKUP_DIR,
+        pages: int = BACKUP_PAGES,
+        sleep: float = BACKUP_SLEEP,
+        keep: int = BACKUP_KEEP,
+        now: Optional[float] = None
+) -> Snapshot:
+    """
+    Copies the db into path with the sqlite backup API, pages at a time,
+    and writes the sha256 checksum next to the snapshot. Only the last
+    keep snapshots are kept.
+
+    The copy uses its own connection, so it can run in a thread while the
+    bot keeps writing.
+    """
+    db_path = db_path or get_db_path() or os.path.join(DB_DIR, DB_NAME)
+    now = time.time() if now is None else now
+    os.makedirs(path, exist_ok=True)
+    prefix = os.path.splitext(os.path.basename(db_path))[0]
+    date = datetime.fromtimestamp(now).strftime('%Y%m%d_%H%M%S')
+    file_path = os.path.join(path, f'{prefix}_{date}.db')
+    part_path = f'{file_path}.part'
+    total_pages = 0
+
+    def progress(status: int, remaining: int, total: int) -> None:
+        nonlocal total_pages
+        total_pages = total
+
+    started = time.monotonic()
+    source = sqlite3.connect(db_path)
+    target = sqlite3.connect(part_path)
+    try:
+        # the read transaction pins one version of the db, so writes
+        # between the steps don't restart the copy
+        source.execute('BEGIN')
+        source.execute('SELECT count(*) FROM sqlite_master').fetchone()
+        source.backup(target, pages=pages, progress=progress, sleep=sleep)
+    finally:
+        source.rollback()
+        source.close()
+        target.close()
+    os.replace(part_path, file_path)
+    _write_checksum(file_path)
+    duration = time.monotonic() - started
+    _delete_old_snapshots(path, prefix, keep)
+    logging.info(
+        f'Backup {os.path.basename(file_path)}: {total_pages} pages in '
+        f'{duration:.2f} s ({total_pages / max(duration, 1e-6):.0f} pages/s)'
+    )
+    return Snapshot(file_path, total_pages, duration)
+
+
+def _get_checksum(file_path: str) -> str:
+    checksum = hashlib.sha256()
+    with open(file_path, mode='rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            checksum.update(chunk)
+    return checksum.hexdigest()
+
+
+def _write_checksum(file_path: str) -> None:
+    # the sha256sum format, `sha256sum -c` checks it too
+    with open(f'{file_path}.sha256', mode='w') as file:
+        file.write(f'{_get_checksum(file_path)}  {os.path.basename(file_path)}\n')
+
+
+def verify_snapshot(file_path: str) -> bool:
+    try:
+        with open(f'{file_path}.sha256', mode='r') as file:
+            checksum = file.read().split()[0]
+    except (OSError, IndexError):
+        return False
+    return checksum == _get_checksum(file_path)
+
+
+def get_snapshots(path: str = BACKUP_DIR, prefix: str = '') -> List[str]:
+    """Returns snapshot paths from the oldest to the newest."""
+    if not os.path.isdir(path):
+        return []
+    return [
+        os.path.join(path, file)
+        for file in sorted(os.listdir(path))
+        if file.startswith(prefix) and file.endswith('.db')
+    ]
+
+
+def _delete_old_snapshots(path: str, prefix: str, keep: int) -> None:
+    snapshots = get_snapshots(path, prefix)
+    for file_path in snapshots[:max(0, len(snapshots) - keep)]:
+        os.remove(file_path)
+        if os.path.exists(f'{file_path}.sha256'):
+            os.remove(f'{file_path}.sha256')
+
+
+def restore_snapshot(file_path: str, db_path: Optional[str] = None) -> None:
+    """
+    Replaces the db with the snapshot after checking its checksum.
+    The bot must be stopped.
+    """
+    db_path = db_path or get_db_path() or os.path.join(DB_DIR, DB_NAME)
+    if not verify_snapshot(file_path):
+        raise BackupError(f'Контрольная сумма {file_path} не совпадает')
+    source = sqlite3.connect(file_path)
+    target = sqlite3.connect(db_path)
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
+    logging.info(f'Db restored from {os.path.basename(file_path)}')
+
+
+async def run_backups(interval: int = BACKUP_INTERVAL) -> None:
+    loop = asyncio.get_event_loop()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await loop.run_in_executor(None, create_snapshot)
+        except Exception:
+            logging.exception('Backup failed')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Db snapshots')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('backup', help='create a snapshot')
+    commands.add_parser('list', help='list snapshots')
+    restore = commands.add_parser(
+        'restore', help='restore the db, the bot must be stopped'
+    )
+    restore.add_argument('snapshot', nargs='?', help='the latest one by default')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.command == 'backup':
+        print(create_snapshot().path)
+    elif args.command == 'list':
+        for file_path in get_snapshots():
+            status = 'ok' if verify_snapshot(file_path) else 'corrupted'
+            print(f'{file_path} {status}')
+    else:
+        snapshots = get_snapshots()
+        if args.snapshot is None and not snapshots:
+            raise BackupError('Нет ни одного снимка')
+        restore_snapshot(args.snapshot or snapshots[-1])
+
+
+if __name__ == '__main__':
+    main()
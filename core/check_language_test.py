@@ -53,7 +53,8 @@ def _check_language_test_content(
     except LanguageTestError as e:
         raise e
     except Exception as e:
-        logging.exception(msg=e)
+        # the document is malformed, a traceback adds nothing
+        logging.warning(f'Language test check failed: {e!r}')
         raise LanguageTestError(
             'Не удалось проверить ваше тест.\n Пожалуйста, проверьте '
             'корректность вашего теста и пришлите тест ещё раз.'
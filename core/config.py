@@ -4,12 +4,74 @@ import os
 BASE_DIR = os.path.split(os.path.dirname(os.path.abspath(__file__)))[0]
 DB_DIR = os.path.join(BASE_DIR, 'db')
 INIT_DATA_DIR = os.path.join(BASE_DIR, 'init_data')
+ARCHIVE_DIR = os.path.join(DB_DIR, 'archive')
+BACKUP_DIR = os.path.join(DB_DIR, 'backups')
 
 
 TOKEN = os.getenv('BOT_TOKEN')
 BOT_NAME = os.getenv('BOT_NAME')
 
 
+DB_NAME = 'language_bot_db.db'
+# number of worker processes, 1 - dispatch updates in the polling process
+WORKERS = int(os.getenv('BOT_WORKERS', '1'))
+# threads running SessionsDispatcher, 0 - run it on the event loop
+DISPATCH_THREADS = int(os.getenv('BOT_DISPATCH_THREADS', '0'))
+# users whose updates are handled at the same time, see core.user_queues
+USER_CONCURRENCY = int(os.getenv('BOT_USER_CONCURRENCY', '32'))
+# threads validating and importing uploaded documents
+UPLOAD_WORKERS = int(os.getenv('BOT_UPLOAD_WORKERS', '2'))
+UPLOADS_PER_USER = 1
+# outbound Bot API connection pools, downloads use their own pool
+HTTP_POOL_SIZE = int(os.getenv('BOT_HTTP_POOL_SIZE', '32'))
+HTTP_UPLOAD_POOL_SIZE = int(os.getenv('BOT_HTTP_UPLOAD_POOL_SIZE', '4'))
+HTTP_KEEPALIVE_TIMEOUT = 60  # s
+HTTP_DNS_CACHE_TTL = 600  # s
+HTTP_TIMEOUT = 30  # s
+HTTP_UPLOAD_TIMEOUT = 300  # s
+# logging, see core.log
+LOG_JSON = os.getenv('BOT_LOG_JSON', '') == '1'
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+LOG_ROTATE_WHEN = 'midnight'
+LOG_QUEUE_SIZE = 10000
+# watchdog, see core.watchdog
+LOOP_LAG_THRESHOLD = 0.1  # s
+SLOW_HANDLER_THRESHOLD = float(os.getenv('BOT_SLOW_HANDLER_THRESHOLD', '1'))  # s
+# flood control, see core.flood: updates per second and bursts
+FLOOD_USER_RATE = 1.0
+FLOOD_USER_BURST = 5
+FLOOD_GLOBAL_RATE = float(os.getenv('BOT_FLOOD_GLOBAL_RATE', '30'))
+FLOOD_GLOBAL_BURST = 100
+# 'drop' or 'queue' - delay the update up to FLOOD_DEADLINE seconds
+FLOOD_POLICY = os.getenv('BOT_FLOOD_POLICY', 'drop')
+FLOOD_DEADLINE = 5.0  # s
+# updates remembered to skip redelivered ones, see core.dedup
+DEDUP_WINDOW = 10000
+DEDUP_FLUSH_INTERVAL = 1  # s
+# attempts older than RETENTION_DAYS are moved to ARCHIVE_DIR, see core.retention
+RETENTION_DAYS = int(os.getenv('BOT_RETENTION_DAYS', '365'))
+RETENTION_BATCH = 500  # attempts per transaction
+RETENTION_MAX_BATCHES = 20  # per run
+RETENTION_INTERVAL = int(os.getenv('BOT_RETENTION_INTERVAL', str(24 * 60 * 60)))  # s
+# db snapshots, see core.backup
+BACKUP_INTERVAL = int(os.getenv('BOT_BACKUP_INTERVAL', str(24 * 60 * 60)))  # s
+BACKUP_KEEP = 7
+BACKUP_PAGES = 256  # pages copied per step
+BACKUP_SLEEP = 0.05  # s between steps
+# db maintenance, see core.maintenance: local hours 'start-end'
+MAINTENANCE_HOURS = os.getenv('BOT_MAINTENANCE_HOURS', '3-5')
+MAINTENANCE_VACUUM_PAGES = 256  # pages per incremental_vacuum step
+# profiles requested with /profile, see core.profiling
+PROFILE_DIR = os.path.join(BASE_DIR, 'profiles')
+PROFILE_TOP = 20  # functions in the summary
+MAX_PROFILE_SECONDS = 600
+MAX_PROFILE_UPDATES = 10000
+# deep links expire after DEEP_LINK_TTL
+DEEP_LINK_TTL = 7 * 24 * 60 * 60  # s
+MAX_DEEP_LINKS = 50  # per /create_deep_link command
+
+
 ADMINS = [
     ...,
 ]
@@ -23,6 +85,9 @@ COMMANDS = {
     'user_commands': {
         'begin_test',
     },
+    'stats_commands': {
+        'stats',
+    },
     'test_creator_commands': {
         'add_questions',
         'delete_questions',
@@ -31,8 +96,12 @@ COMMANDS = {
     'information_commands': {
         'languages_list',
         'test_types_list',
+        'worst_questions',
     },
     'admin_commands': {
+        'archive_attempts',
         'create_deep_link',
+        'profile',
+        'profile_updates',
     },
 }
@@ -1,118 +1,205 @@
+import collections
+import json
 import os.path
 import re
 import sqlite3
+import threading
+import time
 import uuid
 from datetime import datetime
 from typing import List, Dict, Optional, Sequence, Tuple, Union
 
-from core.config import BOT_NAME, DB_DIR
+from core import queries
+from core.config import BOT_NAME, DB_DIR, DEEP_LINK_TTL
+from core.queries import CACHED_STATEMENTS, StatementCacheStats
+from core.scheduler import get_next_review, Review
 from core.types import LanguageTest
 
 
-_connection: Optional[sqlite3.Connection] = None
-_cursor: Optional[sqlite3.Cursor] = None
+_db_path: Optional[str] = None
+# every thread (event loop, upload pool) works with its own connection
+_local = threading.local()
+_statements_stats: List[StatementCacheStats] = []
+_statements_stats_lock = threading.Lock()
 
 
 def create_connection(db_name: str, db_path: str = DB_DIR) -> None:
-    global _connection, _cursor
+    global _db_path
     if db_name == ':memory:':
         db_path = db_name
     else:
         db_path = os.path.join(db_path, db_name)
-    _connection = sqlite3.connect(db_path)
-    _cursor = _connection.cursor()
+    _db_path = db_path
+    _connect()
+
+
+def _connect() -> sqlite3.Connection:
+    connection = sqlite3.connect(_db_path, cached_statements=CACHED_STATEMENTS)
+    # a new db only, before WAL writes its header, existing ones are
+    # switched by python -m core.maintenance enable_incremental_vacuum
+    connection.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    # WAL lets worker processes read while one of them writes
+    connection.execute('PRAGMA journal_mode=WAL')
+    _local.connection = connection
+    _local.cursor = connection.cursor()
+    _local.statements = StatementCacheStats()
+    with _statements_stats_lock:
+        _statements_stats.append(_local.statements)
+    return connection
+
+
+def get_db_path() -> Optional[str]:
+    return _db_path
 
 
 def close_connection():
-    _connection.close()
+    connection = getattr(_local, 'connection', None)
+    if connection is not None:
+        connection.close()
+        _local.connection = None
+
+
+def _get_connection() -> sqlite3.Connection:
+    connection = getattr(_local, 'connection', None)
+    if connection is None:
+        connection = _connect()
+    return connection
+
+
+def _get_cursor() -> sqlite3.Cursor:
+    _get_connection()
+    return _local.cursor
+
+
+def _execute(sql: str, parameters: Sequence = ()) -> sqlite3.Cursor:
+    """
+    Executes a statement with bound parameters. Every statement goes
+    through here, so the simulated statement cache stats see all of them.
+    """
+    cursor = _get_cursor()
+    _local.statements.register(sql)
+    return cursor.execute(sql, parameters)
+
+
+def _executemany(sql: str, parameters: List[Sequence]) -> sqlite3.Cursor:
+    cursor = _get_cursor()
+    _local.statements.register(sql)
+    return cursor.executemany(sql, parameters)
+
+
+def get_statement_cache_stats() -> Dict[str, Union[int, float]]:
+    """
+    Returns hits and misses of the prepared statements caches of all
+    connections opened by the process, as simulated by StatementCacheStats:
+    sqlite3 doesn't expose its own cache.
+    """
+    with _statements_stats_lock:
+        hits = sum(i.hits for i in _statements_stats)
+        misses = sum(i.misses for i in _statements_stats)
+        number_statements = sum(i.number_statements for i in _statements_stats)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / total if total else 0.0,
+        'number_statements': number_statements,
+    }
 
 
 def insert(table: str, columns: Tuple[str, ...], values: List[Sequence]) -> None:
+    _insert(table, columns, values)
+    _get_connection().commit()
+
+
+def _insert(table: str, columns: Tuple[str, ...], values: List[Sequence]) -> None:
+    """Same as insert, but leaves the transaction open."""
     columns_list = ', '.join(columns)
     placeholders = ', '.join('?' * len(columns))
-    _cursor.executemany(
+    _executemany(
         f'INSERT INTO {table} '
         f'({columns_list}) '
         f'VALUES ({placeholders})',
         values)
-    _connection.commit()
 
 
 def add_new_user(user_id: int, date: datetime, deep_link: Optional[str]) -> None:
-    if deep_link is not None and _is_valid_deep_link(deep_link):
-        user_role = _update_deep_link(user_id, date, deep_link)
-    else:
-        user_role = 'user'
-    role_id = get_role_id(user_role)
+    user_role = None
+    if deep_link is not None:
+        user_role = _redeem_deep_link(user_id, date, deep_link)
+    role_id = get_role_id(user_role or 'user')
     joined = _get_formatted_date(date)
     insert_user([(user_id, role_id, joined), ])
 
 
 def create_deep_link(user_id: int, role: str = 'test_creator') -> str:
-    deep_link = str(uuid.uuid4())
-    _register_deep_link(user_id, deep_link, role)
-    return f'https://t.me/{BOT_NAME}?start={deep_link}'
+    return create_deep_links(user_id, 1, role)[0]
 
 
-def delete_questions(question_ids: List[int]) -> None:
-    question_ids = ', '.join(str(i) for i in question_ids)
-    _cursor.execute(
-        f'DELETE FROM questions '
-        f'WHERE id IN ({question_ids})'
+def create_deep_links(
+        user_id: int,
+        number: int,
+        role: str = 'test_creator',
+        ttl: float = DEEP_LINK_TTL
+) -> List[str]:
+    """Creates number deep links valid for ttl seconds in one transaction."""
+    expires = time.time() + ttl
+    deep_links = [str(uuid.uuid4()) for _ in range(number)]
+    _executemany(
+        queries.INSERT_DEEP_LINK,
+        [(deep_link, user_id, role, expires) for deep_link in deep_links]
     )
-    _connection.commit()
+    _get_connection().commit()
+    return [f'https://t.me/{BOT_NAME}?start={i}' for i in deep_links]
+
+
+def delete_questions(question_ids: List[int]) -> None:
+    _delete_questions(question_ids)
+    _get_connection().commit()
+
+
+def delete_user_questions(user_id: int, questions: List[str]) -> Dict[str, bool]:
+    """
+    Deletes the user's questions (normalized text) in one transaction.
+    Returns {question: True if deleted, False if not found}.
+    """
+    user_questions = _get_user_questions(user_id, questions)
+    if user_questions:
+        _delete_questions([i[0] for i in user_questions.values()])
+    _get_connection().commit()
+    return {question: question in user_questions for question in questions}
+
+
+def _delete_questions(question_ids: List[int]) -> None:
+    question_ids = (json.dumps(list(question_ids)),)
+    rows = _execute(queries.QUESTIONS_CATALOG_KEYS, question_ids).fetchall()
+    _update_catalog({tuple(i[:3]): -i[3] for i in rows})
+    _execute(queries.DELETE_QUESTIONS, question_ids)
+    _execute(queries.DELETE_REVIEWS, question_ids)
+    _execute(queries.DELETE_QUESTION_STATS, question_ids)
 
 
 def execute_script(script: str) -> None:
-    _cursor.executescript(script)
-    _connection.commit()
+    _get_cursor().executescript(script)
+    _get_connection().commit()
 
 
 def generate_answer_values(
         user_id: int,
         language_test: LanguageTest
 ) -> List[Tuple]:
+    date = _get_formatted_date(datetime.now())
     values = [
         (
             user_id,
             language_test.questions[index].question_id,
             language_test.questions[index].get_answer_index(answer),
-            _get_formatted_date(datetime.now())
+            date
         )
         for index, answer in enumerate(language_test.user_answers)
     ]
     return values
 
 
-def _generate_language_test(
-        language_id: int,
-        test_type_id: int,
-        number_answers: int,
-        limit: int,
-        question_ids: List[Union[int, str]],
-        eq: bool
-) -> List[Tuple]:
-    question_ids = ', '.join(str(i) for i in question_ids)
-    operator = 'IN' if eq else 'NOT IN'
-    _cursor.execute(
-        f'SELECT '
-        f'    id, '
-        f'    question, '
-        f'    answers, '
-        f'    right_answer '
-        f'FROM '
-        f'    questions '
-        f'WHERE '
-        f'    language_id = {language_id} '
-        f'    AND test_type_id = {test_type_id} '
-        f'    AND number_answers = {number_answers} '
-        f'    AND id {operator} ({question_ids})'
-        f'ORDER BY RANDOM() '
-        f'LIMIT {limit}'
-    )
-    return [i for i in _cursor.fetchall()]
-
-
 def generate_questions_values(
         user_id: int,
         language_id: int,
@@ -138,50 +225,47 @@ def generate_questions_values(
 
 
 def get_admin_ids() -> List[int]:
-    _cursor.execute(
-        'SELECT id '
-        'FROM users '
-        'WHERE role_id = (SELECT id FROM roles WHERE role = "admin")'
-    )
-    return [int(i[0]) for i in _cursor.fetchall()]
+    rows = _execute(queries.ADMIN_IDS, ('admin',)).fetchall()
+    return [int(i[0]) for i in rows]
 
 
 def get_all_languages(key: Optional[str] = None) -> List[Tuple]:
     key = key or 'id, code, name'
-    _cursor.execute(
-        f'SELECT {key} '
-        f'FROM languages'
-    )
-    return _cursor.fetchall()
+    return _execute(queries.ALL_LANGUAGES[key]).fetchall()
+
+
+def _get_user_questions(
+        user_id: int, questions: List[str]
+) -> Dict[str, Tuple[int, int, int, int, str]]:
+    """
+    Matches normalized questions texts with the user's questions through
+    the unique index on questions.question.
+    Returns {question: (id, language_id, test_type_id, number_answers, answers)}.
+    """
+    rows = _execute(
+        queries.MATCH_USER_QUESTIONS, (json.dumps(questions), user_id)
+    ).fetchall()
+    return {i[0]: tuple(i[1:]) for i in rows}
 
 
 def get_all_questions(user_id: int) -> Dict[str, int]:
-    condition = f'WHERE user_id = {user_id}' if user_id > 0 else ''
-    _cursor.execute(
-        f'SELECT question, id '
-        f'FROM questions '
-        f'{condition}'
-    )
-    return {i[0]: i[1] for i in _cursor.fetchall()}
+    if user_id > 0:
+        cursor = _execute(queries.USER_QUESTIONS, (user_id,))
+    else:
+        cursor = _execute(queries.ALL_QUESTIONS)
+    return {i[0]: i[1] for i in cursor.fetchall()}
 
 
 def get_all_test_types(ids: bool = False) -> List[Union[int, Tuple]]:
-    _cursor.execute(
-        'SELECT id, type '
-        'FROM test_types'
-    )
+    rows = _execute(queries.ALL_TEST_TYPES).fetchall()
     if ids:
-        return [i[0] for i in _cursor.fetchall()]
-    return _cursor.fetchall()
+        return [i[0] for i in rows]
+    return rows
 
 
 def get_current_languages() -> List[str]:
-    _cursor.execute(
-        f'SELECT name '
-        f'FROM languages '
-        f'WHERE id IN (SELECT DISTINCT language_id FROM questions)'
-    )
-    current_languages = [i[0] for i in _cursor.fetchall()]
+    rows = _execute(queries.CURRENT_LANGUAGES['name']).fetchall()
+    current_languages = [i[0] for i in rows]
     return sorted(current_languages)
 
 
@@ -189,6 +273,10 @@ def _get_formatted_date(date: datetime) -> str:
     return date.strftime("%Y-%m-%d %H:%M:%S")
 
 
+def _get_timestamp(date: str) -> float:
+    return datetime.strptime(date, "%Y-%m-%d %H:%M:%S").timestamp()
+
+
 def get_formatted_languages_list() -> str:
     all_languages = get_all_languages()
     return '\n'.join(f'{code} - {name}' for _, code, name in all_languages)
@@ -201,12 +289,7 @@ def get_formatted_test_types_list() -> str:
 
 def get_language_id(language: str, key: str = 'name') -> int:
     language = language.capitalize() if key == 'name' else language.upper()
-    _cursor.execute(
-        f'SELECT id '
-        f'FROM languages '
-        f'WHERE {key} = "{language}"'
-    )
-    return int(_cursor.fetchone()[0])
+    return int(_execute(queries.LANGUAGE_ID[key], (language,)).fetchone()[0])
 
 
 def get_language_test(
@@ -214,189 +297,566 @@ def get_language_test(
         language_id: int,
         test_type_id: int,
         number_answers: int,
-        limit: int
+        limit: int,
+        now: Optional[float] = None
 ) -> List[Tuple]:
-    last_right_questions = _get_user_answers(
-        user_id, language_id, test_type_id, number_answers, True
-    )
-    questions = _generate_language_test(
-        language_id, test_type_id, number_answers, limit, last_right_questions, False
-    )
-    if not questions or len(questions) < limit:
-        limit = limit - len(questions)
-        _questions = _generate_language_test(
-            language_id, test_type_id, number_answers, limit, last_right_questions, True
+    """
+    Returns up to limit questions: the most overdue reviews first, then
+    questions the user has never answered, then the reviews due next.
+    """
+    now = time.time() if now is None else now
+    test_key = (user_id, language_id, test_type_id, number_answers)
+    questions = _get_review_questions(*test_key, now, limit, True)
+    if len(questions) < limit:
+        questions.extend(
+            _get_new_questions(*test_key, limit - len(questions))
+        )
+    if len(questions) < limit:
+        questions.extend(
+            _get_review_questions(*test_key, now, limit - len(questions), False)
         )
-        questions.extend(_questions)
     return questions
 
 
+def _get_new_questions(
+        user_id: int,
+        language_id: int,
+        test_type_id: int,
+        number_answers: int,
+        limit: int
+) -> List[Tuple]:
+    return _execute(
+        queries.NEW_QUESTIONS,
+        (language_id, test_type_id, number_answers, user_id, limit)
+    ).fetchall()
+
+
+def _get_review_questions(
+        user_id: int,
+        language_id: int,
+        test_type_id: int,
+        number_answers: int,
+        now: float,
+        limit: int,
+        due: bool
+) -> List[Tuple]:
+    """Returns questions due (or not yet due) for review, most due first."""
+    return _execute(
+        queries.REVIEW_QUESTIONS[due],
+        (user_id, language_id, test_type_id, number_answers, now, limit)
+    ).fetchall()
+
+
 def get_number_languages() -> int:
-    _cursor.execute('SELECT count(*) '
-                    'FROM languages')
-    return int(_cursor.fetchone()[0])
+    return int(_execute(queries.NUMBER_ROWS['languages']).fetchone()[0])
+
+
+def get_db_version() -> int:
+    return int(_execute(queries.DB_VERSION).fetchone()[0])
+
+
+def set_db_version(version: int) -> None:
+    # pragmas can't take bound parameters
+    _execute(f'{queries.DB_VERSION} = {int(version)}')
+    _get_connection().commit()
 
 
 def get_number_tables() -> int:
-    _cursor.execute('SELECT count(*) '
-                    'FROM sqlite_master '
-                    'WHERE type = "table"')
-    return int(_cursor.fetchone()[0])
+    return int(_execute(queries.NUMBER_TABLES).fetchone()[0])
+
+
+def get_table_names() -> List[str]:
+    return [row[0] for row in _execute(queries.TABLE_NAMES).fetchall()]
+
+
+def get_number_rows(table: str) -> int:
+    # identifiers can't be bound parameters, table comes from sqlite_master
+    return int(_execute(f'SELECT count(*) FROM "{table}"').fetchone()[0])
+
+
+def get_analyzed_rows() -> Dict[str, int]:
+    """Returns {table: number of rows} as of the last ANALYZE."""
+    if not _execute(queries.HAS_STAT_TABLE).fetchone()[0]:
+        return {}
+    return dict(_execute(queries.ANALYZED_ROWS).fetchall())
+
+
+def analyze_table(table: str) -> None:
+    _execute(f'ANALYZE "{table}"')
+    _get_connection().commit()
+
+
+def optimize_db() -> None:
+    _execute(queries.OPTIMIZE).fetchall()
+    _get_connection().commit()
+
+
+def get_page_stats() -> Tuple[int, int, int]:
+    """Returns (page_size, page_count, freelist_count)."""
+    return tuple(
+        int(_execute(sql).fetchone()[0])
+        for sql in (queries.PAGE_SIZE, queries.PAGE_COUNT, queries.FREELIST_COUNT)
+    )
+
+
+def get_auto_vacuum() -> int:
+    """Returns 0 (none), 1 (full) or 2 (incremental)."""
+    return int(_execute(queries.AUTO_VACUUM).fetchone()[0])
+
+
+def enable_incremental_vacuum() -> None:
+    """
+    Switches the db to incremental auto_vacuum. The VACUUM rewrites the whole
+    file and locks the db while it runs.
+    """
+    _execute('PRAGMA auto_vacuum = INCREMENTAL')
+    _execute('VACUUM')
+
+
+def incremental_vacuum(pages: int) -> None:
+    _execute(f'PRAGMA incremental_vacuum({int(pages)})').fetchall()
+    _get_connection().commit()
+
+
+def check_integrity(table: str, max_errors: int = 10) -> List[str]:
+    """Returns the problems found in the table and its indexes."""
+    rows = _execute(f'PRAGMA integrity_check("{table}")').fetchall()
+    return [row[0] for row in rows if row[0] != 'ok'][:max_errors]
 
 
 def get_number_questions() -> int:
-    _cursor.execute('SELECT count(*) '
-                    'FROM questions')
-    return int(_cursor.fetchone()[0])
+    return int(_execute(queries.NUMBER_ROWS['questions']).fetchone()[0])
 
 
 def get_number_roles() -> int:
-    _cursor.execute('SELECT count(*) '
-                    'FROM roles')
-    return int(_cursor.fetchone()[0])
+    return int(_execute(queries.NUMBER_ROWS['roles']).fetchone()[0])
 
 
 def get_number_test_types() -> int:
-    _cursor.execute('SELECT count(*) '
-                    'FROM test_types')
-    return int(_cursor.fetchone()[0])
+    return int(_execute(queries.NUMBER_ROWS['test_types']).fetchone()[0])
 
 
 def get_role_id(role: str) -> int:
-    _cursor.execute(
-        f'SELECT id '
-        f'FROM roles '
-        f'WHERE role = "{role}"'
-    )
-    return int(_cursor.fetchone()[0])
+    return int(_execute(queries.ROLE_ID, (role,)).fetchone()[0])
 
 
 def get_test_type_id(test_type: str) -> int:
-    _cursor.execute(
-        f'SELECT id '
-        f'FROM test_types '
-        f'WHERE type = "{test_type}"'
-    )
-    return int(_cursor.fetchone()[0])
+    return int(_execute(queries.TEST_TYPE_ID, (test_type,)).fetchone()[0])
 
 
 def get_test_types(language: Union[int, str]) -> List[str]:
     if isinstance(language, str):
         language = get_language_id(language)
-    _cursor.execute(
-        f'SELECT type '
-        f'FROM test_types '
-        f'WHERE id IN (SELECT DISTINCT test_type_id '
-        f'             FROM questions '
-        f'             WHERE language_id = {language})'
-    )
-    return [i[0] for i in _cursor.fetchall()]
-
-
-def _get_user_answers(
-        user_id: int,
-        language_id: int,
-        test_type_id: int,
-        number_answers: int,
-        eq: bool
-) -> List[int]:
-    operator = '=' if eq else '!='
-    _cursor.execute(
-        f'SELECT'
-        f'    q.id '
-        f'FROM '
-        f'    questions q, '
-        f'    (SELECT '
-        f'        tr.question_id, '
-        f'        tr.answer '
-        f'    FROM '
-        f'        test_results tr '
-        f'    WHERE '
-        f'        user_id = {user_id} '
-        f'        AND tr.date = (SELECT MAX(date) '
-        f'                       FROM test_results '
-        f'                       WHERE question_id = tr.question_id) '
-        f'    ) ltr '
-        f'WHERE '
-        f'    q.id = ltr.question_id '
-        f'    AND q.language_id = {language_id} '
-        f'    AND q.test_type_id = {test_type_id} '
-        f'    AND q.number_answers = {number_answers} '
-        f'    AND q.right_answer {operator} ltr.answer'
-    )
-    return [int(i[0]) for i in _cursor.fetchall()]
+    return [i[0] for i in _execute(queries.TEST_TYPES, (language,)).fetchall()]
 
 
 def get_user_role(user_id: int, key: str = 'role') -> Union[int, str]:
-    if key == 'role':
-        sql = (f'SELECT role '
-               f'FROM roles '
-               f'WHERE id = (SELECT role_id '
-               f'            FROM users '
-               f'            WHERE id = {user_id})')
-    else:
-        sql = (f'SELECT role_id '
-               f'FROM users '
-               f'WHERE id = {user_id}')
-    _cursor.execute(sql)
-    return _cursor.fetchone()[0]
+    sql = queries.USER_ROLE['role' if key == 'role' else 'role_id']
+    return _execute(sql, (user_id,)).fetchone()[0]
 
 
 def insert_questions(values: List[Tuple]) -> None:
-    table = 'questions'
-    columns = ('user_id', 'language_id', 'test_type_id', 'question',
-               'answers', 'number_answers', 'right_answer')
-    insert(table, columns, values)
+    _executemany(queries.INSERT_QUESTIONS, values)
+    _update_catalog(
+        collections.Counter((i[1], i[2], i[5]) for i in values)
+    )
+    _get_connection().commit()
+
+
+def update_questions(user_id: int, values: List[Tuple]) -> Dict[str, bool]:
+    """
+    Updates the user's questions in place in one transaction, so question
+    ids, test results and reviews are kept. values are generated by
+    generate_questions_values. Returns {question: True if updated,
+    False if not found}.
+    """
+    # a question repeated in the file is updated once, the last line wins,
+    # as the repeated UPDATE would do
+    values = list({i[3]: i for i in values}.values())
+    user_questions = _get_user_questions(user_id, [i[3] for i in values])
+    catalog_changes = collections.Counter()
+    updated_values, reset_stats_ids = [], []
+    for (_, language_id, test_type_id, question, answers, number_answers,
+         right_answer) in values:
+        if question not in user_questions:
+            continue
+        question_id, *old_key, old_answers = user_questions[question]
+        catalog_changes[tuple(old_key)] -= 1
+        catalog_changes[(language_id, test_type_id, number_answers)] += 1
+        if answers != old_answers:
+            reset_stats_ids.append(question_id)
+        updated_values.append(
+            (language_id, test_type_id, answers, number_answers, right_answer,
+             question_id)
+        )
+    _executemany(queries.UPDATE_QUESTION, updated_values)
+    _executemany(
+        queries.UPDATE_REVIEWS_TEST_KEY,
+        [(*i[:2], i[3], i[5]) for i in updated_values]
+    )
+    # the answers distribution is meaningless for changed answers
+    _execute(queries.DELETE_QUESTION_STATS, (json.dumps(reset_stats_ids),))
+    _update_catalog(catalog_changes)
+    _get_connection().commit()
+    return {i[3]: i[3] in user_questions for i in values}
+
+
+def _update_catalog(changes: Dict[Tuple[int, int, int], int]) -> None:
+    """
+    Adds changes {(language_id, test_type_id, number_answers): delta} to
+    the number of questions in the catalog.
+    """
+    _executemany(
+        queries.UPDATE_CATALOG,
+        [(*key, delta) for key, delta in changes.items() if delta]
+    )
+    _execute(queries.DELETE_EMPTY_CATALOG)
+
+
+def get_catalog() -> Dict[Tuple[int, int, int], int]:
+    """Returns {(language_id, test_type_id, number_answers): number_questions}."""
+    return {tuple(i[:3]): i[3] for i in _execute(queries.CATALOG).fetchall()}
 
 
 def insert_user(values: List[Tuple]) -> None:
-    table = 'users'
-    columns = ('id', 'role_id', 'joined')
-    insert(table, columns, values)
+    _executemany(queries.INSERT_USERS, values)
+    _get_connection().commit()
 
 
 def insert_user_answers(values: List[Tuple]) -> None:
-    table = 'test_results'
-    columns = ('user_id', 'question_id', 'answer', 'date')
-    insert(table, columns, values)
+    """
+    Inserts answers of one finished test as one attempt per user and
+    updates reviews and user_stats in the same transaction.
+    """
+    _executemany(queries.INSERT_ATTEMPTS, _pack_attempts(values))
+    questions = _get_questions_info({value[1] for value in values})
+    _update_reviews(values, questions)
+    _update_user_stats(values, questions)
+    _update_question_stats(values, questions)
+    _get_connection().commit()
+
+
+def _pack_attempts(values: List[Tuple]) -> List[Tuple]:
+    """
+    Packs (user_id, question_id, answer, date) values into
+    (user_id, taken, question_ids, answers) rows, one per user.
+    """
+    attempts: Dict[int, Tuple[List[int], List[int], List[str]]] = {}
+    for user_id, question_id, answer, date in values:
+        question_ids, answers, dates = attempts.setdefault(user_id, ([], [], []))
+        question_ids.append(question_id)
+        answers.append(answer)
+        dates.append(date)
+    return [
+        (user_id, int(_get_timestamp(max(dates))),
+         json.dumps(question_ids), json.dumps(answers))
+        for user_id, (question_ids, answers, dates) in attempts.items()
+    ]
 
 
-def is_new_user(user_id: int) -> bool:
-    _cursor.execute(
-        f'SELECT count(*) '
-        f'FROM users '
-        f'WHERE id = {user_id}'
+def _get_questions_info(
+        question_ids: Optional[Sequence[int]] = None
+) -> Dict[int, Tuple[Tuple[int, int, int], int]]:
+    """
+    Returns {question_id: ((language_id, test_type_id, number_answers),
+    right_answer)} for the given (or all) questions.
+    """
+    if question_ids is None:
+        cursor = _execute(queries.QUESTIONS_INFO)
+    else:
+        cursor = _execute(
+            queries.QUESTIONS_INFO_BY_IDS, (json.dumps(list(question_ids)),)
+        )
+    return {row[0]: (tuple(row[1:4]), row[4]) for row in cursor.fetchall()}
+
+
+def _update_reviews(
+        values: List[Tuple],
+        questions: Dict[int, Tuple[Tuple[int, int, int], int]]
+) -> None:
+    """Updates spaced repetition state by (user_id, question_id, answer, date)."""
+    reviews: Dict[Tuple[int, int], Optional[Review]] = {}
+    for user_id, question_id, answer, date in values:
+        if question_id not in questions:  # the question has been deleted
+            continue
+        key = (user_id, question_id)
+        if key not in reviews:
+            reviews[key] = _get_review(user_id, question_id)
+        right_answer = questions[question_id][1]
+        reviews[key] = get_next_review(
+            reviews[key], right_answer == answer, _get_timestamp(date)
+        )
+    _executemany(
+        queries.SAVE_REVIEW,
+        [
+            (user_id, question_id, *questions[question_id][0], *review)
+            for (user_id, question_id), review in reviews.items()
+        ]
     )
-    return not bool(_cursor.fetchone()[0])
 
 
-def is_supported_language(language: str, key: str = 'name') -> bool:
-    _cursor.execute(
-        f'SELECT {key} '
-        f'FROM languages '
-        f'WHERE id in (SELECT DISTINCT language_id FROM questions)'
+def _get_review(user_id: int, question_id: int) -> Optional[Review]:
+    row = _execute(queries.REVIEW, (user_id, question_id)).fetchone()
+    return Review(*row) if row is not None else None
+
+
+def _update_user_stats(
+        values: List[Tuple],
+        questions: Dict[int, Tuple[Tuple[int, int, int], int]]
+) -> None:
+    """
+    Counts values (answers of one test) as one attempt per
+    (user, language, test type). Streaks are runs of right answers.
+    """
+    attempts: Dict[Tuple[int, int, int], List] = {}
+    for user_id, question_id, answer, date in values:
+        if question_id not in questions:
+            continue
+        (language_id, test_type_id, _), right_answer = questions[question_id]
+        attempt = attempts.setdefault((user_id, language_id, test_type_id), [[], 0])
+        attempt[0].append(right_answer == answer)
+        attempt[1] = max(attempt[1], int(_get_timestamp(date)))
+    stats = []
+    for key, (results, last_taken) in attempts.items():
+        _attempts, answers, right_answers, streak, best_streak, _last_taken = (
+            _get_user_stats(*key) or (0, 0, 0, 0, 0, 0)
+        )
+        for result in results:
+            streak = streak + 1 if result else 0
+            best_streak = max(best_streak, streak)
+        stats.append((
+            *key,
+            _attempts + 1,
+            answers + len(results),
+            right_answers + sum(results),
+            streak,
+            best_streak,
+            max(last_taken, _last_taken),
+        ))
+    _executemany(queries.SAVE_USER_STATS, stats)
+
+
+def _get_user_stats(
+        user_id: int, language_id: int, test_type_id: int
+) -> Optional[Tuple[int, ...]]:
+    return _execute(
+        queries.USER_STATS_ROW, (user_id, language_id, test_type_id)
+    ).fetchone()
+
+
+def get_user_stats(user_id: int) -> List[Tuple]:
+    """
+    Returns (language, test_type, attempts, answers, right_answers,
+    current_streak, best_streak, last_taken) rows of the user.
+    """
+    return _execute(queries.USER_STATS, (user_id,)).fetchall()
+
+
+def get_formatted_user_stats(user_id: int) -> str:
+    user_stats = get_user_stats(user_id)
+    if not user_stats:
+        return ('Вы ещё не прошли ни одного теста.\n'
+                'Для того, чтобы начать тест, введите /begin_test.')
+    fmt_stats = []
+    for (language, test_type, attempts, answers, right_answers, streak,
+         best_streak, last_taken) in user_stats:
+        fmt_last_taken = _get_formatted_date(datetime.fromtimestamp(last_taken))
+        fmt_stats.append(
+            f'{language} - {test_type}\n'
+            f'Пройдено тестов: {attempts}\n'
+            f'Правильных ответов: {right_answers} из {answers} '
+            f'({right_answers / answers * 100:.0f} %)\n'
+            f'Правильных ответов подряд: {streak} (лучший результат - '
+            f'{best_streak})\n'
+            f'Последний тест: {fmt_last_taken}'
+        )
+    all_fmt_stats = '\n\n'.join(fmt_stats)
+    return f'Ваша статистика:\n\n{all_fmt_stats}'
+
+
+def _update_question_stats(
+        values: List[Tuple],
+        questions: Dict[int, Tuple[Tuple[int, int, int], int]]
+) -> None:
+    """
+    Updates the answers distribution (attempts per answer index) and the
+    right answers rate of the answered questions.
+    """
+    question_stats: Dict[int, List] = {}
+    for _, question_id, answer, _ in values:
+        if question_id not in questions:
+            continue
+        if question_id not in question_stats:
+            question_stats[question_id] = _get_question_stats(question_id)
+        (_, _, number_answers), right_answer = questions[question_id]
+        stats = question_stats[question_id]
+        stats[1] += 1
+        stats[2] += int(right_answer == answer)
+        if 0 <= answer < number_answers:
+            stats[3][answer] += 1
+    _executemany(
+        queries.SAVE_QUESTION_STATS,
+        [
+            (question_id, user_id, attempts, right_answers,
+             right_answers / attempts, json.dumps(answers))
+            for question_id, (user_id, attempts, right_answers, answers)
+            in question_stats.items()
+        ]
+    )
+
+
+def _get_question_stats(question_id: int) -> List:
+    """Returns [creator_id, attempts, right_answers, answers distribution]."""
+    user_id, number_answers, attempts, right_answers, answers = _execute(
+        queries.QUESTION_STATS, (question_id,)
+    ).fetchone()
+    if attempts is None:
+        return [user_id, 0, 0, [0] * number_answers]
+    return [user_id, attempts, right_answers, json.loads(answers)]
+
+
+def get_worst_questions(
+        user_id: int, limit: int = 10, min_attempts: int = 5
+) -> List[Tuple]:
+    """
+    Returns (question, answers, right_answer, attempts, right_answers,
+    answers distribution) of the user's questions with the lowest right
+    answers rate.
+    """
+    rows = _execute(
+        queries.WORST_QUESTIONS, (user_id, min_attempts, limit)
+    ).fetchall()
+    return [(*row[:5], json.loads(row[5])) for row in rows]
+
+
+def get_formatted_worst_questions(
+        user_id: int, limit: int = 10, min_attempts: int = 5
+) -> str:
+    worst_questions = get_worst_questions(user_id, limit, min_attempts)
+    if not worst_questions:
+        return 'На ваши вопросы пока недостаточно ответов.'
+    fmt_questions = []
+    for index, (question, answers, right_answer, attempts, right_answers,
+                distribution) in enumerate(worst_questions, start=1):
+        fmt_answers = '\n'.join(
+            f'    {answer} - {number}{" (верный)" if i == right_answer else ""}'
+            for i, (answer, number) in enumerate(zip(answers.split('\n'),
+                                                     distribution))
+        )
+        fmt_questions.append(
+            f'{index}. {question}\n'
+            f'Верных ответов: {right_answers / attempts * 100:.0f} % '
+            f'из {attempts}\n'
+            f'{fmt_answers}'
+        )
+    all_fmt_questions = '\n\n'.join(fmt_questions)
+    return (f'Вопросы с наименьшим процентом верных ответов:\n\n'
+            f'{all_fmt_questions}')
+
+
+def _get_attempts(archived: Sequence[Tuple] = ()) -> List[List[Tuple]]:
+    """
+    Returns attempts unpacked into (user_id, question_id, answer, date)
+    values. archived are (id, user_id, taken, question_ids, answers) rows of
+    core.retention.get_archived_attempts(), replayed with the db ones.
+    """
+    # a row archived but not deleted before a crash is in both, (id,
+    # user_id, taken) as an id may be reused by dbs migrated without
+    # AUTOINCREMENT
+    rows = {tuple(row[:3]): tuple(row) for row in archived}
+    rows.update(
+        (row[:3], row) for row in _execute(queries.ALL_ATTEMPTS).fetchall()
     )
-    languages = {i[0].upper() for i in _cursor.fetchall()}
+    attempts = []
+    for _, user_id, taken, question_ids, answers in sorted(
+            rows.values(), key=lambda row: (row[1], row[2], row[0])):
+        date = _get_formatted_date(datetime.fromtimestamp(taken))
+        attempts.append([
+            (user_id, question_id, answer, date)
+            for question_id, answer in zip(json.loads(question_ids), json.loads(answers))
+        ])
+    return attempts
+
+
+def _get_all_user_answers(archived: Sequence[Tuple] = ()) -> List[Tuple]:
+    return [value for attempt in _get_attempts(archived) for value in attempt]
+
+
+def get_old_attempts(taken: int, limit: int) -> List[Tuple]:
+    """
+    Returns (id, user_id, taken, question_ids, answers) of the first limit
+    attempts taken before the timestamp.
+    """
+    return _execute(queries.OLD_ATTEMPTS, (taken, limit)).fetchall()
+
+
+def delete_attempts(attempt_ids: List[int]) -> None:
+    _execute(queries.DELETE_ATTEMPTS, (json.dumps(attempt_ids),))
+    _get_connection().commit()
+
+
+def rebuild_reviews(archived: Sequence[Tuple] = ()) -> None:
+    """
+    Replays attempts to fill reviews (used by db migrations). Pass the
+    archived attempts, otherwise their answers are lost.
+    """
+    _execute(queries.DELETE_ALL_REVIEWS)
+    _update_reviews(_get_all_user_answers(archived), _get_questions_info())
+    _get_connection().commit()
+
+
+def rebuild_question_stats(archived: Sequence[Tuple] = ()) -> None:
+    """
+    Replays attempts to fill question_stats (used by db migrations). Pass
+    the archived attempts, otherwise their answers are lost.
+    """
+    _execute(queries.DELETE_ALL_QUESTION_STATS)
+    _update_question_stats(_get_all_user_answers(archived), _get_questions_info())
+    _get_connection().commit()
+
+
+def rebuild_user_stats(archived: Sequence[Tuple] = ()) -> None:
+    """
+    Replays attempts to fill user_stats (used by db migrations). Pass the
+    archived attempts, otherwise their answers are lost.
+    """
+    _execute(queries.DELETE_ALL_USER_STATS)
+    questions = _get_questions_info()
+    for attempt in _get_attempts(archived):
+        _update_user_stats(attempt, questions)
+    _get_connection().commit()
+
+
+def save_processed_updates(values: List[Tuple]) -> None:
+    """values: [(slot, position, update_id, user_id, message_id), ...]"""
+    _executemany(queries.SAVE_PROCESSED_UPDATES, values)
+    _get_connection().commit()
+
+
+def get_processed_updates(number: int) -> List[Tuple]:
+    """Returns the last number (position, update_id, user_id, message_id)."""
+    return _execute(queries.PROCESSED_UPDATES, (number,)).fetchall()
+
+
+def is_new_user(user_id: int) -> bool:
+    return not bool(_execute(queries.IS_NEW_USER, (user_id,)).fetchone()[0])
+
+
+def is_supported_language(language: str, key: str = 'name') -> bool:
+    rows = _execute(queries.CURRENT_LANGUAGES[key]).fetchall()
+    languages = {i[0].upper() for i in rows}
     return language.upper().strip() in languages
 
 
 def is_supported_test_type(test_type: str) -> bool:
-    _cursor.execute(
-        'SELECT type '
-        'FROM test_types'
-    )
-    test_types = {i[0] for i in _cursor.fetchall()}
+    test_types = {i[1] for i in _execute(queries.ALL_TEST_TYPES).fetchall()}
     return test_type.capitalize().strip() in test_types
 
 
 def _is_valid_deep_link(deep_link: str) -> bool:
-    _cursor.execute(
-        f'SELECT count(*) '
-        f'FROM deep_links '
-        f'WHERE link = "{deep_link}" '
-        f'AND user_id is NULL'
+    return bool(
+        _execute(queries.IS_VALID_DEEP_LINK, (deep_link, time.time())).fetchone()[0]
     )
-    return bool(_cursor.fetchone()[0])
 
 
 def normalize_question(question: str) -> str:
@@ -407,38 +867,32 @@ def normalize_question(question: str) -> str:
     return question.strip()
 
 
-def _register_deep_link(user_id: int, deep_link: str, role: str) -> None:
-    table = 'deep_links'
-    columns = ('link', 'creator_id', 'role',)
-    values = [(deep_link, user_id, role)]
-    insert(table, columns, values)
+def _register_deep_link(
+        user_id: int, deep_link: str, role: str, expires: Optional[float] = None
+) -> None:
+    _execute(queries.INSERT_DEEP_LINK, (deep_link, user_id, role, expires))
+    _get_connection().commit()
 
 
-def _update_deep_link(user_id: int, date: datetime, deep_link: str) -> str:
-    date = _get_formatted_date(date)
-    _cursor.execute(
-        f'UPDATE deep_links '
-        f'SET user_id = {user_id}, '
-        f'    joined = "{date}" '
-        f'WHERE link = "{deep_link}"'
+def _redeem_deep_link(user_id: int, date: datetime, deep_link: str) -> Optional[str]:
+    """
+    Marks the deep link as used by the user and returns its role, None if
+    the link is unknown, expired or already used. The check and the update
+    are one statement, so a link can't be redeemed twice. Leaves the
+    transaction open.
+    """
+    cursor = _execute(
+        queries.REDEEM_DEEP_LINK,
+        (user_id, _get_formatted_date(date), deep_link, time.time())
     )
-    _cursor.execute(
-        f'SELECT role '
-        f'FROM deep_links '
-        f'WHERE link = "{deep_link}"'
-    )
-    return _cursor.fetchone()[0]
+    if cursor.rowcount != 1:
+        return None
+    return _execute(queries.DEEP_LINK_ROLE, (deep_link,)).fetchone()[0]
 
 
 def update_user_role(user_id: int, date: datetime, deep_link: str) -> None:
-    if _is_valid_deep_link(deep_link):
-        new_user_role = _update_deep_link(user_id, date, deep_link)
-        user_role = get_user_role(user_id)
-        if user_role != 'admin':
-            role_id = get_role_id(new_user_role)
-            _cursor.execute(
-                f'UPDATE users '
-                f'SET role_id = {role_id} '
-                f'WHERE id = {user_id}'
-            )
-            _connection.commit()
+    role = _redeem_deep_link(user_id, date, deep_link)
+    if role is not None:
+        # admins keep their role
+        _execute(queries.UPDATE_USER_ROLE, (role, user_id, 'admin'))
+    _get_connection().commit()
@@ -0,0 +1,84 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional, Set, Tuple
+
+from core.config import DEDUP_FLUSH_INTERVAL, DEDUP_WINDOW
+from core.db import get_processed_updates, save_processed_updates
+
+
+# (update_id, user_id, message_id)
+Key = Tuple[Optional[int], int, Optional[int]]
+
+
+class UpdateWindow:
+    """
+    Remembers the last size updates to skip the ones delivered twice,
+    e.g. after a polling retry. An update is a duplicate if its update_id
+    or its (user_id, message_id) has already been seen.
+
+    The window is a ring buffer of size slots plus hash sets for O(1)
+    lookups. New slots are written to the db every flush, so the window
+    survives restarts.
+    """
+
+    def __init__(self, size: int = DEDUP_WINDOW):
+        if size < 1:
+            raise ValueError('Размер окна д. б. больше 0')
+        self._size = size
+        self._slots: List[Optional[Key]] = [None] * size
+        self._position = 0
+        self._update_ids: Set[int] = set()
+        self._messages: Set[Tuple[int, int]] = set()
+        self._unsaved: Dict[int, Tuple] = {}
+        self.duplicates = 0
+
+    def __len__(self) -> int:
+        return min(self._position, self._size)
+
+    def is_duplicate(
+            self, update_id: Optional[int], user_id: int, message_id: Optional[int]
+    ) -> bool:
+        """Returns True if the update was seen, otherwise remembers it."""
+        if (update_id is not None and update_id in self._update_ids
+                or message_id is not None
+                and (user_id, message_id) in self._messages):
+            self.duplicates += 1
+            return True
+        self._add((update_id, user_id, message_id), self._position)
+        return False
+
+    def _add(self, key: Key, position: int) -> None:
+        slot = position % self._size
+        evicted = self._slots[slot]
+        if evicted is not None:
+            self._update_ids.discard(evicted[0])
+            self._messages.discard(evicted[1:])
+        update_id, user_id, message_id = key
+        if update_id is not None:
+            self._update_ids.add(update_id)
+        if message_id is not None:
+            self._messages.add((user_id, message_id))
+        self._slots[slot] = key
+        self._unsaved[slot] = (slot, position, *key)
+        self._position = position + 1
+
+    def load(self) -> None:
+        """Restores the window saved by flush."""
+        rows = get_processed_updates(self._size)
+        for position, *key in reversed(rows):
+            self._add(tuple(key), position)
+        self._unsaved.clear()
+
+    def flush(self) -> None:
+        if self._unsaved:
+            values = list(self._unsaved.values())
+            self._unsaved.clear()
+            save_processed_updates(values)
+
+    async def run_flush(self, interval: float = DEDUP_FLUSH_INTERVAL) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.flush()
+            except Exception:
+                logging.exception('Processed updates were not saved')
@@ -1,21 +1,35 @@
 import asyncio
 import io
+import logging
 import re
+import threading
+import time
 from datetime import datetime
-from typing import Dict, Optional, Tuple, Union
-
-from core.config import COMMANDS
+from types import MappingProxyType
+from typing import Dict, Mapping, Optional, Tuple, Union
+
+from core.config import (
+    COMMANDS,
+    MAX_DEEP_LINKS,
+    MAX_PROFILE_SECONDS,
+    MAX_PROFILE_UPDATES
+)
 from core.db import (
     add_new_user,
-    create_deep_link,
+    create_deep_links,
     get_formatted_languages_list,
     get_formatted_test_types_list,
+    get_formatted_user_stats,
+    get_formatted_worst_questions,
+    get_statement_cache_stats,
     get_user_role,
     is_new_user,
     update_user_role
 )
 from core.handlers import SessionHandler
-from core.types import Answer, CloseSession, Session
+from core.profiling import profiler
+from core.retention import archiver
+from core.types import Answer, CloseSession, get_session_size, Session
 
 
 class UnclosedSessionError(Exception):
@@ -23,11 +37,22 @@ class UnclosedSessionError(Exception):
 
 
 class SessionsDispatcher:
-    """User sessions dispatcher."""
+    """
+    User sessions dispatcher.
+
+    handle_* methods may be called from several threads (see
+    core.threads): the sessions of one user are guarded by a lock, the
+    handlers registry is replaced, never changed in place.
+    """
+
+    # number of session locks, users are mapped to locks by user id
+    number_locks = 64
 
     def __init__(self):
-        self._handlers = {}
-        self._sessions = {}
+        self._handlers: Mapping[str, SessionHandler] = MappingProxyType({})
+        self._handlers_ids: Mapping[int, SessionHandler] = MappingProxyType({})
+        self._sessions: Dict[int, Session] = {}
+        self._locks = tuple(threading.RLock() for _ in range(self.number_locks))
         self._default_answers: Dict[str, str] = {
             'invalid_message': (
                 'Для начала работы с ботом используйте одну из доступных команд'
@@ -38,19 +63,24 @@ class SessionsDispatcher:
     def handle_text_message(
             self, user_id: int, text: str, date: datetime
     ) -> Union[Answer, Tuple[Answer, Answer], Tuple[Answer, CloseSession]]:
-        if self._is_bot_command(text):
-            return self._handle_command(user_id, text, date)
-        else:
-            return self._handle_text(user_id, text)
+        with self.get_lock(user_id):
+            if self._is_bot_command(text):
+                return self._handle_command(user_id, text, date)
+            else:
+                return self._handle_text(user_id, text)
 
     def handle_document(
             self, user_id: int, document: io.BytesIO
     ) -> Union[Answer, Tuple[Answer, CloseSession]]:
-        if user_id in self._sessions:
-            handler_alias = self._sessions[user_id].handler_alias
-            handler = self._get_handler(handler_alias)
-            return handler.handle_session(self._sessions[user_id], message=document)
-        return Answer(text=self._get_default_answer('invalid_message'))
+        with self.get_lock(user_id):
+            session = self._sessions.get(user_id)
+            if session is not None:
+                handler = self._get_handler_by_id(session.handler_id)
+                return handler.handle_session(session, message=document)
+            return Answer(text=self._get_default_answer('invalid_message'))
+
+    def get_lock(self, user_id: int) -> threading.RLock:
+        return self._locks[user_id % self.number_locks]
 
     def _handle_command(
             self, user_id: int, text: str, date: datetime
@@ -61,26 +91,31 @@ class SessionsDispatcher:
             return self._handle_start_commands(user_id, command, date, deep_link)
 
         if command in COMMANDS['user_commands']:
-            return self._handle_user_commands(user_id, date)
+            return self._handle_user_commands(user_id)
+
+        if command in COMMANDS['stats_commands']:
+            return self._handle_stats_commands(user_id)
 
         if command in COMMANDS['test_creator_commands']:
-            return self._handle_language_test_creator_commands(user_id, command, date)
+            return self._handle_language_test_creator_commands(user_id, command)
 
         if command in COMMANDS['information_commands']:
             return self._handle_information_commands(user_id, command)
 
         if command in COMMANDS['admin_commands']:
-            return self._handle_admin_commands(user_id, command)
+            return self._handle_admin_commands(
+                user_id, command, self._get_number_argument(text)
+            )
 
         return Answer(text=self._get_default_answer('unsupported_command'))
 
     def _handle_text(
             self, user_id: int, text: str
     ) -> Union[Answer, Tuple[Answer, Answer], Tuple[Answer, CloseSession]]:
-        if user_id in self._sessions:
-            handler_alias = self._sessions[user_id].handler_alias
-            handler = self._get_handler(handler_alias)
-            return handler.handle_session(self._sessions[user_id], message=text)
+        session = self._sessions.get(user_id)
+        if session is not None:
+            handler = self._get_handler_by_id(session.handler_id)
+            return handler.handle_session(session, message=text)
         return Answer(text=self._get_default_answer('invalid_message'))
 
     def _handle_start_commands(
@@ -96,28 +131,29 @@ class SessionsDispatcher:
         role = get_user_role(user_id)
         return self._get_start_message(command, role)
 
-    def _handle_user_commands(
-            self, user_id: int, date: datetime
-    ) -> Answer:
+    def _handle_user_commands(self, user_id: int) -> Answer:
         handler_alias = 'user_session_handler'
         handler = self._get_handler(handler_alias)
         try:
-            session = self._create_session(user_id, date, handler)
+            session = self._create_session(user_id, handler)
         except UnclosedSessionError as e:
             return Answer(text=str(e))
         return handler.handle_session(session)
 
+    @staticmethod
+    def _handle_stats_commands(user_id: int) -> Answer:
+        return Answer(text=get_formatted_user_stats(user_id))
+
     def _handle_language_test_creator_commands(
-            self, user_id: int, command: str, date: datetime
+            self, user_id: int, command: str
     ) -> Union[Answer, Tuple[Answer, CloseSession]]:
         handler_alias = 'language_test_creator_session_handler'
         user_role = get_user_role(user_id)
         if user_role == 'user':
             return Answer(text=self._get_default_answer('unsupported_command'))
         handler = self._get_handler(handler_alias)
-        handler.alias = handler_alias
         try:
-            session = self._create_session(user_id, date, handler)
+            session = self._create_session(user_id, handler)
         except UnclosedSessionError as e:
             return Answer(text=str(e))
         return handler.handle_session(session, command)
@@ -129,14 +165,61 @@ class SessionsDispatcher:
             return Answer(text=get_formatted_languages_list())
         if command == 'test_types_list':
             return Answer(text=get_formatted_test_types_list())
+        if command == 'worst_questions':
+            return Answer(text=get_formatted_worst_questions(user_id))
 
-    def _handle_admin_commands(self, user_id: int, command: str) -> Answer:
+    def _handle_admin_commands(
+            self, user_id: int, command: str, number: Optional[int] = None
+    ) -> Answer:
         user_role = get_user_role(user_id)
         if user_role != 'admin':
             return Answer(text=self._get_default_answer('unsupported_command'))
+        if command == 'archive_attempts':
+            if not archiver.request(user_id):
+                return Answer(text='Архивация уже запущена.')
+            return Answer(
+                text='Архивация запущена, отчёт будет отправлен по окончании.'
+            )
+        if command in ('profile', 'profile_updates'):
+            return self._handle_profile_command(user_id, command, number)
         if command == 'create_deep_link':
-            deep_link = create_deep_link(user_id)
-            return Answer(text=f'Ссылка успешно создана.\n{deep_link}')
+            number = 1 if number is None else number
+            if not 0 < number <= MAX_DEEP_LINKS:
+                return Answer(
+                    text=f'Количество ссылок д. б. в диапазоне от 1 до '
+                         f'{MAX_DEEP_LINKS}'
+                )
+            deep_links = '\n'.join(create_deep_links(user_id, number))
+            if number == 1:
+                return Answer(text=f'Ссылка успешно создана.\n{deep_links}')
+            return Answer(text=f'Ссылки успешно созданы.\n{deep_links}')
+
+    @staticmethod
+    def _handle_profile_command(
+            user_id: int, command: str, number: Optional[int]
+    ) -> Answer:
+        if command == 'profile':
+            number = 30 if number is None else number
+            max_number, unit = MAX_PROFILE_SECONDS, 'с'
+        else:
+            number = 100 if number is None else number
+            max_number = MAX_PROFILE_UPDATES
+            unit = f'обновлений (не дольше {MAX_PROFILE_SECONDS} с)'
+        if not 0 < number <= max_number:
+            return Answer(text=f'N д. б. в диапазоне от 1 до {max_number}')
+        if command == 'profile':
+            requested = profiler.request(user_id, seconds=number)
+        else:
+            requested = profiler.request(user_id, updates=number)
+        if not requested:
+            return Answer(text='Профилирование уже запущено.')
+        return Answer(
+            text=f'Профилирование запущено на {number} {unit}, профиль '
+                 f'будет отправлен по окончании.\nПрофилируется только поток '
+                 f'цикла событий: обработка в потоках диспетчера '
+                 f'(BOT_DISPATCH_THREADS > 0) и загрузка файлов в профиль не '
+                 f'попадают.'
+        )
 
     def _get_default_answer(self, key: str) -> str:
         return self._default_answers[key]
@@ -148,15 +231,27 @@ class SessionsDispatcher:
             'С помощью этого бота вы сможете проверить ваши знания грамматики '
             'и лексики иностранного языка.\n\n'
         )
-        user_commands = 'Для того, чтобы начать тест, введите /begin_test.\n'
+        user_commands = (
+            'Для того, чтобы начать тест, введите /begin_test.\n'
+            'Для того, чтобы посмотреть вашу статистику, введите /stats.\n'
+        )
         test_creator_commands = (
             'Для того, чтобы получить список языков, введите /languages_list.\n'
             'Для того, чтобы получить список доступных типов тестов, введите '
             '/test_types_list.\nДля того, чтобы добавить вопросы, введите '
             '/add_questions, чтобы обновить  - /update_questions, чтобы удалить '
             '- /delete_questions.\n'
+            'Для того, чтобы получить список самых сложных ваших вопросов, '
+            'введите /worst_questions.\n'
+        )
+        admin_commands = (
+            'Для того, чтобы создать deeplink, введите /create_deep_link, '
+            'чтобы создать несколько - /create_deep_link N.\n'
+            'Для того, чтобы перенести старые попытки в архив, введите '
+            '/archive_attempts.\n'
+            'Для того, чтобы снять профиль, введите /profile N (секунд) или '
+            '/profile_updates N (обновлений).'
         )
-        admin_commands = 'Для того, чтобы создать deeplink, введите /create_deep_link.'
         if role == 'user':
             text = user_commands
         elif role == 'test_creator':
@@ -167,43 +262,85 @@ class SessionsDispatcher:
             text = f'{start_message}{text}'
         return Answer(text=text)
 
-    def _create_session(
-            self, user_id: int, date: datetime, handler: SessionHandler
-    ) -> Session:
+    def _create_session(self, user_id: int, handler: SessionHandler) -> Session:
         if user_id in self._sessions:
             raise UnclosedSessionError(
                 'Вы должны завершить предыдущую сессию.\n Введите команду '
                 '/reset, если хотите начать сначала.')
-        self._sessions[user_id] = handler.get_data_class(user_id, date)
+        self._sessions[user_id] = handler.get_data_class(user_id)
         return self._sessions[user_id]
 
+    def get_session(self, user_id: int) -> Optional[Session]:
+        return self._sessions.get(user_id)
+
+    def get_step_alias(self, user_id: int) -> Optional[str]:
+        """Returns 'handler.step' of the user's session, if any."""
+        session = self._sessions.get(user_id)
+        if session is None:
+            return None
+        handler = self._get_handler_by_id(session.handler_id)
+        return f'{handler.alias}.{handler.get_step_alias(session.current_step)}'
+
     def close_session(self, user_id: int) -> None:
-        self._sessions.pop(user_id, None)
+        with self.get_lock(user_id):
+            self._sessions.pop(user_id, None)
 
     async def close_old_sessions(self) -> None:
         time_limit = 1800  # 30 min
         while True:
             await asyncio.sleep(time_limit / 3)
-            current_time = self._get_now_datetime()
+            current_time = time.monotonic()
 
             close_list = set()
-            for chat_id, session in self._sessions.items():
-                if (current_time - session.created).total_seconds() > time_limit:
+            for chat_id, session in list(self._sessions.items()):
+                if current_time - session.created > time_limit:
                     close_list.add(chat_id)
 
             for chat_id in close_list:
                 self.close_session(chat_id)
 
+            usage = self.get_sessions_memory_usage()
+            logging.info(
+                f'Active sessions: {usage["number_sessions"]}, '
+                f'bytes per session: {usage["bytes_per_session"]}'
+            )
+            statements = get_statement_cache_stats()
+            logging.info(
+                f'Statement cache hit rate (simulated): '
+                f'{statements["hit_rate"]:.2%} '
+                f'({statements["hits"]} hits, {statements["misses"]} misses)'
+            )
+
+    def get_sessions_memory_usage(self) -> Dict[str, int]:
+        """Returns the number of active sessions and the bytes they hold."""
+        number_sessions = len(self._sessions)
+        total_bytes = sum(
+            get_session_size(session) for session in list(self._sessions.values())
+        )
+        return {
+            'number_sessions': number_sessions,
+            'total_bytes': total_bytes,
+            'bytes_per_session': total_bytes // number_sessions if number_sessions else 0,
+        }
+
     def register_handlers(self, *args) -> None:
+        handlers, handlers_ids = dict(self._handlers), dict(self._handlers_ids)
         for handler in args:
             if not isinstance(handler, SessionHandler):
                 raise KeyError('Все аргументы д. б. подклассами класса '
                                '"SessionHandler"')
-            self._handlers[handler.alias] = handler
+            handlers[handler.alias] = handler
+            handlers_ids[handler.handler_id] = handler
+        # readers in other threads see either the old or the new registry
+        self._handlers = MappingProxyType(handlers)
+        self._handlers_ids = MappingProxyType(handlers_ids)
 
     def _get_handler(self, handler_alias: str) -> SessionHandler:
         return self._handlers[handler_alias]
 
+    def _get_handler_by_id(self, handler_id: int) -> SessionHandler:
+        return self._handlers_ids[handler_id]
+
     @staticmethod
     def _is_bot_command(text: str) -> bool:
         """Returns True if the text is a valid telegram bot command."""
@@ -226,5 +363,7 @@ class SessionsDispatcher:
         return (command, deep_link)
 
     @staticmethod
-    def _get_now_datetime() -> datetime:
-        return datetime.now()
+    def _get_number_argument(text: str) -> Optional[int]:
+        """Returns N of the '/command N' text, if any."""
+        match = re.search(r'^/[a-z0-9_]+\s+(\d+)\s*$', text)
+        return int(match.group(1)) if match is not None else None
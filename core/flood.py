@@ -0,0 +1,127 @@
+import asyncio
+import collections
+import logging
+import time
+from typing import Dict, Optional
+
+from core.config import (
+    FLOOD_DEADLINE,
+    FLOOD_GLOBAL_BURST,
+    FLOOD_GLOBAL_RATE,
+    FLOOD_POLICY,
+    FLOOD_USER_BURST,
+    FLOOD_USER_RATE
+)
+
+
+class TokenBucket:
+    """
+    rate tokens per second, at most capacity tokens. Tokens may go below
+    zero when they are reserved in advance (see AdmissionController).
+    """
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def refill(self, now: float) -> None:
+        if now <= self.updated:
+            return
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated) * self.rate
+        )
+        self.updated = now
+
+    def get_wait(self, now: float) -> float:
+        """Returns seconds until a token is available."""
+        self.refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+
+class AdmissionController:
+    """
+    Per-user and global token bucket rate limiting of incoming updates,
+    checked in memory before any db access.
+
+    Updates over the limit are dropped (policy 'drop') or delayed until
+    tokens are available if that takes less than deadline seconds
+    (policy 'queue'), otherwise dropped as expired.
+    """
+
+    def __init__(
+            self,
+            user_rate: float = FLOOD_USER_RATE,
+            user_burst: float = FLOOD_USER_BURST,
+            global_rate: float = FLOOD_GLOBAL_RATE,
+            global_burst: float = FLOOD_GLOBAL_BURST,
+            policy: str = FLOOD_POLICY,
+            deadline: float = FLOOD_DEADLINE,
+            max_users: int = 100000
+    ):
+        if policy not in ('drop', 'queue'):
+            raise ValueError(f'Неизвестная политика {policy}')
+        self._user_rate = user_rate
+        self._user_burst = user_burst
+        self._policy = policy
+        self._deadline = deadline
+        self._max_users = max_users
+        self._global = TokenBucket(global_rate, global_burst, time.monotonic())
+        # least recently active users are evicted first
+        self._users: 'collections.OrderedDict[int, TokenBucket]' = (
+            collections.OrderedDict()
+        )
+        self.stats: Dict[str, int] = collections.Counter()
+
+    def _get_user_bucket(self, user_id: int, now: float) -> TokenBucket:
+        bucket = self._users.get(user_id)
+        if bucket is None:
+            bucket = TokenBucket(self._user_rate, self._user_burst, now)
+            self._users[user_id] = bucket
+            if len(self._users) > self._max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+        return bucket
+
+    def reserve(self, user_id: int, now: Optional[float] = None) -> Optional[float]:
+        """
+        Takes a token from the user's and the global buckets. Returns the
+        seconds to wait before handling the update, None if it is rejected.
+        """
+        now = time.monotonic() if now is None else now
+        bucket = self._get_user_bucket(user_id, now)
+        user_wait, global_wait = bucket.get_wait(now), self._global.get_wait(now)
+        wait = max(user_wait, global_wait)
+        if wait > 0:
+            if self._policy == 'drop' or wait > self._deadline:
+                key = 'user' if user_wait >= global_wait else 'global'
+                self.stats[f'rejected_{key}'] += 1
+                return None
+            self.stats['delayed'] += 1
+        bucket.tokens -= 1
+        self._global.tokens -= 1
+        self.stats['admitted'] += 1
+        return wait
+
+    async def admit(self, user_id: int) -> bool:
+        """Returns False if the update must be dropped."""
+        wait = self.reserve(user_id)
+        if wait is None:
+            return False
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return True
+
+    def get_formatted_stats(self) -> str:
+        return (f'Admitted updates: {self.stats["admitted"]}, '
+                f'delayed: {self.stats["delayed"]}, '
+                f'rejected by user limit: {self.stats["rejected_user"]}, '
+                f'by global limit: {self.stats["rejected_global"]}')
+
+    async def report_stats(self, interval: int = 600) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            logging.info(self.get_formatted_stats())
@@ -1,21 +1,25 @@
 import functools
 import io
+import itertools
 from abc import ABC, abstractmethod
-from datetime import datetime
 from typing import Callable, Dict, Optional, Tuple, Union
 
 from core.types import Answer, CloseSession, Session
 
 
+_handler_ids = itertools.count(1)
+
+
 class SessionHandler(ABC):
 
     def __init__(self, alias: str, steps: Tuple[str, ...]):
+        self._id = next(_handler_ids)
         self._alias = alias
         self._steps = steps
         self._functions_map: Dict[str, Callable] = {}
 
     @abstractmethod
-    def get_data_class(self, user_id: int, date: datetime) -> Session:
+    def get_data_class(self, user_id: int) -> Session:
         """Returns Session depending on the type of session handler."""
         pass
 
@@ -23,14 +27,15 @@ class SessionHandler(ABC):
     def last_step(self) -> int:
         return len(self._steps) - 1
 
+    @property
+    def handler_id(self) -> int:
+        """Small int id stored in sessions instead of the alias."""
+        return self._id
+
     @property
     def alias(self) -> str:
         return self._alias
 
-    @alias.setter
-    def alias(self, value: str):
-        self._alias = value
-
     def handle_session(
             self,
             session: Session,
@@ -39,9 +44,11 @@ class SessionHandler(ABC):
         func = self._get_step_handler(session.current_step)
         return func(session, message)
 
+    def get_step_alias(self, step: int) -> str:
+        return self._steps[step]
+
     def _get_step_handler(self, step: int) -> Callable:
-        step_alias = self._steps[step]
-        return self._functions_map[step_alias]
+        return self._functions_map[self.get_step_alias(step)]
 
     def update_current_step(self, session: Session) -> None:
         if session.current_step < self.last_step:
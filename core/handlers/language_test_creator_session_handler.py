@@ -1,16 +1,15 @@
 import io
 import logging
-from datetime import datetime
 from typing import Dict, List, Tuple, Union
 
 from core.check_language_test import check_language_test
 from core.db import (
-    delete_questions,
+    delete_user_questions,
     generate_questions_values,
-    get_all_questions,
     get_language_id,
     insert_questions,
-    normalize_question
+    normalize_question,
+    update_questions
 )
 from core.exceptions import LanguageTestError
 from core.handlers import SessionHandler
@@ -22,11 +21,9 @@ class LanguageTestCreatorSessionHandler(SessionHandler):
     def __init__(self, alias: str, steps: Tuple[str, ...]):
         super().__init__(alias, steps)
 
-    def get_data_class(
-            self, user_id: int, date: datetime
-    ) -> LanguageTestCreatorSession:
+    def get_data_class(self, user_id: int) -> LanguageTestCreatorSession:
         return LanguageTestCreatorSession(
-            handler_alias=self.alias, user_id=user_id, created=date
+            handler_id=self.handler_id, user_id=user_id
         )
 
 
@@ -57,9 +54,7 @@ def _handle_language_test(
         session: LanguageTestCreatorSession,
         message: [str, io.BytesIO]
 ) -> Tuple[Answer, CloseSession]:
-    answer_text = _handle_test_creator_message(
-        session.command, session.user_id, message
-    )
+    answer_text = _handle_test_creator_message(session, message)
     return (Answer(text=answer_text), CloseSession())
 
 
@@ -77,37 +72,39 @@ def _get_start_message_text(command: str) -> str:
 
 
 def _handle_test_creator_message(
-        command: str,
-        user_id: int,
+        session: LanguageTestCreatorSession,
         message: Union[str, io.BytesIO]
 ) -> str:
-    if command == 'add_questions':
-        return _handle_add_questions_command(user_id, message)
-    elif command == 'delete_questions':
-        return _handle_delete_questions_command(user_id, message)
-    elif command == 'update_questions':
-        return _handle_update_questions_command(user_id, message)
+    if session.command == 'add_questions':
+        return _handle_add_questions_command(session, message)
+    elif session.command == 'delete_questions':
+        return _handle_delete_questions_command(session, message)
+    elif session.command == 'update_questions':
+        return _handle_update_questions_command(session, message)
 
 
-def _handle_add_questions_command(user_id: int, file: io.BytesIO) -> str:
+def _handle_add_questions_command(
+        session: LanguageTestCreatorSession,
+        file: io.BytesIO
+) -> str:
     try:
         data = check_language_test(file)
     except Exception as e:
         return str(e)
     else:
-        answer_text = _add_questions(user_id, data)
+        answer_text = _add_questions(session, data)
         return answer_text
 
 
 def _handle_delete_questions_command(
-        user_id: int,
+        session: LanguageTestCreatorSession,
         data: [str, io.BytesIO]
 ) -> str:
     try:
         if isinstance(data, str):
-            answer_text = _delete_question(user_id, data)
+            answer_text = _delete_question(session, data)
         elif isinstance(data, io.BytesIO):
-            answer_text = _delete_questions(user_id, data)
+            answer_text = _delete_questions(session, data)
         else:
             raise LanguageTestError(
                 'Один вопрос м. б. в виде строки, несколько вопросов д. б. в '
@@ -121,12 +118,12 @@ def _handle_delete_questions_command(
 
 
 def _handle_update_questions_command(
-        user_id: int,
+        session: LanguageTestCreatorSession,
         data: [str, io.BytesIO]
 ) -> str:
     try:
         if isinstance(data, io.BytesIO):
-            answer_text = _update_questions(user_id, data)
+            answer_text = _update_questions(session, data)
         else:
             raise LanguageTestError(
                 'Список вопросов д. б. в виде текстового файла'
@@ -137,17 +134,17 @@ def _handle_update_questions_command(
         return answer_text
 
 
-def _delete_question(user_id: int, question: str) -> str:
-    user_questions = get_all_questions(user_id)
+def _delete_question(session: LanguageTestCreatorSession, question: str) -> str:
     question = normalize_question(question)
-    if question in user_questions:
-        delete_questions([user_questions[question], ])
+    if delete_user_questions(session.user_id, [question, ])[question]:
+        session.number_processed = 1
         return 'Вопрос успешно удалён!'
+    session.number_missed = 1
     return ('Не удалось найти присланный вами вопрос.\n'
             'Не было удалено ни одного вопроса.')
 
 
-def _delete_questions(user_id: int, file: io.BytesIO) -> str:
+def _delete_questions(session: LanguageTestCreatorSession, file: io.BytesIO) -> str:
     try:
         del_questions = _get_questions(file)
     except Exception as e:
@@ -155,20 +152,10 @@ def _delete_questions(user_id: int, file: io.BytesIO) -> str:
     else:
         if not del_questions:
             return 'Присланный вами список вопросов пуст'
-        questions = get_all_questions(user_id)
-        question_ids, missed_questions = [], []
-        for question in del_questions:
-            if question in questions:
-                question_ids.append(questions[question])
-            else:
-                missed_questions.append(question)
-        if question_ids:
-            delete_questions(question_ids)
+        statuses = delete_user_questions(session.user_id, del_questions)
+        missed_questions = _set_statistics(session, statuses)
         if missed_questions:
-            fmt_missed_questions = '\n'.join(
-                f'{ind}. {val}'
-                for ind, val in enumerate(missed_questions, start=1)
-            )
+            fmt_missed_questions = _get_fmt_questions(missed_questions)
             return (f'Были удалены не все вопросы из вашего списка.\n'
                     f'Список вопросов, которые не были ранее загружены:\n'
                     f'{fmt_missed_questions}')
@@ -176,33 +163,20 @@ def _delete_questions(user_id: int, file: io.BytesIO) -> str:
             return 'Все вопросы были успешно удалены!'
 
 
-def _update_questions(user_id: int, file: io.BytesIO) -> str:
+def _update_questions(session: LanguageTestCreatorSession, file: io.BytesIO) -> str:
     try:
         data = check_language_test(file, False)
     except Exception as e:
         return str(e)
     else:
-        questions = get_all_questions(user_id)
-        question_ids, missed_questions, upd_questions = [], [], []
-        for question in data['questions']:
-            _question = normalize_question(question['question'])
-            if _question in questions:
-                question_ids.append(questions[_question])
-                upd_questions.append(question)
-            else:
-                missed_questions.append(_question)
-        if question_ids:
-            delete_questions(question_ids)
-            language_id = get_language_id(data['language'].upper(), 'code')
-            values = generate_questions_values(
-                user_id, language_id, int(data['test_type']), upd_questions
-            )
-            insert_questions(values)
+        language_id = get_language_id(data['language'].upper(), 'code')
+        values = generate_questions_values(
+            session.user_id, language_id, int(data['test_type']), data['questions']
+        )
+        statuses = update_questions(session.user_id, values)
+        missed_questions = _set_statistics(session, statuses)
         if missed_questions:
-            fmt_missed_questions = '\n'.join(
-                f'{ind}. {val}'
-                for ind, val in enumerate(missed_questions, start=1)
-            )
+            fmt_missed_questions = _get_fmt_questions(missed_questions)
             return (f'Были обновлены не все вопросы из вашего списка.\n'
                     f'Список вопросов, которые не были ранее загружены:\n'
                     f'{fmt_missed_questions}')
@@ -210,12 +184,31 @@ def _update_questions(user_id: int, file: io.BytesIO) -> str:
             return 'Все вопросы были успешно обновлены!'
 
 
-def _add_questions(user_id: int, data: Dict) -> str:
+def _set_statistics(
+        session: LanguageTestCreatorSession, statuses: Dict[str, bool]
+) -> List[str]:
+    """Saves number of processed/missed questions, returns missed questions."""
+    missed_questions = [
+        question for question, status in statuses.items() if not status
+    ]
+    session.number_processed = len(statuses) - len(missed_questions)
+    session.number_missed = len(missed_questions)
+    return missed_questions
+
+
+def _get_fmt_questions(questions: List[str]) -> str:
+    return '\n'.join(
+        f'{ind}. {val}' for ind, val in enumerate(questions, start=1)
+    )
+
+
+def _add_questions(session: LanguageTestCreatorSession, data: Dict) -> str:
     language_id = get_language_id(data['language'].upper(), 'code')
     values = generate_questions_values(
-        user_id, language_id, int(data['test_type']), data['questions']
+        session.user_id, language_id, int(data['test_type']), data['questions']
     )
     insert_questions(values)
+    session.number_processed = len(values)
     return 'Ваши вопросы были успешно добавлены!'
 
 
@@ -1,9 +1,6 @@
-from datetime import datetime
 from random import shuffle
 from typing import List, Optional, Tuple, Union
 
-from aiogram.types import ReplyKeyboardMarkup
-
 from core.db import (
     generate_answer_values,
     get_current_languages,
@@ -20,6 +17,7 @@ from core.keyboard import get_keyboard
 from core.types import (
     Answer,
     CloseSession,
+    Keyboard,
     LanguageTest,
     Question,
     UserSession
@@ -31,8 +29,8 @@ class UserSessionHandler(SessionHandler):
     def __init__(self, alias: str, steps: Tuple[str, ...]):
         super().__init__(alias, steps)
 
-    def get_data_class(self, user_id: int, date: datetime) -> UserSession:
-        return UserSession(handler_alias=self.alias, user_id=user_id, created=date)
+    def get_data_class(self, user_id: int) -> UserSession:
+        return UserSession(handler_id=self.handler_id, user_id=user_id)
 
 
 user_session_handler = UserSessionHandler(
@@ -159,7 +157,7 @@ def _process_user_answer(
 
 def _get_formatted_question(
         question: Question, number: int
-) -> Tuple[str, ReplyKeyboardMarkup]:
+) -> Tuple[str, Keyboard]:
     keyboard = get_keyboard(
         [i for i in range(1, len(question.answers) + 1)], row_width=2
     )
@@ -1,26 +1,48 @@
 import json
 import os.path
-from typing import List, Sequence, Tuple
+from typing import Callable, Dict, List, Sequence, Tuple
 
 from .config import ADMINS, INIT_DATA_DIR
 from .db import (
     execute_script,
     generate_questions_values,
     get_admin_ids,
+    get_db_version,
     get_language_id,
     get_number_tables,
     get_role_id,
     insert,
     insert_questions,
-    insert_user
+    insert_user,
+    rebuild_question_stats,
+    rebuild_reviews,
+    rebuild_user_stats,
+    set_db_version
 )
+from .retention import get_archived_attempts
+
+
+# python steps run after all new migration scripts, the rebuilds replay
+# attempts, which are moved from test_results by migration 7, together
+# with the ones moved to the archive by core.retention
+_migration_hooks: Dict[int, Callable[[], None]] = {
+    1: lambda: rebuild_reviews(get_archived_attempts()),
+    2: lambda: rebuild_user_stats(get_archived_attempts()),
+    3: lambda: rebuild_question_stats(get_archived_attempts()),
+}
 
 
 def check_db_exists(admins: Sequence = ADMINS, path: str = INIT_DATA_DIR) -> None:
     """
     Checks if db is initialized, if not, initializes.
+    Applies new migrations to an existing db.
     """
+    migrations = _get_migrations_list(path)
+    # one pragma read on the common start: the db is up to date
+    if migrations and get_db_version() >= migrations[-1][0]:
+        return
     if get_number_tables() > 0:
+        _migrate_db(path)
         return
     _init_db(path)
     _insert_data(admins, path)
@@ -32,6 +54,35 @@ def _init_db(script_path: str = INIT_DATA_DIR) -> None:
     with open(_script_path, mode='r') as file:
         script = file.read()
     execute_script(script)
+    _migrate_db(script_path)
+
+
+def _migrate_db(path: str = INIT_DATA_DIR) -> None:
+    """
+    Applies scripts from migrations/ numbered above PRAGMA user_version.
+    """
+    version = get_db_version()
+    migrations = [
+        (number, file_name)
+        for number, file_name in _get_migrations_list(path)
+        if number > version
+    ]
+    for number, file_name in migrations:
+        with open(os.path.join(path, 'migrations', file_name), mode='r') as file:
+            execute_script(file.read())
+        set_db_version(number)
+    for number, _ in migrations:
+        if number in _migration_hooks:
+            _migration_hooks[number]()
+
+
+def _get_migrations_list(path: str = INIT_DATA_DIR) -> List[Tuple[int, str]]:
+    migrations_dir = os.path.join(path, 'migrations')
+    return sorted(
+        (int(file.split('_', 1)[0]), file)
+        for file in os.listdir(migrations_dir)
+        if file.endswith('.sql')
+    )
 
 
 def _insert_data(admins: Sequence, path: str = INIT_DATA_DIR) -> None:
@@ -0,0 +1,207 @@
+import contextlib
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import time
+from typing import Iterator, Optional
+
+from core.config import (
+    BASE_DIR,
+    LOG_BACKUP_COUNT,
+    LOG_JSON,
+    LOG_MAX_BYTES,
+    LOG_QUEUE_SIZE,
+    LOG_ROTATE_WHEN
+)
+
+
+TEXT_FORMAT = '[%(levelname)-8s] [%(filename)-18s] [%(asctime)s] [%(message)s]'
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# (update_id, user_id, started) of the update being handled
+_update: contextvars.ContextVar = contextvars.ContextVar('update', default=None)
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional['DroppingQueueHandler'] = None
+
+
+@contextlib.contextmanager
+def update_context(
+        update_id: Optional[int], user_id: int, started: Optional[float] = None
+) -> Iterator[None]:
+    """
+    Records logged inside the block carry update_id, user_id and the
+    latency (ms) since started (time.monotonic()), by default since the
+    block was entered.
+    """
+    started = time.monotonic() if started is None else started
+    token = _update.set((update_id, user_id, started))
+    try:
+        yield
+    finally:
+        _update.reset(token)
+
+
+class UpdateContextFilter(logging.Filter):
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        update = _update.get()
+        if update is None:
+            record.update_id = record.user_id = record.latency = None
+        else:
+            update_id, user_id, started = update
+            record.update_id = update_id
+            record.user_id = user_id
+            record.latency = round((time.monotonic() - started) * 1000, 1)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'time': self.formatTime(record, DATE_FORMAT),
+            'level': record.levelname,
+            'file': record.filename,
+            'message': record.getMessage(),
+        }
+        for key in ('update_id', 'user_id', 'latency'):
+            value = getattr(record, key, None)
+            if value is not None:
+                data[key] = value
+        return json.dumps(data, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """TEXT_FORMAT with the update context appended when it is set."""
+
+    def __init__(self):
+        super().__init__(TEXT_FORMAT, DATE_FORMAT)
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        if getattr(record, 'user_id', None) is None:
+            return text
+        return (f'{text} [update {record.update_id}] [user {record.user_id}] '
+                f'[{record.latency} ms]')
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Never blocks the caller: records that don't fit into the bounded
+    queue are dropped and counted.
+    """
+
+    def __init__(self, _queue: queue.Queue):
+        super().__init__(_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RotatingFileHandler(logging.handlers.TimedRotatingFileHandler):
+    """Rotates the file on schedule (when) or once it grows over max_bytes."""
+
+    def __init__(
+            self,
+            filename: str,
+            when: str = LOG_ROTATE_WHEN,
+            max_bytes: int = LOG_MAX_BYTES,
+            backup_count: int = LOG_BACKUP_COUNT
+    ):
+        super().__init__(
+            filename, when=when, backupCount=backup_count, encoding='utf-8'
+        )
+        self.max_bytes = max_bytes
+        # several size rollovers may happen within one time interval
+        self.suffix = '%Y-%m-%d_%H-%M-%S'
+        self.extMatch = re.compile(
+            r'^\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2}(\.\w+)?$', re.ASCII
+        )
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if super().shouldRollover(record):
+            return True
+        if self.max_bytes <= 0 or self.stream is None:
+            return False
+        return self.stream.tell() >= self.max_bytes
+
+    def doRollover(self) -> None:
+        # the inherited doRollover names the backup after the interval
+        # start and replaces an existing one, so size rollovers within one
+        # interval would overwrite each other
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        now = int(time.time())
+        if os.path.exists(self.baseFilename):
+            self.rotate(self.baseFilename, self._get_backup_name(now))
+        if self.backupCount > 0:
+            for file_name in self.getFilesToDelete():
+                os.remove(file_name)
+        if not self.delay:
+            self.stream = self._open()
+        rollover_at = self.computeRollover(now)
+        while rollover_at <= now:
+            rollover_at += self.interval
+        self.rolloverAt = rollover_at
+
+    def _get_backup_name(self, now: int) -> str:
+        name = f'{self.baseFilename}.{time.strftime(self.suffix, time.localtime(now))}'
+        backup_name, counter = name, 0
+        while os.path.exists(self.rotation_filename(backup_name)):
+            counter += 1
+            # zero-padded, so backups sort in the order of rotation
+            backup_name = f'{name}.{counter:03d}'
+        return self.rotation_filename(backup_name)
+
+
+def setup_logging(
+        filename: str = os.path.join(BASE_DIR, 'log.log'),
+        json_lines: bool = LOG_JSON,
+        level: int = logging.INFO,
+        queue_size: int = LOG_QUEUE_SIZE,
+        max_bytes: int = LOG_MAX_BYTES
+) -> DroppingQueueHandler:
+    """
+    Routes the root logger through a bounded queue to a background
+    thread, which writes and rotates the log file.
+    """
+    global _listener, _queue_handler
+    stop_logging()
+    file_handler = RotatingFileHandler(filename, max_bytes=max_bytes)
+    file_handler.setFormatter(JsonFormatter() if json_lines else TextFormatter())
+    queue_handler = DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+    queue_handler.addFilter(UpdateContextFilter())
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    _listener = logging.handlers.QueueListener(queue_handler.queue, file_handler)
+    _listener.start()
+    _queue_handler = queue_handler
+    return queue_handler
+
+
+def get_dropped_records() -> int:
+    """Returns the number of records dropped on a full queue."""
+    return 0 if _queue_handler is None else _queue_handler.dropped
+
+
+def stop_logging() -> None:
+    """Writes the queued records and stops the background thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
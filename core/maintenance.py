@@ -0,0 +1,192 @@
+import argparse
+import asyncio
+import logging
+import os.path
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from core.config import (
+    DB_NAME,
+    MAINTENANCE_HOURS,
+    MAINTENANCE_VACUUM_PAGES
+)
+from core.db import (
+    analyze_table,
+    check_integrity,
+    close_connection,
+    create_connection,
+    enable_incremental_vacuum,
+    get_analyzed_rows,
+    get_auto_vacuum,
+    get_db_path,
+    get_number_rows,
+    get_page_stats,
+    get_table_names,
+    incremental_vacuum,
+    optimize_db
+)
+
+
+Report = Dict[str, Union[int, float, List[str]]]
+
+
+def _parse_hours(hours: str) -> Tuple[int, int]:
+    """'3-5' -> (3, 5), the window may pass midnight: '23-2'."""
+    start, end = (int(i) for i in hours.split('-'))
+    if not (0 <= start < 24 and 0 <= end <= 24):
+        raise ValueError(f'Неверное окно обслуживания {hours}')
+    return start, end
+
+
+class Maintenance:
+    """
+    Runs db maintenance once a day within the hours window: ANALYZE of
+    tables whose number of rows changed by more than analyze_threshold,
+    PRAGMA optimize, incremental vacuum and integrity checks.
+
+    Every SQL call runs in a thread of its own with its own connection, so
+    the event loop is never blocked. The work is split into small steps,
+    so the db is locked for one table or vacuum_pages pages at a time.
+    """
+
+    def __init__(
+            self,
+            hours: str = MAINTENANCE_HOURS,
+            vacuum_pages: int = MAINTENANCE_VACUUM_PAGES,
+            analyze_threshold: float = 0.2
+    ):
+        self._hours = _parse_hours(hours)
+        self._vacuum_pages = vacuum_pages
+        self._analyze_threshold = analyze_threshold
+        self._last_run: Optional[datetime] = None
+        self.reports: List[Report] = []  # the last runs
+
+    def is_due(self, now: datetime) -> bool:
+        start, end = self._hours
+        if start <= end:
+            in_window = start <= now.hour < end
+        else:
+            in_window = now.hour >= start or now.hour < end
+        # one run per window, windows are up to 12 hours long
+        return in_window and (
+            self._last_run is None or now - self._last_run >= timedelta(hours=12)
+        )
+
+    async def run(self, check_interval: int = 600) -> None:
+        while True:
+            await asyncio.sleep(check_interval)
+            if not self.is_due(datetime.now()):
+                continue
+            try:
+                await self.run_once()
+            except Exception:
+                logging.exception('Db maintenance failed')
+
+    async def run_once(self) -> Report:
+        self._last_run = datetime.now()
+        report: Report = {
+            'duration': 0.0,
+            'analyzed': [],
+            'bytes_reclaimed': 0,
+            'integrity_errors': [],
+        }
+        started = time.monotonic()
+        steps: List[Callable[[Report], Iterator[None]]] = [
+            self._analyze, self._optimize, self._vacuum, self._check_integrity
+        ]
+        loop = asyncio.get_event_loop()
+        # one thread, so all steps share its connection
+        executor = ThreadPoolExecutor(1, thread_name_prefix='maintenance')
+        try:
+            for step in steps:
+                items = step(report)
+                while await loop.run_in_executor(executor, next, items, False) is None:
+                    pass
+        finally:
+            await loop.run_in_executor(executor, close_connection)
+            executor.shutdown()
+        report['duration'] = time.monotonic() - started
+        self.reports = self.reports[-9:] + [report]
+        logging.info(
+            f'Db maintenance: {report["duration"]:.2f} s, '
+            f'{report["bytes_reclaimed"]} bytes reclaimed, '
+            f'analyzed: {", ".join(report["analyzed"]) or "-"}'
+        )
+        for error in report['integrity_errors']:
+            logging.error(f'Db integrity check: {error}')
+        return report
+
+    @staticmethod
+    def _optimize(report: Report) -> Iterator[None]:
+        optimize_db()
+        yield
+
+    def _analyze(self, report: Report) -> Iterator[None]:
+        analyzed_rows = get_analyzed_rows()
+        for table in get_table_names():
+            number_rows = get_number_rows(table)
+            yield
+            old_number_rows = analyzed_rows.get(table)
+            if old_number_rows is None:
+                changed = number_rows > 0
+            else:
+                changed = (abs(number_rows - old_number_rows)
+                           > max(old_number_rows, 1) * self._analyze_threshold)
+            if changed:
+                analyze_table(table)
+                report['analyzed'].append(table)
+                yield
+
+    def _vacuum(self, report: Report) -> Iterator[None]:
+        if get_auto_vacuum() != 2:
+            logging.info('Db auto_vacuum is not incremental, see '
+                         'python -m core.maintenance enable_incremental_vacuum')
+            return
+        page_size, _, freelist_count = get_page_stats()
+        while freelist_count > 0:
+            incremental_vacuum(self._vacuum_pages)
+            _, _, left = get_page_stats()
+            if left >= freelist_count:
+                break
+            report['bytes_reclaimed'] += (freelist_count - left) * page_size
+            freelist_count = left
+            yield
+
+    @staticmethod
+    def _check_integrity(report: Report) -> Iterator[None]:
+        for table in get_table_names():
+            report['integrity_errors'].extend(
+                f'{table}: {error}' for error in check_integrity(table)
+            )
+            yield
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Db maintenance')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('run', help='run the maintenance once')
+    commands.add_parser(
+        'enable_incremental_vacuum',
+        help='switch the db to incremental auto_vacuum, rewrites the whole db'
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    create_connection(DB_NAME)
+    try:
+        if args.command == 'run':
+            asyncio.run(Maintenance().run_once())
+            return
+        started, size = time.monotonic(), os.path.getsize(get_db_path())
+        enable_incremental_vacuum()
+        logging.info(
+            f'Incremental auto_vacuum enabled in {time.monotonic() - started:.2f} s, '
+            f'db size: {size} -> {os.path.getsize(get_db_path())} bytes'
+        )
+    finally:
+        close_connection()
+
+
+if __name__ == '__main__':
+    main()
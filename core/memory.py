@@ -0,0 +1,35 @@
+import gc
+import tracemalloc
+from typing import Dict
+
+from core.handlers import SessionHandler
+from core.types import get_session_size
+
+
+def measure_sessions_footprint(
+        handler: SessionHandler, number_sessions: int = 10000
+) -> Dict[str, float]:
+    """
+    Creates number_sessions empty sessions of the handler and returns the
+    bytes per session measured with tracemalloc and with sys.getsizeof.
+    """
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    gc.collect()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        sessions = {
+            user_id: handler.get_data_class(user_id)
+            for user_id in range(10 ** 9, 10 ** 9 + number_sessions)
+        }
+        after, _ = tracemalloc.get_traced_memory()
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+    getsizeof_bytes = sum(get_session_size(i) for i in sessions.values())
+    return {
+        'number_sessions': number_sessions,
+        'tracemalloc_bytes_per_session': (after - before) / number_sessions,
+        'getsizeof_bytes_per_session': getsizeof_bytes / number_sessions,
+    }
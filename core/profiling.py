@@ -0,0 +1,141 @@
+import cProfile
+import os.path
+import pstats
+import threading
+import time
+from datetime import datetime
+from typing import List, NamedTuple, Optional
+
+from core.config import MAX_PROFILE_SECONDS, PROFILE_DIR, PROFILE_TOP
+
+
+class ProfileResult(NamedTuple):
+    user_id: int  # the admin who asked for the profile
+    path: str
+    duration: float  # s
+    updates: int
+    summary: str
+
+
+class Profiler:
+    """
+    cProfile of the event loop thread, requested by an admin for N seconds
+    or N updates.
+
+    request() may be called from any thread, the profile is started and
+    stopped by poll() on the event loop thread. While nothing is requested
+    the only cost is reading the enabled attribute. A profile of N updates
+    is stopped after max_seconds too, if the updates don't come.
+    """
+
+    def __init__(
+            self,
+            path: str = PROFILE_DIR,
+            top: int = PROFILE_TOP,
+            max_seconds: float = MAX_PROFILE_SECONDS
+    ):
+        self._path = path
+        self._top = top
+        self._max_seconds = max_seconds
+        self._lock = threading.Lock()
+        self._profile: Optional[cProfile.Profile] = None
+        self._user_id: Optional[int] = None
+        self._seconds: Optional[float] = None
+        self._updates: Optional[int] = None
+        self._started = 0.0
+        self._number_updates = 0
+        self.enabled = False
+
+    def request(
+            self,
+            user_id: int,
+            seconds: Optional[float] = None,
+            updates: Optional[int] = None
+    ) -> bool:
+        """Returns False if a profile is already requested or running."""
+        if (seconds is None) == (updates is None):
+            raise ValueError('Нужно указать либо seconds, либо updates')
+        with self._lock:
+            if self.enabled:
+                return False
+            self._user_id, self._seconds, self._updates = user_id, seconds, updates
+            self.enabled = True
+            return True
+
+    @property
+    def running(self) -> bool:
+        return self._profile is not None
+
+    @property
+    def seconds(self) -> float:
+        """s after the start when poll() stops the profile at the latest."""
+        if self._seconds is None:
+            return self._max_seconds
+        return min(self._seconds, self._max_seconds)
+
+    def poll(self, update: bool = True) -> Optional[ProfileResult]:
+        """
+        Starts the requested profile or counts the handled update. Returns
+        the result when the profile is finished.
+        """
+        with self._lock:
+            if not self.enabled:
+                return None
+            if self._profile is None:
+                self._profile = cProfile.Profile()
+                self._started = time.monotonic()
+                self._number_updates = 0
+                self._profile.enable()
+                return None
+            self._number_updates += int(update)
+            elapsed = time.monotonic() - self._started
+            if elapsed < self.seconds:
+                if self._updates is not None and self._number_updates < self._updates:
+                    return None
+                if self._seconds is not None:
+                    return None
+            return self._stop(elapsed)
+
+    def _stop(self, elapsed: float) -> ProfileResult:
+        profile, self._profile = self._profile, None
+        profile.disable()
+        os.makedirs(self._path, exist_ok=True)
+        file_path = os.path.join(
+            self._path, f'profile_{datetime.now().strftime("%Y%m%d_%H%M%S")}.prof'
+        )
+        profile.dump_stats(file_path)
+        result = ProfileResult(
+            self._user_id, file_path, elapsed, self._number_updates,
+            get_profile_summary(profile, self._top)
+        )
+        self.enabled = False
+        return result
+
+
+def get_profile_summary(profile: cProfile.Profile, top: int = PROFILE_TOP) -> str:
+    """Returns the top functions by own time: calls, own and cumulative time."""
+    stats = pstats.Stats(profile)
+    rows: List[tuple] = sorted(
+        (
+            (own_time, cumulative_time, calls, function)
+            for function, (_, calls, own_time, cumulative_time, _)
+            in stats.stats.items()
+        ),
+        reverse=True
+    )[:top]
+    lines = [
+        f'{own_time * 1000:.0f} / {cumulative_time * 1000:.0f} ms, {calls} - '
+        f'{os.path.basename(file_name)}:{line} {name}'
+        for own_time, cumulative_time, calls, (file_name, line, name) in rows
+    ]
+    return '\n'.join(lines)
+
+
+def get_profile_report(result: ProfileResult) -> str:
+    text = (f'Профиль за {result.duration:.1f} с, обновлений: {result.updates}.\n'
+            f'Собственное / общее время, вызовы - функция:\n\n{result.summary}')
+    # the message length limit of telegram
+    return text[:4096]
+
+
+profiler = Profiler()
@@ -0,0 +1,444 @@
+"""
+SQL statements of core.db.
+
+Every statement is a fixed string and every value is a bound parameter,
+so sqlite3 reuses the prepared statements from its per-connection cache.
+Sets of ids or texts are passed as one JSON array parameter and joined
+with json_each(?).
+"""
+import collections
+import threading
+from typing import Dict
+
+
+# size of the sqlite3 prepared statements cache of each connection
+CACHED_STATEMENTS = 128
+
+
+class StatementCacheStats:
+    """
+    Simulates the LRU statement cache of one sqlite3 connection (the cache
+    is keyed by the SQL text) to estimate its hits and misses: sqlite3
+    doesn't expose the real ones. Only statements run through
+    core.db._execute and _executemany are seen.
+    """
+
+    def __init__(self, size: int = CACHED_STATEMENTS):
+        self._size = size
+        self._statements = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def register(self, sql: str) -> None:
+        with self._lock:
+            if sql in self._statements:
+                self._statements.move_to_end(sql)
+                self.hits += 1
+                return
+            self.misses += 1
+            self._statements[sql] = None
+            if len(self._statements) > self._size:
+                self._statements.popitem(last=False)
+
+    @property
+    def number_statements(self) -> int:
+        return len(self._statements)
+
+
+# users and roles
+
+ADMIN_IDS = (
+    'SELECT id '
+    'FROM users '
+    'WHERE role_id = (SELECT id FROM roles WHERE role = ?)'
+)
+IS_NEW_USER = (
+    'SELECT count(*) '
+    'FROM users '
+    'WHERE id = ?'
+)
+INSERT_USERS = (
+    'INSERT INTO users '
+    '(id, role_id, joined) '
+    'VALUES (?, ?, ?)'
+)
+ROLE_ID = (
+    'SELECT id '
+    'FROM roles '
+    'WHERE role = ?'
+)
+USER_ROLE: Dict[str, str] = {
+    'role': (
+        'SELECT role '
+        'FROM roles '
+        'WHERE id = (SELECT role_id '
+        '            FROM users '
+        '            WHERE id = ?)'
+    ),
+    'role_id': (
+        'SELECT role_id '
+        'FROM users '
+        'WHERE id = ?'
+    ),
+}
+UPDATE_USER_ROLE = (
+    'UPDATE users '
+    'SET role_id = (SELECT id FROM roles WHERE role = ?) '
+    'WHERE id = ? '
+    'AND role_id != (SELECT id FROM roles WHERE role = ?)'
+)
+
+# deep links
+
+INSERT_DEEP_LINK = (
+    'INSERT INTO deep_links '
+    '(link, creator_id, role, expires) '
+    'VALUES (?, ?, ?, ?)'
+)
+IS_VALID_DEEP_LINK = (
+    'SELECT count(*) '
+    'FROM deep_links '
+    'WHERE link = ? '
+    'AND user_id IS NULL '
+    'AND (expires IS NULL OR expires > ?)'
+)
+# compare-and-set: only one user can redeem the link
+REDEEM_DEEP_LINK = (
+    'UPDATE deep_links '
+    'SET user_id = ?, '
+    '    joined = ? '
+    'WHERE link = ? '
+    'AND user_id IS NULL '
+    'AND (expires IS NULL OR expires > ?)'
+)
+DEEP_LINK_ROLE = (
+    'SELECT role '
+    'FROM deep_links '
+    'WHERE link = ?'
+)
+
+# languages and test types
+
+ALL_LANGUAGES: Dict[str, str] = {
+    key: f'SELECT {key} FROM languages'
+    for key in ('id, code, name', 'id', 'code', 'name')
+}
+LANGUAGE_ID: Dict[str, str] = {
+    key: f'SELECT id FROM languages WHERE {key} = ?'
+    for key in ('code', 'name')
+}
+CURRENT_LANGUAGES: Dict[str, str] = {
+    key: (f'SELECT {key} '
+          f'FROM languages '
+          f'WHERE id IN (SELECT language_id FROM catalog)')
+    for key in ('code', 'name')
+}
+ALL_TEST_TYPES = (
+    'SELECT id, type '
+    'FROM test_types'
+)
+TEST_TYPE_ID = (
+    'SELECT id '
+    'FROM test_types '
+    'WHERE type = ?'
+)
+TEST_TYPES = (
+    'SELECT type '
+    'FROM test_types '
+    'WHERE id IN (SELECT test_type_id '
+    '             FROM catalog '
+    '             WHERE language_id = ?)'
+)
+
+# questions
+
+INSERT_QUESTIONS = (
+    'INSERT INTO questions '
+    '(user_id, language_id, test_type_id, question, answers, number_answers, '
+    ' right_answer) '
+    'VALUES (?, ?, ?, ?, ?, ?, ?)'
+)
+ALL_QUESTIONS = (
+    'SELECT question, id '
+    'FROM questions'
+)
+USER_QUESTIONS = (
+    'SELECT question, id '
+    'FROM questions '
+    'WHERE user_id = ?'
+)
+MATCH_USER_QUESTIONS = (
+    'SELECT '
+    '    q.question, '
+    '    q.id, '
+    '    q.language_id, '
+    '    q.test_type_id, '
+    '    q.number_answers, '
+    '    q.answers '
+    'FROM '
+    '    json_each(?) j '
+    '    JOIN questions q ON q.question = j.value '
+    'WHERE q.user_id = ?'
+)
+QUESTIONS_INFO = (
+    'SELECT id, language_id, test_type_id, number_answers, right_answer '
+    'FROM questions'
+)
+QUESTIONS_INFO_BY_IDS = (
+    'SELECT q.id, q.language_id, q.test_type_id, q.number_answers, '
+    '       q.right_answer '
+    'FROM '
+    '    json_each(?) j '
+    '    JOIN questions q ON q.id = j.value'
+)
+QUESTIONS_CATALOG_KEYS = (
+    'SELECT q.language_id, q.test_type_id, q.number_answers, count(*) '
+    'FROM '
+    '    json_each(?) j '
+    '    JOIN questions q ON q.id = j.value '
+    'GROUP BY q.language_id, q.test_type_id, q.number_answers'
+)
+DELETE_QUESTIONS = (
+    'DELETE FROM questions '
+    'WHERE id IN (SELECT value FROM json_each(?))'
+)
+UPDATE_QUESTION = (
+    'UPDATE questions '
+    'SET language_id = ?, '
+    '    test_type_id = ?, '
+    '    answers = ?, '
+    '    number_answers = ?, '
+    '    right_answer = ? '
+    'WHERE id = ?'
+)
+NEW_QUESTIONS = (
+    'SELECT '
+    '    q.id, '
+    '    q.question, '
+    '    q.answers, '
+    '    q.right_answer '
+    'FROM '
+    '    questions q '
+    'WHERE '
+    '    q.language_id = ? '
+    '    AND q.test_type_id = ? '
+    '    AND q.number_answers = ? '
+    '    AND NOT EXISTS (SELECT 1 '
+    '                    FROM reviews r '
+    '                    WHERE r.user_id = ? '
+    '                    AND r.question_id = q.id) '
+    'ORDER BY RANDOM() '
+    'LIMIT ?'
+)
+# True - questions due for review, False - not yet due
+REVIEW_QUESTIONS: Dict[bool, str] = {
+    due: (f'SELECT '
+          f'    q.id, '
+          f'    q.question, '
+          f'    q.answers, '
+          f'    q.right_answer '
+          f'FROM '
+          f'    reviews r '
+          f'    JOIN questions q ON q.id = r.question_id '
+          f'WHERE '
+          f'    r.user_id = ? '
+          f'    AND r.language_id = ? '
+          f'    AND r.test_type_id = ? '
+          f'    AND r.number_answers = ? '
+          f'    AND r.due {operator} ? '
+          f'ORDER BY r.due '
+          f'LIMIT ?')
+    for due, operator in ((True, '<='), (False, '>'))
+}
+
+# catalog
+
+UPDATE_CATALOG = (
+    'INSERT INTO catalog '
+    '(language_id, test_type_id, number_answers, number_questions) '
+    'VALUES (?, ?, ?, ?) '
+    'ON CONFLICT (language_id, test_type_id, number_answers) '
+    'DO UPDATE SET number_questions = number_questions + excluded.number_questions'
+)
+DELETE_EMPTY_CATALOG = (
+    'DELETE FROM catalog '
+    'WHERE number_questions <= 0'
+)
+CATALOG = (
+    'SELECT language_id, test_type_id, number_answers, number_questions '
+    'FROM catalog'
+)
+
+# attempts and reviews
+
+INSERT_ATTEMPTS = (
+    'INSERT INTO attempts '
+    '(user_id, taken, question_ids, answers) '
+    'VALUES (?, ?, ?, ?)'
+)
+ALL_ATTEMPTS = (
+    'SELECT id, user_id, taken, question_ids, answers '
+    'FROM attempts'
+)
+OLD_ATTEMPTS = (
+    'SELECT id, user_id, taken, question_ids, answers '
+    'FROM attempts '
+    'WHERE taken < ? '
+    'ORDER BY taken, id '
+    'LIMIT ?'
+)
+DELETE_ATTEMPTS = (
+    'DELETE FROM attempts '
+    'WHERE id IN (SELECT value FROM json_each(?))'
+)
+REVIEW = (
+    'SELECT ease, interval, repetitions, due '
+    'FROM reviews '
+    'WHERE user_id = ? AND question_id = ?'
+)
+SAVE_REVIEW = (
+    'INSERT OR REPLACE INTO reviews '
+    '(user_id, question_id, language_id, test_type_id, number_answers, '
+    ' ease, interval, repetitions, due) '
+    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)'
+)
+UPDATE_REVIEWS_TEST_KEY = (
+    'UPDATE reviews '
+    'SET language_id = ?, '
+    '    test_type_id = ?, '
+    '    number_answers = ? '
+    'WHERE question_id = ?'
+)
+DELETE_REVIEWS = (
+    'DELETE FROM reviews '
+    'WHERE question_id IN (SELECT value FROM json_each(?))'
+)
+DELETE_ALL_REVIEWS = 'DELETE FROM reviews'
+
+# user stats
+
+USER_STATS_ROW = (
+    'SELECT attempts, answers, right_answers, current_streak, best_streak, '
+    '       last_taken '
+    'FROM user_stats '
+    'WHERE user_id = ? AND language_id = ? AND test_type_id = ?'
+)
+SAVE_USER_STATS = (
+    'INSERT OR REPLACE INTO user_stats '
+    '(user_id, language_id, test_type_id, attempts, answers, '
+    ' right_answers, current_streak, best_streak, last_taken) '
+    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)'
+)
+USER_STATS = (
+    'SELECT '
+    '    l.name, '
+    '    tt.type, '
+    '    us.attempts, '
+    '    us.answers, '
+    '    us.right_answers, '
+    '    us.current_streak, '
+    '    us.best_streak, '
+    '    us.last_taken '
+    'FROM '
+    '    user_stats us '
+    '    JOIN languages l ON l.id = us.language_id '
+    '    JOIN test_types tt ON tt.id = us.test_type_id '
+    'WHERE us.user_id = ? '
+    'ORDER BY l.name, tt.id'
+)
+DELETE_ALL_USER_STATS = 'DELETE FROM user_stats'
+
+# question stats
+
+QUESTION_STATS = (
+    'SELECT '
+    '    q.user_id, '
+    '    q.number_answers, '
+    '    qs.attempts, '
+    '    qs.right_answers, '
+    '    qs.answers '
+    'FROM '
+    '    questions q '
+    '    LEFT JOIN question_stats qs ON qs.question_id = q.id '
+    'WHERE q.id = ?'
+)
+SAVE_QUESTION_STATS = (
+    'INSERT OR REPLACE INTO question_stats '
+    '(question_id, user_id, attempts, right_answers, right_rate, answers) '
+    'VALUES (?, ?, ?, ?, ?, ?)'
+)
+WORST_QUESTIONS = (
+    'SELECT '
+    '    q.question, '
+    '    q.answers, '
+    '    q.right_answer, '
+    '    qs.attempts, '
+    '    qs.right_answers, '
+    '    qs.answers '
+    'FROM '
+    '    question_stats qs '
+    '    JOIN questions q ON q.id = qs.question_id '
+    'WHERE '
+    '    qs.user_id = ? '
+    '    AND qs.attempts >= ? '
+    'ORDER BY qs.right_rate '
+    'LIMIT ?'
+)
+DELETE_QUESTION_STATS = (
+    'DELETE FROM question_stats '
+    'WHERE question_id IN (SELECT value FROM json_each(?))'
+)
+DELETE_ALL_QUESTION_STATS = 'DELETE FROM question_stats'
+
+# processed updates, see core.dedup
+
+SAVE_PROCESSED_UPDATES = (
+    'INSERT OR REPLACE INTO processed_updates '
+    '(slot, position, update_id, user_id, message_id) '
+    'VALUES (?, ?, ?, ?, ?)'
+)
+PROCESSED_UPDATES = (
+    'SELECT position, update_id, user_id, message_id '
+    'FROM processed_updates '
+    'ORDER BY position DESC '
+    'LIMIT ?'
+)
+
+# db state
+
+NUMBER_ROWS: Dict[str, str] = {
+    table: f'SELECT count(*) FROM {table}'
+    for table in ('languages', 'questions', 'roles', 'test_types')
+}
+NUMBER_TABLES = (
+    'SELECT count(*) '
+    'FROM sqlite_master '
+    "WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+)
+DB_VERSION = 'PRAGMA user_version'
+
+# maintenance, see core.maintenance
+
+TABLE_NAMES = (
+    'SELECT name '
+    'FROM sqlite_master '
+    "WHERE type = 'table' AND name NOT LIKE 'sqlite_%' "
+    'ORDER BY name'
+)
+HAS_STAT_TABLE = (
+    'SELECT count(*) '
+    'FROM sqlite_master '
+    "WHERE name = 'sqlite_stat1'"
+)
+# the first number of stat is the number of rows of the table
+ANALYZED_ROWS = (
+    'SELECT tbl, max(CAST(stat AS INTEGER)) '
+    'FROM sqlite_stat1 '
+    'GROUP BY tbl'
+)
+PAGE_SIZE = 'PRAGMA page_size'
+PAGE_COUNT = 'PRAGMA page_count'
+FREELIST_COUNT = 'PRAGMA freelist_count'
+AUTO_VACUUM = 'PRAGMA auto_vacuum'
+OPTIMIZE = 'PRAGMA optimize'
@@ -0,0 +1,149 @@
+import asyncio
+import gzip
+import json
+import logging
+import os.path
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from core.config import (
+    ARCHIVE_DIR,
+    RETENTION_BATCH,
+    RETENTION_DAYS,
+    RETENTION_INTERVAL,
+    RETENTION_MAX_BATCHES
+)
+from core.db import close_connection, delete_attempts, get_old_attempts
+
+
+def archive_attempts(
+        days: int = RETENTION_DAYS,
+        batch_size: int = RETENTION_BATCH,
+        max_batches: Optional[int] = RETENTION_MAX_BATCHES,
+        path: str = ARCHIVE_DIR,
+        now: Optional[float] = None
+) -> Tuple[int, bool]:
+    """
+    Moves attempts older than days to per-month gzipped json lines files,
+    batch_size attempts per transaction, so the db is never locked for
+    long. Reviews and stats are kept, the test generator needs nothing
+    from the archived attempts.
+
+    Returns the number of archived attempts and True if old attempts are
+    left after max_batches.
+    """
+    now = time.time() if now is None else now
+    taken = int(now - days * 24 * 60 * 60)
+    os.makedirs(path, exist_ok=True)
+    archived, batches = 0, 0
+    while max_batches is None or batches < max_batches:
+        rows = get_old_attempts(taken, batch_size)
+        if not rows:
+            return archived, False
+        _write_archive(rows, path)
+        # rows written twice after a crash here are skipped on reading
+        delete_attempts([row[0] for row in rows])
+        archived += len(rows)
+        batches += 1
+    return archived, bool(get_old_attempts(taken, 1))
+
+
+def _write_archive(rows: List[Tuple], path: str) -> None:
+    months: Dict[str, List[str]] = {}
+    for row in rows:
+        month = datetime.fromtimestamp(row[2]).strftime('%Y_%m')
+        months.setdefault(month, []).append(json.dumps(row))
+    for month, lines in months.items():
+        file_path = os.path.join(path, f'attempts_{month}.jsonl.gz')
+        # every append is a new gzip member, gzip reads them as one file
+        with gzip.open(file_path, mode='at', encoding='utf-8') as file:
+            file.write('\n'.join(lines) + '\n')
+
+
+def get_archived_attempts(path: str = ARCHIVE_DIR) -> List[Tuple]:
+    """Returns (id, user_id, taken, question_ids, answers) of archived attempts."""
+    # dbs migrated before attempts ids were AUTOINCREMENT may reuse an id
+    attempts: Dict[Tuple, Tuple] = {}
+    if not os.path.isdir(path):
+        return []
+    for file_name in sorted(os.listdir(path)):
+        if not file_name.startswith('attempts_'):
+            continue
+        with gzip.open(os.path.join(path, file_name), mode='rt', encoding='utf-8') as file:
+            for line in file:
+                row = tuple(json.loads(line))
+                attempts[row[:3]] = row
+    return sorted(attempts.values())
+
+
+def get_archive_report(archived: int, left: bool) -> str:
+    text = f'Архивировано попыток: {archived}.'
+    if left:
+        text = f'{text}\nОстались старые попытки, повторите /archive_attempts.'
+    return text
+
+
+class Archiver:
+    """
+    Runs archive_attempts every interval and when requested by an admin in
+    an executor thread, so the event loop keeps handling updates while up
+    to max_batches batches are moved. The thread works with its own db
+    connection.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._user_id: Optional[int] = None
+        self._running = False
+        self.enabled = False
+
+    def request(self, user_id: Optional[int] = None) -> bool:
+        """Returns False if an archivation is already requested or running."""
+        with self._lock:
+            if self.enabled:
+                return False
+            self._user_id = user_id
+            self.enabled = True
+            return True
+
+    def start(self) -> bool:
+        """Returns True once per request, then run() is to be awaited."""
+        with self._lock:
+            if not self.enabled or self._running:
+                return False
+            self._running = True
+            return True
+
+    async def run(self) -> Tuple[Optional[int], str]:
+        """Returns the admin who asked for it (None if nobody) and the report."""
+        try:
+            result = await asyncio.get_event_loop().run_in_executor(
+                None, _archive_attempts
+            )
+            text = get_archive_report(*result)
+        except Exception:
+            logging.exception('Archivation failed')
+            text = 'Архивация не удалась, подробности в логе.'
+        with self._lock:
+            self._running = self.enabled = False
+            return self._user_id, text
+
+    async def run_periodically(self, interval: int = RETENTION_INTERVAL) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            # skipped while an admin's one is running
+            if self.request() and self.start():
+                _, text = await self.run()
+                logging.info(f'Attempts archivation: {text}')
+
+
+def _archive_attempts() -> Tuple[int, bool]:
+    try:
+        return archive_attempts()
+    finally:
+        close_connection()
+
+
+archiver = Archiver()
@@ -0,0 +1,39 @@
+from typing import NamedTuple, Optional
+
+
+DAY = 24 * 60 * 60
+DEFAULT_EASE = 2.5
+MIN_EASE = 1.3
+
+
+class Review(NamedTuple):
+    """Spaced repetition state of one question for one user (SM-2)."""
+    ease: float
+    interval: float  # days
+    repetitions: int
+    due: float  # unix time
+
+
+def get_next_review(
+        review: Optional[Review], is_right_answer: bool, date: float
+) -> Review:
+    """
+    Returns the review state after the answer given at date.
+
+    A wrong answer makes the question due immediately, right answers
+    push it away by 1 day, 6 days and then by interval * ease.
+    """
+    if review is None:
+        review = Review(DEFAULT_EASE, 0.0, 0, date)
+    if not is_right_answer:
+        ease = max(MIN_EASE, review.ease - 0.2)
+        return Review(ease, 0.0, 0, date)
+    repetitions = review.repetitions + 1
+    if repetitions == 1:
+        interval = 1.0
+    elif repetitions == 2:
+        interval = 6.0
+    else:
+        interval = review.interval * review.ease
+    ease = review.ease + 0.1
+    return Review(ease, interval, repetitions, date + interval * DAY)
@@ -0,0 +1,191 @@
+import asyncio
+import functools
+import io
+import logging
+import time
+from types import SimpleNamespace
+from typing import Dict, Optional, Union
+
+import aiohttp
+from aiogram import Bot
+from aiogram.types import (
+    InputFile,
+    KeyboardButton,
+    ReplyKeyboardMarkup,
+    ReplyKeyboardRemove
+)
+from aiogram.utils import json
+
+from core.config import (
+    HTTP_DNS_CACHE_TTL,
+    HTTP_KEEPALIVE_TIMEOUT,
+    HTTP_POOL_SIZE,
+    HTTP_TIMEOUT,
+    HTTP_UPLOAD_POOL_SIZE,
+    HTTP_UPLOAD_TIMEOUT
+)
+from core.types import Answer, Keyboard
+
+
+class PoolStats:
+    """Requests of one connection pool and the time spent waiting for a free connection."""
+
+    def __init__(self):
+        self.requests = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+
+    def get_trace_config(self) -> aiohttp.TraceConfig:
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(self._on_request_start)
+        trace_config.on_connection_queued_start.append(self._on_queued_start)
+        trace_config.on_connection_queued_end.append(self._on_queued_end)
+        return trace_config
+
+    async def _on_request_start(self, session, context: SimpleNamespace, params) -> None:
+        self.requests += 1
+
+    async def _on_queued_start(self, session, context: SimpleNamespace, params) -> None:
+        context.queued = time.monotonic()
+
+    async def _on_queued_end(self, session, context: SimpleNamespace, params) -> None:
+        self.register_wait(time.monotonic() - context.queued)
+
+    def register_wait(self, wait: float) -> None:
+        self.waits += 1
+        self.wait_time += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    def get_stats(self) -> Dict[str, Union[int, float]]:
+        return {
+            'requests': self.requests,
+            'waits': self.waits,
+            'avg_wait': self.wait_time / self.waits if self.waits else 0.0,
+            'max_wait': self.max_wait,
+        }
+
+
+class PooledBot(Bot):
+    """
+    Bot with an explicitly configured keep-alive connection pool and
+    a DNS cache, see PoolStats for the pool wait metrics.
+    """
+
+    def __init__(
+            self,
+            token: str,
+            pool_size: int = HTTP_POOL_SIZE,
+            timeout: float = HTTP_TIMEOUT,
+            keepalive_timeout: float = HTTP_KEEPALIVE_TIMEOUT,
+            dns_cache_ttl: int = HTTP_DNS_CACHE_TTL,
+            **kwargs
+    ):
+        super().__init__(
+            token,
+            connections_limit=pool_size,
+            timeout=aiohttp.ClientTimeout(total=timeout, connect=min(timeout, 10)),
+            **kwargs
+        )
+        self._connector_init.update(
+            limit_per_host=pool_size,
+            keepalive_timeout=keepalive_timeout,
+            use_dns_cache=True,
+            ttl_dns_cache=dns_cache_ttl,
+        )
+        self.pool_stats = PoolStats()
+
+    def get_new_session(self) -> aiohttp.ClientSession:
+        return aiohttp.ClientSession(
+            connector=self._connector_class(**self._connector_init, loop=self._main_loop),
+            loop=self._main_loop,
+            json_serialize=json.dumps,
+            trace_configs=[self.pool_stats.get_trace_config()]
+        )
+
+
+class TelegramAdapter:
+    """
+    Delivers core answers through the Telegram Bot API.
+
+    The core builds plain Answer objects, aiogram reply markups are
+    rendered here once per distinct keyboard and cached. Documents are
+    downloaded with upload_bot, so large files don't hold connections
+    of the messages pool.
+    """
+
+    def __init__(self, bot: Bot, upload_bot: Optional[Bot] = None, cache_size: int = 256):
+        self._bot = bot
+        self._upload_bot = upload_bot or bot
+        self.get_reply_markup = functools.lru_cache(maxsize=cache_size)(
+            _get_reply_markup
+        )
+
+    @property
+    def bot(self) -> Bot:
+        return self._bot
+
+    async def send(self, user_id: int, answer: Answer) -> None:
+        await self._bot.send_message(
+            chat_id=user_id,
+            text=answer.text,
+            reply_markup=self.get_reply_markup(answer.keyboard)
+        )
+
+    async def send_document(self, user_id: int, path: str, caption: str = '') -> None:
+        # documents go through the uploads pool like downloads
+        with open(path, mode='rb') as file:
+            await self._upload_bot.send_document(
+                chat_id=user_id, document=InputFile(file), caption=caption
+            )
+
+    async def download(self, file_id: str) -> io.BytesIO:
+        return await self._upload_bot.download_file_by_id(file_id)
+
+    async def close(self) -> None:
+        await self._bot.close()
+        if self._upload_bot is not self._bot:
+            await self._upload_bot.close()
+
+    def get_pool_stats(self) -> Dict[str, Dict[str, Union[int, float]]]:
+        return {
+            name: bot.pool_stats.get_stats()
+            for name, bot in (('messages', self._bot), ('uploads', self._upload_bot))
+            if isinstance(bot, PooledBot)
+        }
+
+    async def report_pool_stats(self, interval: int = 600) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            for name, stats in self.get_pool_stats().items():
+                logging.info(
+                    f'HTTP pool {name}: requests: {stats["requests"]}, '
+                    f'waits: {stats["waits"]}, '
+                    f'avg wait: {stats["avg_wait"] * 1000:.1f} ms, '
+                    f'max wait: {stats["max_wait"] * 1000:.1f} ms'
+                )
+
+
+def create_telegram_adapter(
+        token: str, loop: Optional[asyncio.AbstractEventLoop] = None
+) -> TelegramAdapter:
+    bot = PooledBot(token, loop=loop)
+    upload_bot = PooledBot(
+        token,
+        pool_size=HTTP_UPLOAD_POOL_SIZE,
+        timeout=HTTP_UPLOAD_TIMEOUT,
+        loop=loop
+    )
+    return TelegramAdapter(bot, upload_bot)
+
+
+def _get_reply_markup(
+        keyboard: Optional[Keyboard]
+) -> Union[ReplyKeyboardMarkup, ReplyKeyboardRemove]:
+    if keyboard is None:
+        return ReplyKeyboardRemove()
+    return ReplyKeyboardMarkup(
+        resize_keyboard=True,
+        one_time_keyboard=True,
+        row_width=keyboard.row_width
+    ).add(*[KeyboardButton(button) for button in keyboard.buttons])
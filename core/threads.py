@@ -0,0 +1,145 @@
+import argparse
+import asyncio
+import contextvars
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Optional, Sequence, Tuple, Union
+
+from core.config import DISPATCH_THREADS
+from core.db import (
+    close_connection,
+    create_connection,
+    get_current_languages,
+    get_db_path
+)
+from core.dispatcher import SessionsDispatcher
+from core.handlers import (
+    language_test_creator_session_handler,
+    user_session_handler
+)
+from core.init_db import check_db_exists
+from core.types import Answer, CloseSession
+
+
+class DispatcherThreadPool:
+    """
+    Runs SessionsDispatcher.handle_text_message on a thread pool, so db
+    queries and CPU-bound steps don't block the event loop.
+
+    Every thread works with its own db connection (see core.db), the
+    sessions of one user are guarded by SessionsDispatcher locks.
+    With number_threads = 0 messages are handled on the event loop.
+    """
+
+    def __init__(self, dp: SessionsDispatcher, number_threads: int = DISPATCH_THREADS):
+        self._dp = dp
+        self._executor: Optional[ThreadPoolExecutor] = None
+        if number_threads > 0:
+            self._executor = ThreadPoolExecutor(
+                max_workers=number_threads, thread_name_prefix='dispatch'
+            )
+
+    async def handle_text_message(
+            self, user_id: int, text: str, date: datetime
+    ) -> Union[Answer, Tuple[Answer, Answer], Tuple[Answer, CloseSession]]:
+        if self._executor is None:
+            return self._dp.handle_text_message(user_id, text, date)
+        loop = asyncio.get_event_loop()
+        # run_in_executor doesn't copy the update context of core.log
+        return await loop.run_in_executor(
+            self._executor, contextvars.copy_context().run,
+            self._dp.handle_text_message, user_id, text, date
+        )
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+
+def create_benchmark_db(path: str) -> str:
+    """
+    Creates a db in path and connects to it, so benchmarks never touch
+    the bot's db. Returns the db path.
+    """
+    create_connection('benchmark_db', path)
+    # the questions of init_data are owned by the first admin
+    check_db_exists(admins=(1,))
+    return get_db_path()
+
+
+def create_benchmark_dispatcher() -> SessionsDispatcher:
+    dp = SessionsDispatcher()
+    dp.register_handlers(
+        language_test_creator_session_handler,
+        user_session_handler,
+    )
+    return dp
+
+
+def get_benchmark_texts() -> Tuple[str, ...]:
+    """One test of a user: started, the language chosen and reset."""
+    return '/start', '/begin_test', get_current_languages()[0], '/reset'
+
+
+def dispatch_text(dp: SessionsDispatcher, user_id: int, text: str) -> None:
+    """Handles text like the server, the answers are not sent."""
+    answers = dp.handle_text_message(user_id, text, datetime.now())
+    if isinstance(answers, tuple) and any(
+            isinstance(answer, CloseSession) for answer in answers):
+        dp.close_session(user_id)
+
+
+def benchmark_dispatch(
+        dp: SessionsDispatcher,
+        number_threads: int,
+        user_ids: Sequence[int],
+        texts: Sequence[str]
+) -> Dict[str, float]:
+    """
+    Sends texts from every user, users are handled concurrently by
+    number_threads threads, texts of one user in order.
+    Returns the number of updates, seconds and updates per second.
+    """
+    def run_user(user_id: int) -> None:
+        for text in texts:
+            dispatch_text(dp, user_id, text)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=number_threads) as executor:
+        list(executor.map(run_user, user_ids))
+    seconds = time.perf_counter() - started
+    number_updates = len(user_ids) * len(texts)
+    return {
+        'updates': number_updates,
+        'seconds': seconds,
+        'updates_per_second': number_updates / seconds,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Dispatch throughput by the number of threads'
+    )
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--users', type=int, default=200)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as path:
+        create_benchmark_db(path)
+        dp = create_benchmark_dispatcher()
+        texts = get_benchmark_texts()
+        try:
+            for index, number_threads in enumerate(args.threads):
+                # new users every run, so all runs start the same tests
+                user_ids = [(index + 1) * 100000 + i for i in range(args.users)]
+                result = benchmark_dispatch(dp, number_threads, user_ids, texts)
+                print(f'threads: {number_threads}, updates: {result["updates"]}, '
+                      f'{result["seconds"]:.2f} s, '
+                      f'{result["updates_per_second"]:.0f} updates/s')
+        finally:
+            close_connection()
+
+
+if __name__ == '__main__':
+    main()
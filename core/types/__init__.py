@@ -1,3 +1,9 @@
-from .answer import Answer
+from .answer import Answer, Keyboard
 from .language_test import LanguageTest, Question
-from .session import CloseSession, Session, LanguageTestCreatorSession, UserSession
+from .session import (
+    CloseSession,
+    get_session_size,
+    LanguageTestCreatorSession,
+    Session,
+    UserSession
+)
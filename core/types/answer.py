@@ -1,12 +1,32 @@
 from dataclasses import dataclass
-from typing import Union
+from typing import Dict, NamedTuple, Optional, Tuple
 
-from aiogram.types import ReplyKeyboardMarkup, ReplyKeyboardRemove
+
+class Keyboard(NamedTuple):
+    """Reply keyboard, rendered by the transport (see core.telegram)."""
+    buttons: Tuple[str, ...]
+    row_width: int = 3
 
 
 @dataclass(frozen=True)
 class Answer:
     """Structure answer to the user message."""
     text: str
-    keyboard: Union[ReplyKeyboardMarkup,
-                    ReplyKeyboardRemove] = ReplyKeyboardRemove()
+    keyboard: Optional[Keyboard] = None  # None - remove the keyboard
+
+    def to_dict(self) -> Dict:
+        keyboard = self.keyboard
+        return {
+            'text': self.text,
+            'keyboard': None if keyboard is None else {
+                'buttons': list(keyboard.buttons),
+                'row_width': keyboard.row_width,
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Answer':
+        keyboard = data.get('keyboard')
+        if keyboard is not None:
+            keyboard = Keyboard(tuple(keyboard['buttons']), keyboard['row_width'])
+        return cls(text=data['text'], keyboard=keyboard)
@@ -1,29 +1,113 @@
-from dataclasses import dataclass
-from datetime import datetime
-from typing import Optional
+import sys
+import time
+from typing import Any, Iterator, Optional
 
 from .language_test import LanguageTest
 
 
-@dataclass
 class Session:
-    handler_alias: str
-    user_id: int
-    created: datetime
-    current_step: int = 0
+    """
+    Base user session.
+
+    Sessions are slotted: every active chat holds one of them, so the
+    instances carry no __dict__, the handler is referenced by its small int
+    id and the creation time is a monotonic timestamp (see time.monotonic).
+    """
+    __slots__ = ('handler_id', 'user_id', 'created', 'current_step')
+
+    def __init__(
+            self,
+            handler_id: int,
+            user_id: int,
+            created: Optional[float] = None,
+            current_step: int = 0
+    ):
+        self.handler_id = handler_id
+        self.user_id = user_id
+        self.created = time.monotonic() if created is None else created
+        self.current_step = current_step
+
+    def __repr__(self) -> str:
+        fields = ', '.join(f'{name}={getattr(self, name)!r}'
+                           for name in _iter_slots(type(self)))
+        return f'{type(self).__name__}({fields})'
+
+    def __eq__(self, other: Any) -> bool:
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name)
+                   for name in _iter_slots(type(self)))
 
 
-@dataclass
 class UserSession(Session):
-    language_id: Optional[int] = None
-    test_type_id: Optional[int] = None
-    language_test: Optional[LanguageTest] = None
+    __slots__ = ('language_id', 'test_type_id', 'language_test')
+
+    def __init__(
+            self,
+            handler_id: int,
+            user_id: int,
+            created: Optional[float] = None,
+            current_step: int = 0,
+            language_id: Optional[int] = None,
+            test_type_id: Optional[int] = None,
+            language_test: Optional[LanguageTest] = None
+    ):
+        super().__init__(handler_id, user_id, created, current_step)
+        self.language_id = language_id
+        self.test_type_id = test_type_id
+        self.language_test = language_test
 
 
-@dataclass
 class LanguageTestCreatorSession(Session):
-    command: Optional[str] = None
+    __slots__ = ('command', 'number_processed', 'number_missed')
+
+    def __init__(
+            self,
+            handler_id: int,
+            user_id: int,
+            created: Optional[float] = None,
+            current_step: int = 0,
+            command: Optional[str] = None,
+            number_processed: int = 0,
+            number_missed: int = 0
+    ):
+        super().__init__(handler_id, user_id, created, current_step)
+        self.command = command
+        # questions processed / not found by the last handled document
+        self.number_processed = number_processed
+        self.number_missed = number_missed
 
 
 class CloseSession:
-    pass
+    __slots__ = ()
+
+
+def get_session_size(session: Session) -> int:
+    """Returns the approximate number of bytes held by the session."""
+    return _get_deep_size(session, set())
+
+
+def _iter_slots(cls: type) -> Iterator[str]:
+    for klass in reversed(cls.__mro__):
+        yield from getattr(klass, '__slots__', ())
+
+
+def _get_deep_size(obj: Any, seen: set) -> int:
+    # shared objects (small ints, interned strings, None) are counted once
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, int, float, bool)) or obj is None:
+        return size
+    if isinstance(obj, dict):
+        return size + sum(_get_deep_size(key, seen) + _get_deep_size(value, seen)
+                          for key, value in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return size + sum(_get_deep_size(item, seen) for item in obj)
+    if hasattr(obj, '__dict__'):
+        size += _get_deep_size(vars(obj), seen)
+    for name in _iter_slots(type(obj)):
+        if hasattr(obj, name):
+            size += _get_deep_size(getattr(obj, name), seen)
+    return size
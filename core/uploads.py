@@ -0,0 +1,95 @@
+import asyncio
+import contextvars
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+from core.config import UPLOAD_WORKERS, UPLOADS_PER_USER
+from core.types import LanguageTestCreatorSession, Session
+
+
+T = TypeVar('T')
+
+
+class UploadLimitError(Exception):
+    pass
+
+
+class UploadProcessor:
+    """
+    Downloads and processes uploaded documents off the event loop.
+
+    Processing (JSON parsing, validation, db inserts) runs on a bounded
+    thread pool, the number of documents processed at once for one user is
+    limited by per_user_limit.
+    """
+
+    def __init__(
+            self,
+            max_workers: int = UPLOAD_WORKERS,
+            per_user_limit: int = UPLOADS_PER_USER,
+            max_pending: Optional[int] = None
+    ):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='upload'
+        )
+        self._per_user_limit = per_user_limit
+        self._max_pending = max_pending or max_workers * 4
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._users: Dict[int, int] = {}
+
+    def is_busy(self, user_id: int) -> bool:
+        return self._users.get(user_id, 0) >= self._per_user_limit
+
+    async def process(
+            self,
+            user_id: int,
+            download: Callable[[], Awaitable[io.BytesIO]],
+            handle: Callable[[io.BytesIO], T],
+            acknowledge: Optional[Callable[[], Awaitable]] = None
+    ) -> Tuple[T, float]:
+        """
+        Returns result of handle(document) and the elapsed time in seconds.
+        acknowledge is awaited as soon as the document is accepted.
+        """
+        if self.is_busy(user_id):
+            raise UploadLimitError(
+                'Ваш предыдущий документ ещё обрабатывается.\n'
+                'Пожалуйста, дождитесь результата и повторите попытку.'
+            )
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_pending)
+        self._users[user_id] = self._users.get(user_id, 0) + 1
+        try:
+            if acknowledge is not None:
+                await acknowledge()
+            async with self._semaphore:
+                started = time.monotonic()
+                document = await download()
+                loop = asyncio.get_event_loop()
+                # the update context of core.log goes with the document
+                result = await loop.run_in_executor(
+                    self._executor, contextvars.copy_context().run, handle, document
+                )
+                return (result, time.monotonic() - started)
+        finally:
+            self._users[user_id] -= 1
+            if not self._users[user_id]:
+                del self._users[user_id]
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
+
+
+def get_upload_acknowledgement() -> str:
+    return 'Документ получен и обрабатывается. Пожалуйста, подождите.'
+
+
+def get_upload_report(session: Session, elapsed: float) -> str:
+    text = f'Обработка документа завершена за {elapsed:.2f} с.'
+    if isinstance(session, LanguageTestCreatorSession):
+        text = (f'{text}\n'
+                f'Обработано вопросов: {session.number_processed}, '
+                f'не найдено: {session.number_missed}.')
+    return text
@@ -0,0 +1,73 @@
+import asyncio
+import collections
+from typing import Awaitable, Callable, Deque, Dict, Optional, Tuple, TypeVar
+
+from core.config import USER_CONCURRENCY
+
+
+T = TypeVar('T')
+
+
+class UserQueues:
+    """
+    Runs updates of one user one after another in arrival order and
+    updates of different users concurrently, at most max_concurrency
+    at once.
+
+    A user's queue exists only while the user has pending updates, so
+    idle users cost nothing.
+    """
+
+    def __init__(self, max_concurrency: int = USER_CONCURRENCY):
+        self._max_concurrency = max_concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._queues: Dict[int, Deque[Tuple[Callable[[], Awaitable], asyncio.Future]]] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    @property
+    def number_users(self) -> int:
+        """Number of users with pending updates."""
+        return len(self._queues)
+
+    def submit(self, user_id: int, func: Callable[[], Awaitable[T]]) -> asyncio.Future:
+        """Queues func() after the user's pending updates."""
+        loop = asyncio.get_event_loop()
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        future = loop.create_future()
+        if user_id in self._queues:
+            self._queues[user_id].append((func, future))
+        else:
+            self._queues[user_id] = collections.deque([(func, future)])
+            self._tasks[user_id] = loop.create_task(self._drain(user_id))
+        return future
+
+    async def run(self, user_id: int, func: Callable[[], Awaitable[T]]) -> T:
+        return await self.submit(user_id, func)
+
+    async def join(self) -> None:
+        """Waits until all queued updates are processed."""
+        while self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+    async def _drain(self, user_id: int) -> None:
+        queue = self._queues[user_id]
+        try:
+            while queue:
+                func, future = queue[0]
+                async with self._semaphore:
+                    try:
+                        result = await func()
+                    except Exception as e:
+                        if not future.cancelled():
+                            future.set_exception(e)
+                    else:
+                        if not future.cancelled():
+                            future.set_result(result)
+                queue.popleft()
+        finally:
+            # the drain has been cancelled, don't leave callers waiting
+            for _, future in queue:
+                future.cancel()
+            del self._queues[user_id]
+            del self._tasks[user_id]
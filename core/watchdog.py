@@ -0,0 +1,207 @@
+import asyncio
+import contextlib
+import itertools
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import Dict, Iterator, List, NamedTuple, Optional, Union
+
+from core.config import LOOP_LAG_THRESHOLD, SLOW_HANDLER_THRESHOLD
+from core.log import get_dropped_records
+
+
+class LoopLagMonitor:
+    """
+    Measures the event loop lag: how late a sleep of interval seconds
+    wakes up. Lags over threshold mean that something blocks the loop.
+    """
+
+    def __init__(self, interval: float = 0.5, threshold: float = LOOP_LAG_THRESHOLD):
+        self._interval = interval
+        self._threshold = threshold
+        self.samples = 0
+        self.slow = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+
+    async def run(self) -> None:
+        loop = asyncio.get_event_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self._interval)
+            self.register_lag(max(0.0, loop.time() - started - self._interval))
+
+    def register_lag(self, lag: float) -> None:
+        self.samples += 1
+        self.total_lag += lag
+        self.max_lag = max(self.max_lag, lag)
+        if lag > self._threshold:
+            self.slow += 1
+            logging.warning(f'Event loop lag: {lag * 1000:.0f} ms')
+
+    def get_stats(self) -> Dict[str, Union[int, float]]:
+        return {
+            'samples': self.samples,
+            'slow': self.slow,
+            'avg_lag': self.total_lag / self.samples if self.samples else 0.0,
+            'max_lag': self.max_lag,
+        }
+
+
+class Invocation(NamedTuple):
+    name: str
+    user_id: int
+    step: Optional[str]
+    thread_id: int
+    task: Optional[asyncio.Task]
+    started: float
+
+
+def _get_current_task() -> Optional[asyncio.Task]:
+    try:
+        return asyncio.current_task()
+    except RuntimeError:  # no running event loop
+        return None
+
+
+class SlowHandlerWatchdog:
+    """
+    Flags handler invocations running longer than threshold.
+
+    A sampling thread checks the running invocations, so a slow handler
+    is reported while it is still running: with the stack of the blocked
+    thread if it blocks the event loop, otherwise with the stack of its
+    task, where it awaits.
+    """
+
+    def __init__(
+            self,
+            threshold: float = SLOW_HANDLER_THRESHOLD,
+            check_interval: Optional[float] = None
+    ):
+        self._threshold = threshold
+        self._check_interval = check_interval or threshold / 2
+        self._invocations: Dict[int, Invocation] = {}
+        self._reported: set = set()
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.invocations = 0
+        self.slow = 0
+        self.max_duration = 0.0
+        self.samples: List[Dict] = []  # the last slow invocations
+
+    @contextlib.contextmanager
+    def watch(
+            self, name: str, user_id: int, step: Optional[str] = None
+    ) -> Iterator[None]:
+        invocation_id = next(self._ids)
+        invocation = Invocation(
+            name, user_id, step, threading.get_ident(), _get_current_task(),
+            time.monotonic()
+        )
+        with self._lock:
+            self._invocations[invocation_id] = invocation
+        try:
+            yield
+        finally:
+            duration = time.monotonic() - invocation.started
+            with self._lock:
+                del self._invocations[invocation_id]
+                reported = invocation_id in self._reported
+                self._reported.discard(invocation_id)
+                self.invocations += 1
+                self.max_duration = max(self.max_duration, duration)
+            if duration > self._threshold and not reported:
+                # finished between two checks, the stack is gone
+                self._report(invocation, duration, stack=None)
+
+    def start(self) -> None:
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, name='watchdog', daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self._check_interval):
+            self.check()
+
+    def check(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            slow = [
+                (invocation_id, invocation)
+                for invocation_id, invocation in self._invocations.items()
+                if now - invocation.started > self._threshold
+                and invocation_id not in self._reported
+            ]
+            self._reported.update(invocation_id for invocation_id, _ in slow)
+        frames = sys._current_frames()
+        for _, invocation in slow:
+            self._report(
+                invocation, now - invocation.started,
+                _get_stack(invocation, frames)
+            )
+
+    def _report(
+            self, invocation: Invocation, duration: float, stack: Optional[str]
+    ) -> None:
+        sample = {
+            'name': invocation.name,
+            'user_id': invocation.user_id,
+            'step': invocation.step,
+            'duration': duration,
+            'stack': stack,
+        }
+        with self._lock:
+            self.slow += 1
+            self.samples = self.samples[-9:] + [sample]
+        text = (f'Slow {invocation.name}: user {invocation.user_id}, '
+                f'step {invocation.step}, {duration * 1000:.0f} ms')
+        if stack is not None:
+            text = f'{text}\n{stack}'
+        logging.warning(text)
+
+    def get_stats(self) -> Dict[str, Union[int, float]]:
+        return {
+            'invocations': self.invocations,
+            'slow': self.slow,
+            'max_duration': self.max_duration,
+        }
+
+
+def _get_stack(invocation: Invocation, frames: Dict) -> Optional[str]:
+    task = invocation.task
+    # the thread runs another coroutine while the task awaits
+    if task is not None and asyncio.current_task(task.get_loop()) is not task:
+        stack = traceback.StackSummary.extract(
+            (frame, frame.f_lineno) for frame in task.get_stack()
+        )
+        return ''.join(stack.format())
+    frame = frames.get(invocation.thread_id)
+    return None if frame is None else ''.join(traceback.format_stack(frame))
+
+
+async def report_stats(
+        monitor: LoopLagMonitor, watchdog: SlowHandlerWatchdog, interval: int = 600
+) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        lag, handlers = monitor.get_stats(), watchdog.get_stats()
+        logging.info(
+            f'Loop lag: avg {lag["avg_lag"] * 1000:.1f} ms, '
+            f'max {lag["max_lag"] * 1000:.1f} ms, slow {lag["slow"]}; '
+            f'handlers: {handlers["invocations"]}, slow {handlers["slow"]}, '
+            f'max {handlers["max_duration"] * 1000:.0f} ms; '
+            f'dropped log records: {get_dropped_records()}'
+        )
@@ -0,0 +1,213 @@
+import argparse
+import asyncio
+import functools
+import logging
+import multiprocessing
+import os.path
+import tempfile
+import time
+from datetime import datetime
+from typing import (
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Union
+)
+
+from core.db import close_connection, create_connection
+from core.threads import (
+    create_benchmark_db,
+    create_benchmark_dispatcher,
+    dispatch_text,
+    get_benchmark_texts
+)
+
+
+class Update(NamedTuple):
+    """Telegram update forwarded to a worker process."""
+    kind: str  # 'message' or 'document'
+    user_id: int
+    payload: str  # message text or document file id
+    date: datetime
+    update_id: Optional[int] = None
+    message_id: Optional[int] = None
+
+
+class WorkerPool:
+    """
+    Runs N worker processes, each one with its own SessionsDispatcher.
+
+    Updates are routed by user id, so all updates of one user are handled
+    by the same worker and its sessions never leave the process.
+    """
+
+    def __init__(
+            self,
+            number_workers: int,
+            target: Callable[[multiprocessing.Queue, multiprocessing.Value], None]
+    ):
+        if number_workers < 1:
+            raise ValueError('Количество процессов д. б. больше 0')
+        self._number_workers = number_workers
+        self._target = target
+        self._queues: List[multiprocessing.Queue] = []
+        self._counters: List[multiprocessing.Value] = []
+        self._processes: List[multiprocessing.Process] = []
+        self._started: Optional[float] = None
+
+    @property
+    def number_workers(self) -> int:
+        return self._number_workers
+
+    def start(self) -> None:
+        for index in range(self._number_workers):
+            queue = multiprocessing.Queue()
+            counter = multiprocessing.Value('L', 0)
+            process = multiprocessing.Process(
+                target=self._target,
+                args=(queue, counter),
+                name=f'bot-worker-{index}',
+                daemon=True
+            )
+            process.start()
+            self._queues.append(queue)
+            self._counters.append(counter)
+            self._processes.append(process)
+        self._started = time.monotonic()
+
+    def stop(self, timeout: float = 10) -> None:
+        for queue in self._queues:
+            queue.put(None)
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        logging.info(self.get_formatted_stats())
+
+    def route(self, user_id: int) -> int:
+        """Returns index of the worker that owns the user."""
+        return hash(user_id) % self._number_workers
+
+    def put(self, update: Update) -> None:
+        self._queues[self.route(update.user_id)].put(update)
+
+    def get_stats(self) -> Dict[str, Union[float, List[int]]]:
+        elapsed = time.monotonic() - self._started if self._started else 0.0
+        processed = [counter.value for counter in self._counters]
+        return {
+            'elapsed': elapsed,
+            'processed': processed,
+            'updates_per_second': sum(processed) / elapsed if elapsed else 0.0,
+        }
+
+    def get_formatted_stats(self) -> str:
+        stats = self.get_stats()
+        return (f'Workers: {self._number_workers}, '
+                f'processed updates: {stats["processed"]}, '
+                f'throughput: {stats["updates_per_second"]:.2f} updates/s')
+
+    async def report_stats(self, interval: int = 600) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            logging.info(self.get_formatted_stats())
+
+
+async def process_updates(
+        queue: multiprocessing.Queue,
+        counter: multiprocessing.Value,
+        handle_update: Callable[[Update], Awaitable[None]]
+) -> None:
+    """Worker loop: handles updates from the queue until None is received."""
+    loop = asyncio.get_event_loop()
+    while True:
+        update = await loop.run_in_executor(None, queue.get)
+        if update is None:
+            break
+        try:
+            await handle_update(update)
+        except Exception as e:
+            logging.exception(msg=e)
+        with counter.get_lock():
+            counter.value += 1
+
+
+def benchmark_workers(
+        number_workers: int,
+        target: Callable[[multiprocessing.Queue, multiprocessing.Value], None],
+        updates: Sequence[Update],
+        timeout: float = 600
+) -> Dict[str, float]:
+    """
+    Sends updates to number_workers workers running target and waits until
+    all of them are handled. Returns the number of updates, seconds and
+    updates per second.
+    """
+    pool = WorkerPool(number_workers, target)
+    pool.start()
+    try:
+        # the workers are started, so the start up isn't measured
+        started = time.perf_counter()
+        for update in updates:
+            pool.put(update)
+        deadline = time.monotonic() + timeout
+        while sum(pool.get_stats()['processed']) < len(updates):
+            if time.monotonic() > deadline:
+                raise TimeoutError('Обновления не обработаны')
+            time.sleep(0.001)
+        seconds = time.perf_counter() - started
+    finally:
+        pool.stop()
+    return {
+        'updates': len(updates),
+        'seconds': seconds,
+        'updates_per_second': len(updates) / seconds,
+    }
+
+
+def _run_benchmark_worker(
+        db_path: str, queue: multiprocessing.Queue, counter: multiprocessing.Value
+) -> None:
+    create_connection(os.path.basename(db_path), os.path.dirname(db_path))
+    dp = create_benchmark_dispatcher()
+
+    async def handle_update(update: Update) -> None:
+        dispatch_text(dp, update.user_id, update.payload)
+
+    try:
+        asyncio.run(process_updates(queue, counter, handle_update))
+    finally:
+        close_connection()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Throughput by the number of worker processes'
+    )
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--users', type=int, default=200)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as path:
+        # created before the workers start, they only connect to it
+        db_path = create_benchmark_db(path)
+        texts = get_benchmark_texts()
+        close_connection()
+        target = functools.partial(_run_benchmark_worker, db_path)
+        for index, number_workers in enumerate(args.workers):
+            # new users every run, so all runs start the same tests
+            user_ids = [(index + 1) * 100000 + i for i in range(args.users)]
+            updates = [
+                Update('message', user_id, text, datetime.now())
+                for text in texts for user_id in user_ids
+            ]
+            result = benchmark_workers(number_workers, target, updates)
+            print(f'workers: {number_workers}, updates: {result["updates"]}, '
+                  f'{result["seconds"]:.2f} s, '
+                  f'{result["updates_per_second"]:.0f} updates/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+CREATE TABLE IF NOT EXISTS reviews (
+    user_id        INTEGER NOT NULL
+                           REFERENCES users (id) ON DELETE CASCADE,
+    question_id    INTEGER NOT NULL
+                           REFERENCES questions (id) ON DELETE CASCADE,
+    language_id    INTEGER NOT NULL,
+    test_type_id   INTEGER NOT NULL,
+    number_answers INTEGER NOT NULL,
+    ease           REAL    NOT NULL,
+    interval       REAL    NOT NULL,
+    repetitions    INTEGER NOT NULL,
+    due            REAL    NOT NULL,
+    PRIMARY KEY (user_id, question_id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS reviews_due_idx ON reviews (
+    user_id,
+    language_id,
+    test_type_id,
+    number_answers,
+    due
+);
+
+CREATE INDEX IF NOT EXISTS reviews_question_id_idx ON reviews (question_id);
+
+CREATE INDEX IF NOT EXISTS questions_test_idx ON questions (
+    language_id,
+    test_type_id,
+    number_answers
+);
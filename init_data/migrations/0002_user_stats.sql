@@ -0,0 +1,15 @@
+CREATE TABLE IF NOT EXISTS user_stats (
+    user_id        INTEGER NOT NULL
+                           REFERENCES users (id) ON DELETE CASCADE,
+    language_id    INTEGER NOT NULL
+                           REFERENCES languages (id),
+    test_type_id   INTEGER NOT NULL
+                           REFERENCES test_types (id),
+    attempts       INTEGER NOT NULL,
+    answers        INTEGER NOT NULL,
+    right_answers  INTEGER NOT NULL,
+    current_streak INTEGER NOT NULL,
+    best_streak    INTEGER NOT NULL,
+    last_taken     INTEGER NOT NULL,
+    PRIMARY KEY (user_id, language_id, test_type_id)
+) WITHOUT ROWID;
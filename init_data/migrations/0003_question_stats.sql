@@ -0,0 +1,15 @@
+CREATE TABLE IF NOT EXISTS question_stats (
+    question_id   INTEGER PRIMARY KEY
+                          REFERENCES questions (id) ON DELETE CASCADE,
+    user_id       INTEGER NOT NULL
+                          REFERENCES users (id) ON DELETE CASCADE,
+    attempts      INTEGER NOT NULL,
+    right_answers INTEGER NOT NULL,
+    right_rate    REAL    NOT NULL,
+    answers       TEXT    NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS question_stats_right_rate_idx ON question_stats (
+    user_id,
+    right_rate
+);
@@ -0,0 +1,14 @@
+CREATE TABLE IF NOT EXISTS catalog (
+    language_id      INTEGER NOT NULL
+                             REFERENCES languages (id),
+    test_type_id     INTEGER NOT NULL
+                             REFERENCES test_types (id),
+    number_answers   INTEGER NOT NULL,
+    number_questions INTEGER NOT NULL,
+    PRIMARY KEY (language_id, test_type_id, number_answers)
+) WITHOUT ROWID;
+
+INSERT OR REPLACE INTO catalog
+SELECT language_id, test_type_id, number_answers, count(*)
+FROM questions
+GROUP BY language_id, test_type_id, number_answers;
@@ -0,0 +1,3 @@
+ALTER TABLE deep_links ADD COLUMN expires REAL;
+
+CREATE INDEX IF NOT EXISTS deep_links_creator_id_idx ON deep_links (creator_id);
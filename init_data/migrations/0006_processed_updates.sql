@@ -0,0 +1,7 @@
+CREATE TABLE IF NOT EXISTS processed_updates (
+    slot       INTEGER PRIMARY KEY,
+    position   INTEGER NOT NULL,
+    update_id  INTEGER,
+    user_id    INTEGER NOT NULL,
+    message_id INTEGER
+);
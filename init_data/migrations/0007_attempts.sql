@@ -0,0 +1,25 @@
+-- AUTOINCREMENT: ids of archived attempts (see core.retention) are not reused
+CREATE TABLE IF NOT EXISTS attempts (
+    id           INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id      INTEGER NOT NULL
+                         REFERENCES users (id) ON DELETE CASCADE,
+    taken        INTEGER NOT NULL,
+    question_ids TEXT    NOT NULL,
+    answers      TEXT    NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS attempts_user_id_idx ON attempts (user_id, taken);
+
+-- answers of one user with the same date are one attempt,
+-- dates are local time like in core.db._get_timestamp
+INSERT INTO attempts (user_id, taken, question_ids, answers)
+SELECT
+    user_id,
+    CAST(strftime('%s', date, 'utc') AS INTEGER),
+    json_group_array(question_id),
+    json_group_array(answer)
+FROM (SELECT * FROM test_results ORDER BY user_id, date, id)
+GROUP BY user_id, date
+ORDER BY user_id, date;
+
+DROP TABLE test_results;
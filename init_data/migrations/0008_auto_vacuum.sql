@@ -0,0 +1,5 @@
+-- lets core.maintenance return free pages to the file system in chunks.
+-- auto_vacuum of an existing db changes only after VACUUM, which rewrites
+-- the whole file and locks the db, so it is run on demand:
+-- python -m core.maintenance enable_incremental_vacuum
+PRAGMA auto_vacuum = INCREMENTAL;
@@ -0,0 +1,7 @@
+-- found by tests/test_query_plans.py
+CREATE INDEX IF NOT EXISTS questions_user_id_idx ON questions (user_id);
+
+-- core.retention looks for old attempts, nothing looks attempts up by user
+DROP INDEX IF EXISTS attempts_user_id_idx;
+
+CREATE INDEX IF NOT EXISTS attempts_taken_idx ON attempts (taken);
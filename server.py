@@ -1,86 +1,300 @@
 import asyncio
+import functools
+import io
 import logging
+import multiprocessing
 import os.path
-from typing import NoReturn, Sequence, Tuple, Union
+import time
+from typing import NoReturn, Optional, Sequence, Tuple, Union
 
-from aiogram import Bot, types
+from aiogram import types
 from aiogram.contrib.fsm_storage.memory import MemoryStorage
 from aiogram.dispatcher import Dispatcher
 from aiogram.types import ContentType
 from aiogram.utils import executor
 
-from core.config import BASE_DIR, TOKEN
+from core.backup import run_backups
+from core.config import BASE_DIR, DB_NAME, TOKEN, WORKERS
 from core.db import close_connection, create_connection
+from core.dedup import UpdateWindow
 from core.dispatcher import SessionsDispatcher
+from core.flood import AdmissionController
 from core.init_db import check_db_exists
+from core.maintenance import Maintenance
+from core.profiling import get_profile_report, profiler
+from core.retention import archiver
+from core.log import setup_logging, stop_logging, update_context
 from core.handlers import (
     language_test_creator_session_handler,
     user_session_handler
 )
-from core.types import Answer, CloseSession
+from core.telegram import create_telegram_adapter, TelegramAdapter
+from core.types import Answer, CloseSession, LanguageTestCreatorSession
+from core.uploads import (
+    get_upload_acknowledgement,
+    get_upload_report,
+    UploadLimitError,
+    UploadProcessor
+)
+from core.threads import DispatcherThreadPool
+from core.user_queues import UserQueues
+from core.watchdog import LoopLagMonitor, report_stats, SlowHandlerWatchdog
+from core.workers import process_updates, Update, WorkerPool
 
 
-logging.basicConfig(
-    filename=os.path.join(BASE_DIR, 'log.log'),
-    filemode='a',
-    level=logging.INFO,
-    format='[%(levelname)-8s] [%(filename)-18s] [%(asctime)s] [%(message)s]',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
+setup_logging()
 
 
-dp = SessionsDispatcher()
-dp.register_handlers(
-    language_test_creator_session_handler,
-    user_session_handler,
-)
+def _create_sessions_dispatcher() -> SessionsDispatcher:
+    sd = SessionsDispatcher()
+    sd.register_handlers(
+        language_test_creator_session_handler,
+        user_session_handler,
+    )
+    return sd
+
+
+dp = _create_sessions_dispatcher()
 loop = asyncio.get_event_loop()
 loop.create_task(dp.close_old_sessions())
-bot = Bot(token=TOKEN)
+telegram = create_telegram_adapter(TOKEN, loop)
+bot = telegram.bot
 dispatcher = Dispatcher(bot, storage=MemoryStorage(), loop=loop)
+uploads = UploadProcessor()
+user_queues = UserQueues()
+admission = AdmissionController()
+processed_updates = UpdateWindow()
+dispatch = DispatcherThreadPool(dp)
+workers: Optional[WorkerPool] = None
+loop_monitor = LoopLagMonitor()
+watchdog = SlowHandlerWatchdog()
+maintenance = Maintenance()
 
 
 @dispatcher.message_handler()
 async def process_message(message: types.Message) -> None:
-    answers = dp.handle_text_message(
-        message.from_user.id, message.text, message.date
-    )
-    await _process_answers(message.from_user.id, answers)
+    await _put_update(Update(
+        'message', message.from_user.id, message.text, message.date,
+        _get_update_id(), message.message_id
+    ))
 
 
 @dispatcher.message_handler(content_types=ContentType.DOCUMENT)
 async def process_document(message: types.Message) -> None:
-    document = await bot.download_file_by_id(message.document.file_id)
-    answers = dp.handle_document(message.from_user.id, document)
-    await _process_answers(message.from_user.id, answers)
+    await _put_update(Update(
+        'document', message.from_user.id, message.document.file_id,
+        message.date, _get_update_id(), message.message_id
+    ))
+
+
+async def _put_update(update: Update) -> None:
+    # a redelivered answer must not advance the test twice
+    if processed_updates.is_duplicate(
+            update.update_id, update.user_id, update.message_id):
+        logging.info(f'Duplicate update skipped: {update.update_id}')
+        return
+    # flood control goes before any db access
+    if not await admission.admit(update.user_id):
+        return
+    if workers is not None:
+        workers.put(update)
+        return
+    # updates of one user are handled in order, see UserQueues
+    await user_queues.run(update.user_id, functools.partial(
+        _handle_update, telegram, dispatch, dp, uploads, watchdog, update,
+        time.monotonic()
+    ))
+
+
+async def _handle_update(
+        _telegram: TelegramAdapter,
+        _dispatch: DispatcherThreadPool,
+        _dp: SessionsDispatcher,
+        _uploads: UploadProcessor,
+        _watchdog: SlowHandlerWatchdog,
+        update: Update,
+        received: float
+) -> None:
+    user_id = update.user_id
+    name = f'process_{update.kind}'
+    with update_context(update.update_id, user_id, received), _watchdog.watch(
+            name, user_id, _dp.get_step_alias(user_id)):
+        if update.kind == 'document':
+            await _handle_document(
+                _telegram, _dp, _uploads, user_id, update.payload
+            )
+        else:
+            answers = await _dispatch.handle_text_message(
+                user_id, update.payload, update.date
+            )
+            await _process_answers(_telegram, _dp, user_id, answers)
+        logging.info(f'Update handled: {update.kind}')
+    # nothing but these checks while no profile or archivation is requested
+    if profiler.enabled:
+        await _poll_profiler(_telegram)
+    if archiver.enabled and archiver.start():
+        asyncio.ensure_future(_run_archiver(_telegram))
+
 
+async def _poll_profiler(_telegram: TelegramAdapter, update: bool = True) -> None:
+    running = profiler.running
+    result = profiler.poll(update)
+    if not running and profiler.running:
+        # stops the profile in time if no updates come
+        asyncio.get_event_loop().call_later(
+            profiler.seconds,
+            lambda: asyncio.ensure_future(_poll_profiler(_telegram, False))
+        )
+    if result is not None:
+        logging.info(f'Profile written: {result.path}')
+        await _telegram.send(result.user_id, Answer(text=get_profile_report(result)))
+        await _telegram.send_document(result.user_id, result.path)
 
-async def _process_answers(user_id: int, answers: Union[Answer, Tuple]) -> None:
+
+async def _run_archiver(_telegram: TelegramAdapter) -> None:
+    user_id, text = await archiver.run()
+    if user_id is not None:
+        await _telegram.send(user_id, Answer(text=text))
+
+
+def _get_update_id() -> Optional[int]:
+    update = types.Update.get_current()
+    return None if update is None else update.update_id
+
+
+async def _handle_document(
+        _telegram: TelegramAdapter,
+        _dp: SessionsDispatcher,
+        _uploads: UploadProcessor,
+        user_id: int,
+        file_id: str
+) -> None:
+    session = _dp.get_session(user_id)
+    # only test creators upload documents, others get the handler's answer
+    # without a download
+    if not isinstance(session, LanguageTestCreatorSession):
+        answers = _dp.handle_document(user_id, io.BytesIO())
+        await _process_answers(_telegram, _dp, user_id, answers)
+        return
+    try:
+        answers, elapsed = await _uploads.process(
+            user_id,
+            functools.partial(_telegram.download, file_id),
+            functools.partial(_dp.handle_document, user_id),
+            functools.partial(
+                _telegram.send, user_id,
+                Answer(text=get_upload_acknowledgement())
+            )
+        )
+    except UploadLimitError as e:
+        await _telegram.send(user_id, Answer(text=str(e)))
+        return
+    await _process_answers(_telegram, _dp, user_id, answers)
+    await _telegram.send(
+        user_id, Answer(text=get_upload_report(session, elapsed))
+    )
+
+
+async def _process_answers(
+        _telegram: TelegramAdapter,
+        _dp: SessionsDispatcher,
+        user_id: int,
+        answers: Union[Answer, Tuple]
+) -> None:
     if isinstance(answers, Answer):
-        await _send_answer(user_id, answers)
+        await _telegram.send(user_id, answers)
     elif isinstance(answers, Sequence):
         for answer in answers:
             if isinstance(answer, Answer):
-                await _send_answer(user_id, answer)
+                await _telegram.send(user_id, answer)
             elif isinstance(answer, CloseSession):
-                dp.close_session(user_id)
+                _dp.close_session(user_id)
 
 
-async def _send_answer(user_id: int, answer: Answer) -> None:
-    await bot.send_message(
-        chat_id=user_id,
-        text=answer.text,
-        reply_markup=answer.keyboard
-    )
+def _run_worker(
+        queue: multiprocessing.Queue, counter: multiprocessing.Value
+) -> None:
+    """Worker process entry point, see core.workers.WorkerPool."""
+    # every worker writes its own log file, a rotated file can't be shared
+    setup_logging(os.path.join(
+        BASE_DIR, f'log.{multiprocessing.current_process().name}.log'
+    ))
+    create_connection(DB_NAME)
+    worker_loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(worker_loop)
+    worker_telegram = create_telegram_adapter(TOKEN, worker_loop)
+    worker_dp = _create_sessions_dispatcher()
+    worker_uploads = UploadProcessor()
+    worker_queues = UserQueues()
+    worker_dispatch = DispatcherThreadPool(worker_dp)
+    worker_loop.create_task(worker_dp.close_old_sessions())
+    worker_loop.create_task(worker_telegram.report_pool_stats())
+    worker_monitor, worker_watchdog = LoopLagMonitor(), SlowHandlerWatchdog()
+    worker_watchdog.start()
+    worker_loop.create_task(worker_monitor.run())
+    worker_loop.create_task(report_stats(worker_monitor, worker_watchdog))
+
+    async def handle_update(update: Update) -> None:
+        # returns at once, so different users are handled concurrently
+        future = worker_queues.submit(update.user_id, functools.partial(
+            _handle_update, worker_telegram, worker_dispatch, worker_dp,
+            worker_uploads, worker_watchdog, update, time.monotonic()
+        ))
+        future.add_done_callback(_log_update_error)
+
+    try:
+        worker_loop.run_until_complete(
+            process_updates(queue, counter, handle_update)
+        )
+    finally:
+        worker_loop.run_until_complete(worker_queues.join())
+        worker_uploads.shutdown()
+        worker_dispatch.shutdown()
+        worker_watchdog.stop()
+        worker_loop.run_until_complete(worker_telegram.close())
+        close_connection()
+        stop_logging()
+
+
+def _log_update_error(future: asyncio.Future) -> None:
+    if not future.cancelled() and future.exception() is not None:
+        logging.error('Update failed', exc_info=future.exception())
 
 
 async def on_shutdown(_):
+    uploads.shutdown()
+    dispatch.shutdown()
+    watchdog.stop()
+    await telegram.close()
+    if workers is not None:
+        workers.stop()
+    processed_updates.flush()
     close_connection()
+    stop_logging()
 
 
 def main() -> NoReturn:
-    create_connection('language_bot_db.db')
+    global workers
+    create_connection(DB_NAME)
     check_db_exists()
+    processed_updates.load()
+    loop.create_task(processed_updates.run_flush())
+    if WORKERS > 1:
+        # the polling process only routes updates and saves processed_updates,
+        # workers own the rest of the db
+        close_connection()
+        workers = WorkerPool(WORKERS, _run_worker)
+        workers.start()
+        loop.create_task(workers.report_stats())
+    else:
+        loop.create_task(telegram.report_pool_stats())
+        watchdog.start()
+        loop.create_task(loop_monitor.run())
+        loop.create_task(report_stats(loop_monitor, watchdog))
+    loop.create_task(admission.report_stats())
+    loop.create_task(maintenance.run())
+    loop.create_task(run_backups())
+    loop.create_task(archiver.run_periodically())
     executor.start_polling(
         dispatcher, skip_updates=True, timeout=60, on_shutdown=on_shutdown
     )
@@ -1,6 +1,6 @@
+import io
 import json
 import os
-from datetime import datetime
 
 import pytest
 
@@ -15,12 +15,8 @@ from core.types import LanguageTestCreatorSession
 
 
 @pytest.fixture(scope='function')
-def language_test_creator_session():
-    return LanguageTestCreatorSession(
-        'language_test_creator_session_handler',
-        1,
-        datetime.now()
-    )
+def language_test_creator_session(language_test_creator_session_handler):
+    return language_test_creator_session_handler.get_data_class(1)
 
 
 @pytest.fixture(scope='function')
@@ -89,3 +85,33 @@ def test_delete_questions(
     _session = _update_step(language_test_creator_session, 'delete_questions')
     _ = language_test_creator_session_handler.handle_session(_session, question)
     assert question not in get_all_questions(1)
+
+
+def test_update_questions(
+        language_test_creator_session_handler,
+        language_test_creator_session
+):
+    language_test = {
+        'language': 'ENG',
+        'test_type': 1,
+        'questions': [
+            {
+                'question': 'Update ___ test.',
+                'answers': ['answer1', 'answer2'],
+                'right_answer': 'answer1'
+            },
+        ]
+    }
+    language_id = get_language_id(language_test['language'], 'code')
+    values = generate_questions_values(
+        1, language_id, 1, language_test['questions']
+    )
+    insert_questions(values)
+    question_id = get_all_questions(1)['Update ___ test.']
+    language_test['questions'][0]['right_answer'] = 'answer2'
+    file = io.BytesIO(json.dumps(language_test).encode('utf-8'))
+    _session = _update_step(language_test_creator_session, 'update_questions')
+    answer, _ = language_test_creator_session_handler.handle_session(_session, file)
+    assert answer.text == 'Все вопросы были успешно обновлены!'
+    assert get_all_questions(1)['Update ___ test.'] == question_id
+    assert (_session.number_processed, _session.number_missed) == (1, 0)
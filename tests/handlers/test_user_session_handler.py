@@ -1,13 +1,11 @@
-from datetime import datetime
-
 import pytest
-from aiogram.types import ReplyKeyboardMarkup
 
 from core.handlers import SessionHandler
 from core.handlers.user_session_handler import _get_fmt_wrong_answers
 from core.types import (
     Answer,
     CloseSession,
+    Keyboard,
     UserSession
 )
 
@@ -27,12 +25,8 @@ answers = {
 
 
 @pytest.fixture(scope='function')
-def user_session():
-    return UserSession(
-        'user_session_handler',
-        1,
-        datetime.now()
-    )
+def user_session(user_session_handler):
+    return user_session_handler.get_data_class(1)
 
 
 def _update_step(
@@ -53,7 +47,7 @@ def _test_select_language(user_session_handler, user_session, values):
     answer = user_session_handler.handle_session(user_session, message)
     assert isinstance(answer, Answer)
     assert answer.text == result
-    assert isinstance(answer.keyboard, ReplyKeyboardMarkup)
+    assert isinstance(answer.keyboard, Keyboard)
 
 
 @pytest.mark.parametrize(
@@ -66,14 +60,14 @@ def _test_select_test_type(user_session_handler, user_session, values):
     answer = user_session_handler.handle_session(user_session, message)
     assert isinstance(answer, Answer)
     assert answer.text == result
-    assert isinstance(answer.keyboard, ReplyKeyboardMarkup)
+    assert isinstance(answer.keyboard, Keyboard)
 
 
 def test_select_language(user_session_handler, user_session):
     answer = user_session_handler.handle_session(user_session, 'English')
     assert isinstance(answer, Answer)
     assert answer.text == 'Выберите один из доступных типов теста.'
-    assert isinstance(answer.keyboard, ReplyKeyboardMarkup)
+    assert isinstance(answer.keyboard, Keyboard)
 
 
 def test_select_test_type(user_session_handler, user_session):
@@ -102,7 +96,7 @@ def _test_language_test_execution(user_session_handler, user_session, message):
     number_answers = user_session.language_test.number_answers
     assert isinstance(answer, Answer)
     assert answer.text == f'Ответ д. б. в диапазоне от 1 до {number_answers}'
-    assert isinstance(answer.keyboard, ReplyKeyboardMarkup)
+    assert isinstance(answer.keyboard, Keyboard)
 
 
 def test_language_test_execution_r(user_session_handler, user_session):
@@ -116,7 +110,7 @@ def test_language_test_execution_r(user_session_handler, user_session):
         answer = user_session_handler.handle_session(user_session, message)
         if number < number_questions - 1:
             assert isinstance(answer, Answer)
-            assert isinstance(answer.keyboard, ReplyKeyboardMarkup)
+            assert isinstance(answer.keyboard, Keyboard)
         else:
             assert isinstance(answer, tuple)
             assert isinstance(answer[0], Answer)
@@ -142,7 +136,7 @@ def test_language_test_execution_w(user_session_handler, user_session):
         answer = user_session_handler.handle_session(user_session, message)
         if number < number_questions - 1:
             assert isinstance(answer, Answer)
-            assert isinstance(answer.keyboard, ReplyKeyboardMarkup)
+            assert isinstance(answer.keyboard, Keyboard)
         else:
             assert isinstance(answer, tuple)
             assert isinstance(answer[0], Answer)
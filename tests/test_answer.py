@@ -0,0 +1,17 @@
+import json
+
+import pytest
+
+from core.keyboard import get_keyboard
+from core.types import Answer
+
+
+@pytest.mark.parametrize(
+    'answer',
+    (
+        Answer(text='text'),
+        Answer(text='text', keyboard=get_keyboard([1, 2, 3, 4], row_width=2)),
+    )
+)
+def test_answer_serialization(answer):
+    assert Answer.from_dict(json.loads(json.dumps(answer.to_dict()))) == answer
@@ -0,0 +1,111 @@
+import os.path
+import sqlite3
+import threading
+from datetime import datetime
+
+import pytest
+
+from core.backup import (
+    BackupError,
+    create_snapshot,
+    get_snapshots,
+    restore_snapshot,
+    verify_snapshot
+)
+from core.db import get_db_path, get_number_tables
+
+
+def _create_db(path: str) -> str:
+    db_path = os.path.join(path, 'db.db')
+    connection = sqlite3.connect(db_path)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('CREATE TABLE t (id INTEGER PRIMARY KEY, value TEXT)')
+    connection.executemany(
+        'INSERT INTO t (value) VALUES (?)', [('x' * 1000,)] * 500
+    )
+    connection.commit()
+    connection.close()
+    return db_path
+
+
+def _count_rows(db_path: str) -> int:
+    connection = sqlite3.connect(db_path)
+    number = connection.execute('SELECT count(*) FROM t').fetchone()[0]
+    connection.close()
+    return number
+
+
+def test_create_snapshot(tmpdir):
+    db_path = _create_db(tmpdir)
+    backups = os.path.join(tmpdir, 'backups')
+    snapshot = create_snapshot(db_path, backups, pages=16, sleep=0)
+    assert snapshot.pages > 16
+    assert verify_snapshot(snapshot.path)
+    assert _count_rows(snapshot.path) == 500
+
+    with open(snapshot.path, mode='ab') as file:
+        file.write(b'corrupted')
+    assert not verify_snapshot(snapshot.path)
+
+
+def test_create_snapshot_while_writing(tmpdir):
+    db_path = _create_db(tmpdir)
+    stopped = threading.Event()
+
+    def write():
+        writer = sqlite3.connect(db_path)
+        while not stopped.is_set():
+            writer.execute("INSERT INTO t (value) VALUES ('y')")
+            writer.commit()
+        writer.close()
+
+    thread = threading.Thread(target=write)
+    thread.start()
+    try:
+        snapshot = create_snapshot(
+            db_path, os.path.join(tmpdir, 'backups'), pages=4, sleep=0.001
+        )
+    finally:
+        stopped.set()
+        thread.join()
+    connection = sqlite3.connect(snapshot.path)
+    assert connection.execute('PRAGMA integrity_check').fetchone() == ('ok',)
+    connection.close()
+    assert _count_rows(snapshot.path) >= 500
+
+
+def test_delete_old_snapshots(tmpdir):
+    db_path = _create_db(tmpdir)
+    backups = os.path.join(tmpdir, 'backups')
+    for day in range(1, 5):
+        now = datetime(2021, 1, day).timestamp()
+        create_snapshot(db_path, backups, keep=2, now=now)
+    snapshots = get_snapshots(backups)
+    assert [os.path.basename(i) for i in snapshots] == [
+        'db_20210103_000000.db', 'db_20210104_000000.db'
+    ]
+    assert len(os.listdir(backups)) == 4
+
+
+def test_restore_snapshot(tmpdir):
+    db_path = _create_db(tmpdir)
+    snapshot = create_snapshot(db_path, os.path.join(tmpdir, 'backups'))
+    connection = sqlite3.connect(db_path)
+    connection.execute('DELETE FROM t')
+    connection.commit()
+    connection.close()
+
+    restore_snapshot(snapshot.path, db_path)
+    assert _count_rows(db_path) == 500
+
+    os.remove(f'{snapshot.path}.sha256')
+    with pytest.raises(BackupError):
+        restore_snapshot(snapshot.path, db_path)
+
+
+def test_create_snapshot_of_bot_db(tmpdir):
+    snapshot = create_snapshot(path=tmpdir)
+    assert os.path.basename(snapshot.path).startswith(
+        os.path.splitext(os.path.basename(get_db_path()))[0]
+    )
+    assert get_number_tables() > 0
@@ -5,29 +5,44 @@ import pytest
 
 from core.db import (
     add_new_user,
+    create_deep_links,
     delete_questions,
-    _generate_language_test,
+    delete_user_questions,
     generate_questions_values,
     get_all_languages,
     get_all_questions,
     get_all_test_types,
+    _get_attempts,
+    get_catalog,
     get_current_languages,
+    get_formatted_user_stats,
+    get_formatted_worst_questions,
     get_language_id,
     get_language_test,
     get_number_languages,
     get_number_test_types,
     get_role_id,
+    get_statement_cache_stats,
+    incremental_vacuum,
     get_test_type_id,
     get_test_types,
-    _get_user_answers,
+    _get_review,
     get_user_role,
+    get_user_stats,
+    get_worst_questions,
     insert_questions,
+    insert_user_answers,
     is_new_user,
     is_supported_language,
     is_supported_test_type,
     _is_valid_deep_link,
     normalize_question,
+    rebuild_question_stats,
+    rebuild_reviews,
+    rebuild_user_stats,
+    _redeem_deep_link,
     _register_deep_link,
+    update_questions,
     update_user_role
 )
 
@@ -58,31 +73,6 @@ def test_delete_questions(random_language_test):
     assert question not in get_all_questions(1)
 
 
-@pytest.mark.parametrize(
-    'ids, eq, result',
-    (
-        (
-            [1, 2],
-            True,
-            [
-                (1, "The moon wouldn't ___ so beautiful.", 'have looked\nhave been looking\nlook\nam looking', 0),
-                (2, 'He must ___ all along.', 'have been knowing\nare knowing\nknow\nhave known', 3),
-            ],
-        ),
-        (
-            [1, 2],
-            False,
-            [
-                (3, 'They seem ___ by some kind of an instrument.', 'to make\nto have been made\nto have made\nto be made', 1),
-            ],
-        ),
-    )
-)
-def test_generate_language_test(ids, eq, result):
-    language_test = _generate_language_test(10, 1, 4, 10, ids, eq)
-    assert sorted(language_test, key=lambda x: x[0]) == result
-
-
 def test_get_all_languages():
     assert len(get_all_languages()) == get_number_languages()
 
@@ -129,6 +119,127 @@ def test_get_language_test():
     assert sorted(language_test, key=lambda x: x[0]) == result
 
 
+def test_get_language_test_order():
+    user_id = 201
+    questions = get_language_test(user_id, 10, 1, 4, 10)
+    assert len(questions) >= 3
+    right, wrong, *new = questions
+    date = '2021-01-01 12:00:00'
+    insert_user_answers([
+        (user_id, right[0], right[3], date),
+        (user_id, wrong[0], (wrong[3] + 1) % 4, date),
+    ])
+    now = datetime(2021, 1, 1, 12, 0, 1).timestamp()
+    # wrong answer is due, then the new question, then the right answer
+    language_test = get_language_test(user_id, 10, 1, 4, 10, now)
+    assert language_test[0] == wrong
+    assert sorted(language_test[1:-1]) == sorted(new)
+    assert language_test[-1] == right
+    assert get_language_test(user_id, 10, 1, 4, 1, now) == [wrong]
+
+
+def test_rebuild_reviews():
+    user_id = 202
+    question = get_language_test(user_id, 10, 1, 4, 1)[0]
+    insert_user_answers([
+        (user_id, question[0], question[3], '2021-01-01 12:00:00'),
+        (user_id, question[0], question[3], '2021-01-02 12:00:00'),
+    ])
+    review = _get_review(user_id, question[0])
+    assert review.repetitions == 2
+    rebuild_reviews()
+    assert _get_review(user_id, question[0]) == review
+
+
+def test_get_user_stats():
+    user_id = 203
+    assert get_user_stats(user_id) == []
+    questions = get_language_test(user_id, 10, 1, 4, 3)
+    right, wrong, last_right = questions
+    insert_user_answers([
+        (user_id, right[0], right[3], '2021-01-01 12:00:00'),
+        (user_id, wrong[0], (wrong[3] + 1) % 4, '2021-01-01 12:00:00'),
+        (user_id, last_right[0], last_right[3], '2021-01-01 12:00:01'),
+    ])
+    insert_user_answers([
+        (user_id, right[0], right[3], '2021-01-02 12:00:00'),
+    ])
+    user_stats = get_user_stats(user_id)
+    assert len(user_stats) == 1
+    language, test_type, *counters, last_taken = user_stats[0]
+    assert (language, test_type) == ('English', 'Тест по грамматике.')
+    assert counters == [2, 4, 3, 2, 2]
+    assert last_taken == int(datetime(2021, 1, 2, 12, 0, 0).timestamp())
+    assert 'Пройдено тестов: 2' in get_formatted_user_stats(user_id)
+
+    # the replay counts the same attempts
+    rebuild_user_stats()
+    assert get_user_stats(user_id) == user_stats
+
+
+def test_insert_user_answers_attempts():
+    user_id = 204
+    questions = get_language_test(user_id, 10, 1, 4, 2)
+    values = [
+        (user_id, questions[0][0], 1, '2021-01-01 12:00:00'),
+        (user_id, questions[1][0], 2, '2021-01-01 12:00:01'),
+    ]
+    insert_user_answers(values)
+    # one row per test, answers are restored in order
+    attempts = [i for i in _get_attempts() if i[0][0] == user_id]
+    assert attempts == [[(*value[:3], '2021-01-01 12:00:01') for value in values]]
+
+
+def test_get_worst_questions(random_language_test):
+    creator_id = 2
+    language_id = get_language_id(random_language_test['language'], 'code')
+    random_language_test['questions'].append(
+        {**random_language_test['questions'][0], 'question': 'Second ___.'}
+    )
+    values = generate_questions_values(
+        creator_id, language_id, 1, random_language_test['questions']
+    )
+    insert_questions(values)
+    questions = get_all_questions(creator_id)
+    first = questions[values[0][3]]
+    second = questions['Second ___.']
+    date = '2021-01-01 12:00:00'
+    insert_user_answers([(3, first, 0, date), (3, second, 0, date)])
+    insert_user_answers([(3, first, 2, date), (3, second, 0, date)])
+    insert_user_answers([(3, first, 2, date)])
+
+    worst_questions = get_worst_questions(creator_id, min_attempts=1)
+    assert [i[0] for i in worst_questions] == [values[0][3], 'Second ___.']
+    assert worst_questions[0][3:] == (3, 1, [1, 0, 2, 0])
+    assert worst_questions[1][3:] == (2, 2, [2, 0, 0, 0])
+    assert get_worst_questions(creator_id, limit=1, min_attempts=1) == worst_questions[:1]
+    assert get_worst_questions(creator_id, min_attempts=3) == worst_questions[:1]
+    assert 'answer3 - 2' in get_formatted_worst_questions(creator_id, min_attempts=1)
+
+    rebuild_question_stats()
+    assert get_worst_questions(creator_id, min_attempts=1) == worst_questions
+    delete_questions([first, second])
+    assert get_worst_questions(creator_id, min_attempts=1) == []
+
+
+def test_get_statement_cache_stats():
+    get_number_languages()
+    is_new_user(1)
+    before = get_statement_cache_stats()
+    for _ in range(3):
+        get_number_languages()
+        is_new_user(1)
+    after = get_statement_cache_stats()
+    assert after['hits'] - before['hits'] == 6
+    assert after['misses'] == before['misses']
+    assert 0 < after['hit_rate'] <= 1
+
+    # statements with identifiers in the text are counted too
+    incremental_vacuum(1)
+    incremental_vacuum(1)
+    assert get_statement_cache_stats()['hits'] - after['hits'] == 1
+
+
 def test_get_role_id():
     assert all(
         get_role_id(role) == index
@@ -147,22 +258,6 @@ def test_get_test_types():
     assert get_test_types(get_language_id('English')) == result
 
 
-@pytest.mark.parametrize(
-    'user_id, language_id, test_type_id, number_answers, eq, result',
-    (
-        (1, 10, 1, 4, True, [1, 2, ]),
-        (1, 10, 1, 4, False, [3, ]),
-        (2, 10, 1, 4, True, []),
-        (2, 10, 1, 4, False, [1, 2, 3, ]),
-    )
-)
-def test_get_user_answers(
-        user_id, language_id, test_type_id, number_answers, eq, result
-):
-    answers = _get_user_answers(user_id, language_id, test_type_id, number_answers, eq)
-    assert answers == result
-
-
 def test_get_user_role():
     assert get_user_role(1, 'role') == 'admin'
     assert get_user_role(1, 'id') == 1
@@ -222,3 +317,98 @@ def test_update_user_role():
     update_user_role(user_id, datetime.now(), deep_link)
     assert get_user_role(user_id) == 'test_creator'
     assert not _is_valid_deep_link(deep_link)
+
+
+def test_redeem_deep_link():
+    deep_link = str(uuid4())
+    _register_deep_link(1, deep_link, 'test_creator')
+    assert _redeem_deep_link(102, datetime.now(), deep_link) == 'test_creator'
+    # the link has already been redeemed
+    assert _redeem_deep_link(103, datetime.now(), deep_link) is None
+    expired_link = str(uuid4())
+    _register_deep_link(1, expired_link, 'test_creator', expires=0)
+    assert not _is_valid_deep_link(expired_link)
+    assert _redeem_deep_link(103, datetime.now(), expired_link) is None
+    assert _redeem_deep_link(103, datetime.now(), str(uuid4())) is None
+
+
+def test_create_deep_links():
+    deep_links = create_deep_links(1, 3)
+    assert len(set(deep_links)) == 3
+    assert all(_is_valid_deep_link(i.rsplit('=', 1)[1]) for i in deep_links)
+
+
+def test_catalog(random_language_test):
+    language_id = get_language_id(random_language_test['language'], 'code')
+    key = (language_id, 3, 4)
+    number_questions = get_catalog().get(key, 0)
+    values = generate_questions_values(
+        1, language_id, 3, random_language_test['questions']
+    )
+    insert_questions(values)
+    assert get_catalog()[key] == number_questions + 1
+    assert 'Тест по глаголам.' in get_test_types(language_id)
+    delete_questions([get_all_questions(1)[values[0][3]], ])
+    assert get_catalog().get(key, 0) == number_questions
+    assert 'Тест по глаголам.' not in get_test_types(language_id)
+
+
+def test_delete_user_questions(random_language_test):
+    language_id = get_language_id(random_language_test['language'], 'code')
+    values = generate_questions_values(
+        1, language_id, 1, random_language_test['questions']
+    )
+    insert_questions(values)
+    question = values[0][3]
+    assert delete_user_questions(2, [question, ]) == {question: False}
+    assert question in get_all_questions(1)
+    statuses = delete_user_questions(1, [question, 'Missed ___.'])
+    assert statuses == {question: True, 'Missed ___.': False}
+    assert question not in get_all_questions(1)
+
+
+def test_update_questions(random_language_test):
+    language_id = get_language_id(random_language_test['language'], 'code')
+    values = generate_questions_values(
+        1, language_id, 1, random_language_test['questions']
+    )
+    insert_questions(values)
+    question = values[0][3]
+    question_id = get_all_questions(1)[question]
+    insert_user_answers([(3, question_id, 0, '2021-01-01 12:00:00')])
+    catalog = get_catalog()
+
+    random_language_test['questions'][0]['answers'].append('answer5')
+    new_values = generate_questions_values(
+        1, language_id, 2, random_language_test['questions']
+    )
+    statuses = update_questions(1, [*new_values, (1, language_id, 2, 'Missed ___.', 'a\nb', 2, 0)])
+    assert statuses == {question: True, 'Missed ___.': False}
+    assert get_all_questions(1)[question] == question_id
+    assert _get_review(3, question_id) is not None
+    new_catalog = get_catalog()
+    assert new_catalog.get((language_id, 1, 4), 0) == catalog[(language_id, 1, 4)] - 1
+    assert new_catalog[(language_id, 2, 5)] == catalog.get((language_id, 2, 5), 0) + 1
+    assert get_language_test(3, language_id, 2, 5, 10)[0][0] == question_id
+
+
+def test_update_questions_repeated(random_language_test):
+    language_id = get_language_id(random_language_test['language'], 'code')
+    first = random_language_test['questions'][0]
+    random_language_test['questions'].append(
+        {**first, 'question': f'Second {first["question"]}'}
+    )
+    values = generate_questions_values(
+        1, language_id, 1, random_language_test['questions']
+    )
+    insert_questions(values)
+    catalog = get_catalog()
+
+    # the moved question is on two lines of the update file
+    new_values = generate_questions_values(
+        1, language_id, 3, random_language_test['questions'][:1]
+    )
+    update_questions(1, [*new_values, *new_values])
+    new_catalog = get_catalog()
+    assert new_catalog[(language_id, 1, 4)] == catalog[(language_id, 1, 4)] - 1
+    assert new_catalog[(language_id, 3, 4)] == catalog.get((language_id, 3, 4), 0) + 1
@@ -0,0 +1,48 @@
+import pytest
+
+from core.db import _execute, _get_connection
+from core.dedup import UpdateWindow
+
+
+@pytest.fixture(scope='function')
+def window():
+    yield UpdateWindow(3)
+    _execute('DELETE FROM processed_updates')
+    _get_connection().commit()
+
+
+def test_is_duplicate(window):
+    assert not window.is_duplicate(1, 10, 100)
+    assert window.is_duplicate(1, 10, 100)
+    # a retry with a new update id but the same message
+    assert window.is_duplicate(2, 10, 100)
+    # the same message id in another chat
+    assert not window.is_duplicate(3, 11, 100)
+    assert not window.is_duplicate(None, 10, None)
+    assert window.duplicates == 2
+
+
+def test_window_size(window):
+    for update_id in range(1, 5):
+        assert not window.is_duplicate(update_id, 10, update_id)
+    assert len(window) == 3
+    # the oldest update has been evicted
+    assert not window.is_duplicate(1, 10, 1)
+    assert window.is_duplicate(4, 10, 4)
+
+
+def test_load(window):
+    for update_id in range(1, 6):
+        window.is_duplicate(update_id, 10, update_id)
+    window.flush()
+
+    restarted = UpdateWindow(3)
+    restarted.load()
+    assert len(restarted) == 3
+    assert all(restarted.is_duplicate(i, 10, i) for i in (3, 4, 5))
+    assert not restarted.is_duplicate(2, 10, 2)
+
+
+def test_size_error():
+    with pytest.raises(ValueError):
+        UpdateWindow(0)
@@ -6,6 +6,8 @@ import pytest
 from core.db import (
     get_formatted_languages_list,
     get_formatted_test_types_list,
+    get_formatted_user_stats,
+    get_formatted_worst_questions,
     get_user_role
 )
 from core.dispatcher import UnclosedSessionError
@@ -80,6 +82,7 @@ def test_handle_start_commands(dispatcher, command, user_id):
     (
         'languages_list',
         'test_types_list',
+        'worst_questions',
     )
 )
 @pytest.mark.parametrize(
@@ -97,16 +100,32 @@ def test_handle_information_commands(dispatcher, command, user_id):
     else:
         if command == 'languages_list':
             text = get_formatted_languages_list()
-        else:
+        elif command == 'test_types_list':
             text = get_formatted_test_types_list()
+        else:
+            text = get_formatted_worst_questions(user_id)
     result = dispatcher._handle_information_commands(user_id, command)
     assert isinstance(result, Answer)
     assert result.text == text
 
 
+@pytest.mark.parametrize(
+    'user_id',
+    (
+        1,
+        3,
+    )
+)
+def test_handle_stats_commands(dispatcher, user_id):
+    result = dispatcher.handle_text_message(user_id, '/stats', datetime.now())
+    assert isinstance(result, Answer)
+    assert result.text == get_formatted_user_stats(user_id)
+
+
 @pytest.mark.parametrize(
     'command',
     (
+        'archive_attempts',
         'create_deep_link',
     )
 )
@@ -128,6 +147,32 @@ def test_handle_admin_commands(dispatcher, command, user_id):
     assert result.text == text
 
 
+@pytest.mark.parametrize(
+    'number, number_links',
+    (
+        (None, 1),
+        (3, 3),
+        (0, 0),
+        (1000, 0),
+    )
+)
+def test_handle_create_deep_link(dispatcher, number, number_links):
+    result = dispatcher._handle_admin_commands(1, 'create_deep_link', number)
+    assert result.text.count('https://t.me/') == number_links
+
+
+@pytest.mark.parametrize(
+    'text, result',
+    (
+        ('/create_deep_link', None),
+        ('/create_deep_link 5', 5),
+        ('/create_deep_link five', None),
+    )
+)
+def test_get_number_argument(dispatcher, text, result):
+    assert dispatcher._get_number_argument(text) == result
+
+
 @pytest.mark.parametrize(
     'user_id',
     (
@@ -152,13 +197,13 @@ def test_handle_text(dispatcher, user_id, text):
 
 
 @pytest.mark.parametrize(
-    'user_id, date',
+    'user_id',
     (
-        (3, datetime.now()),
+        3,
     )
 )
-def test_handle_user_commands(dispatcher, user_session_handler, user_id, date):
-    answer = dispatcher._handle_user_commands(user_id, date)
+def test_handle_user_commands(dispatcher, user_session_handler, user_id):
+    answer = dispatcher._handle_user_commands(user_id)
     func = user_session_handler._functions_map['select_language']
     _answer = func(Mock, None)
     assert isinstance(answer, Answer)
@@ -168,15 +213,15 @@ def test_handle_user_commands(dispatcher, user_session_handler, user_id, date):
 
 
 @pytest.mark.parametrize(
-    'user_id, date',
+    'user_id',
     (
-        (1, datetime.now()),
-        (2, datetime.now()),
-        (3, datetime.now()),
+        1,
+        2,
+        3,
     )
 )
-def test_create_session(dispatcher, user_session_handler, user_id, date):
-    session = dispatcher._create_session(user_id, date, user_session_handler)
+def test_create_session(dispatcher, user_session_handler, user_id):
+    session = dispatcher._create_session(user_id, user_session_handler)
     assert user_id in dispatcher._sessions
     assert isinstance(session, UserSession)
 
@@ -184,32 +229,52 @@ def test_create_session(dispatcher, user_session_handler, user_id, date):
 
 
 @pytest.mark.parametrize(
-    'user_id, date',
+    'user_id',
     (
-        (1, datetime.now()),
-        (2, datetime.now()),
-        (3, datetime.now()),
+        1,
+        2,
+        3,
     )
 )
-def test_create_session_error(dispatcher, user_session_handler, user_id, date):
-    _ = dispatcher._create_session(user_id, date, user_session_handler)
+def test_create_session_error(dispatcher, user_session_handler, user_id):
+    _ = dispatcher._create_session(user_id, user_session_handler)
     with pytest.raises(UnclosedSessionError):
-        _ = dispatcher._create_session(user_id, date, user_session_handler)
+        _ = dispatcher._create_session(user_id, user_session_handler)
 
     dispatcher.close_session(user_id)
 
 
 @pytest.mark.parametrize(
-    'user_id, date',
+    'user_id',
     (
-        (1, datetime.now()),
-        (2, datetime.now()),
-        (3, datetime.now()),
+        1,
+        2,
+        3,
     )
 )
-def test_close_session(dispatcher, user_id, date):
-    _ = dispatcher._handle_user_commands(user_id, date)
+def test_close_session(dispatcher, user_id):
+    _ = dispatcher._handle_user_commands(user_id)
     assert user_id in dispatcher._sessions
 
     dispatcher.close_session(user_id)
     assert user_id not in dispatcher._sessions
+
+
+def test_get_step_alias(dispatcher, user_session_handler):
+    assert dispatcher.get_step_alias(3) is None
+    _ = dispatcher._create_session(3, user_session_handler)
+    assert dispatcher.get_step_alias(3) == 'user_session_handler.select_language'
+
+    dispatcher.close_session(3)
+
+
+def test_get_sessions_memory_usage(dispatcher, user_session_handler):
+    assert dispatcher.get_sessions_memory_usage()['number_sessions'] == 0
+    for user_id in (1, 2, 3):
+        _ = dispatcher._create_session(user_id, user_session_handler)
+    usage = dispatcher.get_sessions_memory_usage()
+    assert usage['number_sessions'] == 3
+    assert 0 < usage['bytes_per_session'] <= usage['total_bytes']
+
+    for user_id in (1, 2, 3):
+        dispatcher.close_session(user_id)
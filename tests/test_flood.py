@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from core.flood import AdmissionController, TokenBucket
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=2, capacity=3, now=0)
+    assert bucket.get_wait(0) == 0
+    bucket.tokens = 0
+    assert bucket.get_wait(0) == pytest.approx(0.5)
+    assert bucket.get_wait(0.25) == pytest.approx(0.25)
+    assert bucket.get_wait(10) == 0
+    assert bucket.tokens == 3
+
+
+def test_user_limit():
+    admission = AdmissionController(
+        user_rate=1, user_burst=2, global_rate=100, global_burst=100
+    )
+    assert [admission.reserve(1, now=0) for _ in range(3)] == [0, 0, None]
+    # other users have their own buckets
+    assert admission.reserve(2, now=0) == 0
+    assert admission.reserve(1, now=1) == 0
+    assert admission.stats['rejected_user'] == 1
+    assert admission.stats['admitted'] == 4
+
+
+def test_global_limit():
+    admission = AdmissionController(
+        user_rate=10, user_burst=10, global_rate=1, global_burst=3
+    )
+    results = [admission.reserve(user_id, now=0) for user_id in range(5)]
+    assert results == [0, 0, 0, None, None]
+    assert admission.stats['rejected_global'] == 2
+
+
+def test_queue_policy():
+    admission = AdmissionController(
+        user_rate=10, user_burst=1, global_rate=100, global_burst=100,
+        policy='queue', deadline=0.25
+    )
+    waits = [admission.reserve(1, now=0) for _ in range(4)]
+    assert waits[:3] == [0, pytest.approx(0.1), pytest.approx(0.2)]
+    assert waits[3] is None  # over the deadline
+    assert admission.stats['delayed'] == 2
+
+
+def test_admit():
+    admission = AdmissionController(
+        user_rate=100, user_burst=1, policy='queue', deadline=1
+    )
+
+    async def main():
+        return [await admission.admit(1) for _ in range(3)]
+
+    assert asyncio.run(main()) == [True, True, True]
+
+
+def test_max_users():
+    admission = AdmissionController(max_users=2)
+    for user_id in range(3):
+        admission.reserve(user_id)
+    assert list(admission._users) == [1, 2]
@@ -1,12 +1,18 @@
+import os.path
+import sqlite3
+
+from core.config import INIT_DATA_DIR
 from core.db import (
     get_admin_ids,
+    get_db_version,
     get_number_languages,
     get_number_questions,
     get_number_roles,
     get_number_tables,
-    get_number_test_types
+    get_number_test_types,
+    _get_timestamp
 )
-from core.init_db import _get_files_list
+from core.init_db import _get_files_list, _get_migrations_list
 
 
 def test_admin_ids():
@@ -19,7 +25,14 @@ def test_get_files_list():
 
 
 def test_init_db():
-    assert get_number_tables() == 8
+    # sqlite_sequence and sqlite_stat1 are not counted
+    assert get_number_tables() == 12
+
+
+def test_migrate_db():
+    migrations = _get_migrations_list()
+    assert [number for number, _ in migrations] == list(range(1, len(migrations) + 1))
+    assert get_db_version() == migrations[-1][0]
 
 
 def test_insert_data():
@@ -27,3 +40,34 @@ def test_insert_data():
     assert get_number_test_types() == 6
     assert get_number_roles() == 3
     assert get_number_questions() > 0
+
+
+def test_migrate_test_results():
+    connection = sqlite3.connect(':memory:')
+    connection.executescript(
+        'CREATE TABLE users (id INTEGER PRIMARY KEY);'
+        'CREATE TABLE test_results (id INTEGER PRIMARY KEY, user_id INTEGER, '
+        'question_id INTEGER, answer INTEGER, date DATE);'
+    )
+    connection.executemany(
+        'INSERT INTO test_results (user_id, question_id, answer, date) '
+        'VALUES (?, ?, ?, ?)',
+        [
+            (1, 5, 0, '2021-01-01 12:00:00'),
+            (1, 3, 2, '2021-01-01 12:00:00'),
+            (2, 3, 1, '2021-01-01 12:00:00'),
+            (1, 5, 1, '2021-01-02 12:00:00'),
+        ]
+    )
+    path = os.path.join(INIT_DATA_DIR, 'migrations', '0007_attempts.sql')
+    with open(path, mode='r') as file:
+        connection.executescript(file.read())
+    rows = connection.execute(
+        'SELECT user_id, taken, question_ids, answers FROM attempts ORDER BY id'
+    ).fetchall()
+    assert rows == [
+        (1, int(_get_timestamp('2021-01-01 12:00:00')), '[5,3]', '[0,2]'),
+        (1, int(_get_timestamp('2021-01-02 12:00:00')), '[5]', '[1]'),
+        (2, int(_get_timestamp('2021-01-01 12:00:00')), '[3]', '[1]'),
+    ]
+    connection.close()
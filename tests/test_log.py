@@ -0,0 +1,118 @@
+import asyncio
+import io
+import json
+import logging
+import queue
+import re
+
+import pytest
+
+from core.log import (
+    DroppingQueueHandler,
+    get_dropped_records,
+    RotatingFileHandler,
+    setup_logging,
+    stop_logging,
+    update_context
+)
+from core.uploads import UploadProcessor
+
+
+@pytest.fixture()
+def root_logger():
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    yield root
+    stop_logging()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+
+
+def test_json_lines(root_logger, tmpdir):
+    path = str(tmpdir.join('log.log'))
+    setup_logging(path, json_lines=True)
+    logging.info('outside')
+    with update_context(10, 1):
+        logging.info('inside')
+    stop_logging()
+    with open(path, encoding='utf-8') as file:
+        outside, inside = [json.loads(line) for line in file]
+    assert outside['message'] == 'outside'
+    assert 'user_id' not in outside
+    assert inside['message'] == 'inside'
+    assert (inside['update_id'], inside['user_id']) == (10, 1)
+    assert inside['latency'] >= 0
+
+
+def test_text_lines(root_logger, tmpdir):
+    path = str(tmpdir.join('log.log'))
+    setup_logging(path)
+    with update_context(10, 1):
+        logging.warning('inside')
+    stop_logging()
+    with open(path, encoding='utf-8') as file:
+        line = file.read()
+    assert '[WARNING ]' in line
+    assert '[update 10] [user 1]' in line
+
+
+def test_update_context_in_executor(root_logger, tmpdir):
+    path = str(tmpdir.join('log.log'))
+    setup_logging(path, json_lines=True)
+    uploads = UploadProcessor(max_workers=1)
+
+    async def download():
+        return io.BytesIO()
+
+    async def process():
+        with update_context(10, 1):
+            await uploads.process(1, download, lambda _: logging.info('thread'))
+
+    asyncio.run(process())
+    uploads.shutdown()
+    stop_logging()
+    with open(path, encoding='utf-8') as file:
+        record = json.loads(file.read())
+    assert (record['update_id'], record['user_id']) == (10, 1)
+
+
+def _write_records(path: str, backup_count: int) -> None:
+    handler = RotatingFileHandler(path, max_bytes=100, backup_count=backup_count)
+    logger = logging.getLogger('test_rotation_by_size')
+    logger.propagate = False
+    logger.addHandler(handler)
+    for i in range(20):
+        logger.warning(f'record {i:02d} ' + 'x' * 50)
+    handler.close()
+    logger.removeHandler(handler)
+
+
+def test_rotation_by_size(tmpdir):
+    _write_records(str(tmpdir.mkdir('limited').join('log.log')), 2)
+    # the log file and backup_count backups
+    assert len(tmpdir.join('limited').listdir()) == 3
+
+    _write_records(str(tmpdir.mkdir('all').join('log.log')), 25)
+    records = []
+    for file in tmpdir.join('all').listdir():
+        records.extend(re.findall(r'record (\d{2})', file.read_text('utf-8')))
+    # size rollovers within one second don't overwrite each other
+    assert sorted(records) == [f'{i:02d}' for i in range(20)]
+
+
+def test_dropping_queue_handler():
+    handler = DroppingQueueHandler(queue.Queue(maxsize=1))
+    record = logging.makeLogRecord({'msg': 'message'})
+    handler.handle(record)
+    handler.handle(record)
+    assert handler.queue.qsize() == 1
+    assert handler.dropped == 1
+
+
+def test_get_dropped_records(root_logger, tmpdir):
+    handler = setup_logging(str(tmpdir.join('log.log')))
+    handler.dropped = 3
+    assert get_dropped_records() == 3
@@ -0,0 +1,78 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from core.db import (
+    enable_incremental_vacuum,
+    execute_script,
+    get_analyzed_rows,
+    get_auto_vacuum,
+    get_page_stats
+)
+from core.maintenance import Maintenance
+
+
+@pytest.mark.parametrize(
+    'hours, hour, result',
+    (
+        ('3-5', 2, False),
+        ('3-5', 3, True),
+        ('3-5', 5, False),
+        ('23-2', 23, True),
+        ('23-2', 1, True),
+        ('23-2', 12, False),
+    )
+)
+def test_is_due(hours, hour, result):
+    maintenance = Maintenance(hours)
+    assert maintenance.is_due(datetime(2021, 1, 1, hour)) == result
+
+
+def test_is_due_once_per_window():
+    maintenance = Maintenance('23-2')
+    maintenance._last_run = datetime(2021, 1, 1, 23, 30)
+    assert not maintenance.is_due(datetime(2021, 1, 2, 1))
+    assert maintenance.is_due(datetime(2021, 1, 2, 23, 30))
+    assert maintenance._last_run + timedelta(hours=12) < datetime(2021, 1, 2, 23)
+
+
+def test_hours_error():
+    with pytest.raises(ValueError):
+        Maintenance('3-25')
+
+
+def test_enable_incremental_vacuum():
+    # new dbs are created with it, existing ones are switched on demand
+    assert get_auto_vacuum() == 2
+    execute_script('PRAGMA auto_vacuum = NONE; VACUUM;')
+    assert get_auto_vacuum() == 0
+    enable_incremental_vacuum()
+    assert get_auto_vacuum() == 2
+
+
+def test_run_once():
+    execute_script(
+        'CREATE TABLE garbage (value TEXT);'
+        "INSERT INTO garbage SELECT hex(randomblob(1000)) "
+        'FROM (WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n '
+        'WHERE i < 500) SELECT i FROM n);'
+        'DROP TABLE garbage;'
+    )
+    page_size, _, freelist_count = get_page_stats()
+    assert freelist_count > 0
+
+    maintenance = Maintenance(vacuum_pages=100)
+    report = asyncio.run(maintenance.run_once())
+    # ANALYZE may reuse a few free pages before the vacuum
+    assert 0 < report['bytes_reclaimed'] <= freelist_count * page_size
+    assert get_page_stats()[2] == 0
+    assert 'questions' in report['analyzed']
+    assert 'questions' in get_analyzed_rows()
+    assert report['integrity_errors'] == []
+    assert maintenance.reports == [report]
+
+    # nothing changed since the last run
+    report = asyncio.run(maintenance.run_once())
+    assert report['analyzed'] == []
+    assert report['bytes_reclaimed'] == 0
@@ -0,0 +1,17 @@
+import pytest
+
+from core.memory import measure_sessions_footprint
+
+
+@pytest.mark.parametrize(
+    'handler',
+    (
+        'user_session_handler',
+        'language_test_creator_session_handler',
+    )
+)
+def test_measure_sessions_footprint(request, handler):
+    report = measure_sessions_footprint(request.getfixturevalue(handler), 1000)
+    assert report['number_sessions'] == 1000
+    assert 0 < report['tracemalloc_bytes_per_session'] < 1024
+    assert 0 < report['getsizeof_bytes_per_session'] < 1024
@@ -0,0 +1,82 @@
+import os.path
+import pstats
+
+import pytest
+
+from core.profiling import get_profile_report, Profiler, profiler
+
+
+def _work():
+    return sum(i * i for i in range(10000))
+
+
+def test_profile_updates(tmpdir):
+    _profiler = Profiler(tmpdir, top=5)
+    assert not _profiler.enabled
+    assert _profiler.poll() is None
+    assert _profiler.request(1, updates=2)
+    assert not _profiler.request(1, updates=2)
+
+    assert _profiler.poll() is None  # started
+    assert _profiler.running
+    _work()
+    assert _profiler.poll() is None
+    _work()
+    result = _profiler.poll()
+    assert not _profiler.enabled and not _profiler.running
+    assert (result.user_id, result.updates) == (1, 2)
+    assert os.path.dirname(result.path) == str(tmpdir)
+    assert any('_work' in name for _, _, name in pstats.Stats(result.path).stats)
+    assert len(result.summary.split('\n')) == 5
+    assert 'обновлений: 2' in get_profile_report(result)
+
+
+def test_profile_seconds(tmpdir):
+    _profiler = Profiler(tmpdir)
+    assert _profiler.request(1, seconds=0)
+    assert _profiler.poll() is None
+    result = _profiler.poll(update=False)
+    assert result.updates == 0
+    assert _profiler.request(1, seconds=60)
+    _profiler.poll()
+    assert _profiler.poll() is None
+    assert _profiler.running
+    _profiler._stop(0)
+
+
+def test_profile_updates_max_seconds(tmpdir):
+    _profiler = Profiler(tmpdir, max_seconds=0)
+    assert _profiler.request(1, updates=100)
+    assert _profiler.seconds == 0
+    assert _profiler.poll() is None
+    # no updates came, the timer of the server stops it
+    result = _profiler.poll(update=False)
+    assert result.updates == 0
+    assert not _profiler.enabled
+
+
+def test_request_error():
+    with pytest.raises(ValueError):
+        Profiler().request(1)
+    with pytest.raises(ValueError):
+        Profiler().request(1, seconds=1, updates=1)
+
+
+@pytest.mark.parametrize(
+    'command, number, text',
+    (
+        ('profile', None, 'Профилирование запущено на 30 с'),
+        ('profile_updates', 5, 'Профилирование запущено на 5 обновлений'),
+        ('profile', 0, 'N д. б. в диапазоне от 1 до 600'),
+    )
+)
+def test_handle_profile_command(dispatcher, command, number, text):
+    answer = dispatcher._handle_admin_commands(1, command, number)
+    assert answer.text.startswith(text)
+    if profiler.enabled:
+        assert 'BOT_DISPATCH_THREADS' in answer.text
+    if profiler.enabled:
+        assert dispatcher._handle_admin_commands(1, command, number).text == (
+            'Профилирование уже запущено.'
+        )
+        profiler.enabled = False
@@ -0,0 +1,10 @@
+from core.queries import StatementCacheStats
+
+
+def test_statement_cache_stats():
+    stats = StatementCacheStats(size=2)
+    for sql in ('SELECT 1', 'SELECT 1', 'SELECT 2', 'SELECT 3', 'SELECT 1'):
+        stats.register(sql)
+    # 'SELECT 1' has been evicted by 'SELECT 3'
+    assert (stats.hits, stats.misses) == (1, 4)
+    assert stats.number_statements == 2
@@ -0,0 +1,251 @@
+"""
+Query plan and timing regression tests of the core.queries statements
+against a db seeded with a lot of rows.
+"""
+import json
+import os.path
+import random
+import re
+import sqlite3
+import time
+from typing import Dict, Iterator, Sequence, Tuple
+
+import pytest
+
+from core import queries
+from core.config import INIT_DATA_DIR
+from core.init_db import _get_migrations_list
+
+
+NUMBER_USERS = 2000
+NUMBER_QUESTIONS = 20000
+NUMBER_LANGUAGES = 45
+NUMBER_TEST_TYPES = 6
+REVIEWS_PER_USER = 20
+ATTEMPTS_PER_USER = 10
+
+# big tables (and their aliases in core.queries) that must not be scanned
+GUARDED_TABLES = {
+    'questions': 'questions',
+    'q': 'questions',
+    'attempts': 'attempts',
+    'reviews': 'reviews',
+    'r': 'reviews',
+    'question_stats': 'question_stats',
+    'qs': 'question_stats',
+    'user_stats': 'user_stats',
+    'us': 'user_stats',
+    'deep_links': 'deep_links',
+    'users': 'users',
+}
+# statements reading or deleting the whole table on purpose
+FULL_SCANS = {
+    'ADMIN_IDS',  # once at start
+    'ALL_QUESTIONS',
+    'QUESTIONS_INFO',
+    'ALL_ATTEMPTS',
+    'DELETE_ALL_REVIEWS',
+    'DELETE_ALL_USER_STATS',
+    'DELETE_ALL_QUESTION_STATS',
+    'NUMBER_ROWS[questions]',
+}
+# ms, the best of several runs on the seeded db
+DEFAULT_BUDGET = 10
+BUDGETS = {
+    'ALL_QUESTIONS': 100,
+    'QUESTIONS_INFO': 100,
+    'ALL_ATTEMPTS': 100,
+    'DELETE_ALL_REVIEWS': 100,
+    'DELETE_ALL_USER_STATS': 50,
+    'DELETE_ALL_QUESTION_STATS': 50,
+    'NEW_QUESTIONS': 50,  # ORDER BY RANDOM() of one test's questions
+    'OPTIMIZE': 100,
+}
+
+LINK = '2aefdcc2-5c09-4e29-bdea-ee61fdc01f23'
+NOW = 1609502400.0
+PARAMETERS: Dict[str, Sequence] = {
+    'ADMIN_IDS': ('admin',),
+    'IS_NEW_USER': (1,),
+    'INSERT_USERS': (NUMBER_USERS + 1, 1, '2021-01-01 12:00:00'),
+    'ROLE_ID': ('admin',),
+    'USER_ROLE[role]': (1,),
+    'USER_ROLE[role_id]': (1,),
+    'UPDATE_USER_ROLE': ('test_creator', 1, 'admin'),
+    'INSERT_DEEP_LINK': ('new-link', 1, 'test_creator', NOW),
+    'IS_VALID_DEEP_LINK': (LINK, NOW),
+    'REDEEM_DEEP_LINK': (2, '2021-01-01 12:00:00', LINK, NOW),
+    'DEEP_LINK_ROLE': (LINK,),
+    'LANGUAGE_ID[code]': ('L1',),
+    'LANGUAGE_ID[name]': ('Language 1',),
+    'TEST_TYPE_ID': ('Type 1',),
+    'TEST_TYPES': (1,),
+    'INSERT_QUESTIONS': (1, 1, 1, 'New ___.', 'a\nb', 2, 0),
+    'USER_QUESTIONS': (1,),
+    'MATCH_USER_QUESTIONS': (json.dumps(['Question 1 ___.', 'Question 2 ___.']), 1),
+    'QUESTIONS_INFO_BY_IDS': (json.dumps(list(range(1, 11))),),
+    'QUESTIONS_CATALOG_KEYS': (json.dumps(list(range(1, 11))),),
+    'DELETE_QUESTIONS': (json.dumps(list(range(1, 11))),),
+    'UPDATE_QUESTION': (1, 1, 'a\nb', 2, 0, 1),
+    'NEW_QUESTIONS': (1, 1, 4, 1, 10),
+    'REVIEW_QUESTIONS[True]': (1, 1, 1, 4, NOW, 10),
+    'REVIEW_QUESTIONS[False]': (1, 1, 1, 4, NOW, 10),
+    'UPDATE_CATALOG': (1, 1, 4, 1),
+    'INSERT_ATTEMPTS': (1, int(NOW), '[1]', '[0]'),
+    'OLD_ATTEMPTS': (int(NOW) - 30 * 24 * 60 * 60, 500),
+    'DELETE_ATTEMPTS': (json.dumps(list(range(1, 11))),),
+    'REVIEW': (1, 1),
+    'SAVE_REVIEW': (1, 1, 1, 1, 4, 2.5, 1.0, 1, NOW),
+    'UPDATE_REVIEWS_TEST_KEY': (1, 1, 4, 1),
+    'DELETE_REVIEWS': (json.dumps(list(range(1, 11))),),
+    'USER_STATS_ROW': (1, 1, 1),
+    'SAVE_USER_STATS': (1, 1, 1, 1, 10, 5, 1, 2, int(NOW)),
+    'USER_STATS': (1,),
+    'QUESTION_STATS': (1,),
+    'SAVE_QUESTION_STATS': (1, 1, 10, 5, 0.5, '[5, 5, 0, 0]'),
+    'WORST_QUESTIONS': (1, 5, 10),
+    'DELETE_QUESTION_STATS': (json.dumps(list(range(1, 11))),),
+    'SAVE_PROCESSED_UPDATES': (1, 1, 1, 1, 1),
+    'PROCESSED_UPDATES': (10000,),
+}
+
+
+def _get_statements() -> Iterator[Tuple[str, str]]:
+    """Yields (name, sql) of every statement of core.queries."""
+    for name, value in vars(queries).items():
+        if not name.isupper():
+            continue
+        if isinstance(value, str):
+            yield name, value
+        elif isinstance(value, dict):
+            for key, sql in value.items():
+                yield f'{name}[{key}]', sql
+
+
+STATEMENTS = dict(_get_statements())
+
+
+def _seed(connection: sqlite3.Connection) -> None:
+    rnd = random.Random(1)
+    connection.executemany(
+        'INSERT INTO languages (code, name) VALUES (?, ?)',
+        [(f'L{i}', f'Language {i}') for i in range(1, NUMBER_LANGUAGES + 1)]
+    )
+    connection.executemany(
+        'INSERT INTO test_types (type) VALUES (?)',
+        [(f'Type {i}',) for i in range(1, NUMBER_TEST_TYPES + 1)]
+    )
+    connection.executemany(
+        'INSERT INTO roles (role) VALUES (?)',
+        [('admin',), ('test_creator',), ('user',)]
+    )
+    connection.executemany(
+        'INSERT INTO users (id, role_id, joined) VALUES (?, ?, ?)',
+        [(i, 1 if i == 1 else rnd.choice((2, 3)), '2021-01-01 12:00:00')
+         for i in range(1, NUMBER_USERS + 1)]
+    )
+    questions = [
+        (i, rnd.randint(1, 100), rnd.randint(1, NUMBER_LANGUAGES),
+         rnd.randint(1, NUMBER_TEST_TYPES), f'Question {i} ___.', 'a\nb\nc\nd',
+         4, rnd.randint(0, 3))
+        for i in range(1, NUMBER_QUESTIONS + 1)
+    ]
+    connection.executemany(
+        'INSERT INTO questions (id, user_id, language_id, test_type_id, '
+        'question, answers, number_answers, right_answer) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+        questions
+    )
+    connection.execute(
+        'INSERT INTO catalog '
+        'SELECT language_id, test_type_id, number_answers, count(*) '
+        'FROM questions GROUP BY language_id, test_type_id, number_answers'
+    )
+    reviews, attempts = [], []
+    for user_id in range(1, NUMBER_USERS + 1):
+        for question in rnd.sample(questions, REVIEWS_PER_USER):
+            reviews.append((user_id, question[0], *question[2:4], 4, 2.5, 1.0,
+                            1, NOW + rnd.randint(-10, 10) * 24 * 60 * 60))
+        for _ in range(ATTEMPTS_PER_USER):
+            question_ids = [question[0] for question in rnd.sample(questions, 10)]
+            attempts.append((user_id, int(NOW) - rnd.randint(0, 400) * 24 * 60 * 60,
+                             json.dumps(question_ids), json.dumps([0] * 10)))
+    connection.executemany(
+        'INSERT OR IGNORE INTO reviews VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', reviews
+    )
+    connection.executemany(
+        'INSERT INTO attempts (user_id, taken, question_ids, answers) '
+        'VALUES (?, ?, ?, ?)',
+        attempts
+    )
+    connection.execute(
+        'INSERT INTO question_stats '
+        '(question_id, user_id, attempts, right_answers, right_rate, answers) '
+        "SELECT id, user_id, 10, 5, 0.5, '[5, 5, 0, 0]' FROM questions"
+    )
+    connection.execute(
+        'INSERT OR IGNORE INTO user_stats '
+        'SELECT r.user_id, r.language_id, r.test_type_id, 1, 10, 5, 1, 2, 0 '
+        'FROM reviews r'
+    )
+    connection.executemany(
+        'INSERT INTO deep_links (link, creator_id, role, expires) '
+        'VALUES (?, 1, ?, ?)',
+        [(LINK, 'test_creator', NOW + 60)]
+        + [(f'link-{i}', 'test_creator', NOW + 60) for i in range(5000)]
+    )
+    connection.commit()
+    # as after core.maintenance has run
+    connection.execute('ANALYZE')
+    connection.commit()
+
+
+@pytest.fixture(scope='module')
+def seeded_db(tmpdir_factory):
+    path = os.path.join(tmpdir_factory.mktemp('plans'), 'seeded_db')
+    connection = sqlite3.connect(path)
+    with open(os.path.join(INIT_DATA_DIR, 'create_db.sql'), mode='r') as file:
+        connection.executescript(file.read())
+    for _, file_name in _get_migrations_list():
+        migration = os.path.join(INIT_DATA_DIR, 'migrations', file_name)
+        with open(migration, mode='r') as file:
+            connection.executescript(file.read())
+    _seed(connection)
+    yield connection
+    connection.close()
+
+
+def test_parameters():
+    # a new statement needs its parameters here to be checked
+    for name, sql in STATEMENTS.items():
+        assert len(PARAMETERS.get(name, ())) == sql.count('?'), name
+    assert FULL_SCANS <= STATEMENTS.keys()
+    assert BUDGETS.keys() <= STATEMENTS.keys()
+
+
+@pytest.mark.parametrize('name', sorted(STATEMENTS))
+def test_query_plan(seeded_db, name):
+    sql, parameters = STATEMENTS[name], PARAMETERS.get(name, ())
+    plan = seeded_db.execute(f'EXPLAIN QUERY PLAN {sql}', parameters).fetchall()
+    scans = {
+        GUARDED_TABLES[match.group(2)]
+        for *_, detail in plan
+        for match in [re.match(r'SCAN (TABLE )?(\w+)', detail)]
+        if match is not None and match.group(2) in GUARDED_TABLES
+    }
+    if name in FULL_SCANS:
+        return
+    assert not scans, f'{name}: {[row[-1] for row in plan]}'
+
+
+@pytest.mark.parametrize('name', sorted(STATEMENTS))
+def test_query_time(seeded_db, name):
+    sql, parameters = STATEMENTS[name], PARAMETERS.get(name, ())
+    timings = []
+    for _ in range(3):
+        started = time.perf_counter()
+        seeded_db.execute(sql, parameters).fetchall()
+        timings.append(time.perf_counter() - started)
+        # writes are undone, every run sees the seeded db
+        seeded_db.rollback()
+    assert min(timings) * 1000 <= BUDGETS.get(name, DEFAULT_BUDGET), name
@@ -0,0 +1,126 @@
+import asyncio
+import gzip
+import json
+import os.path
+from datetime import datetime
+
+from core import retention
+from core.db import (
+    get_language_test,
+    get_old_attempts,
+    get_user_stats,
+    insert_user_answers,
+    rebuild_user_stats,
+    _get_attempts
+)
+from core.retention import (
+    archive_attempts,
+    Archiver,
+    get_archive_report,
+    get_archived_attempts
+)
+
+
+def _insert_old_attempts(user_id: int) -> None:
+    question_id = get_language_test(user_id, 10, 1, 4, 1)[0][0]
+    for date in ('2000-01-01 12:00:00', '2000-01-02 12:00:00',
+                 '2000-02-01 12:00:00'):
+        insert_user_answers([(user_id, question_id, 0, date)])
+
+
+def test_archive_attempts(tmpdir):
+    user_id = 301
+    _insert_old_attempts(user_id)
+    now = datetime(2000, 3, 1).timestamp()
+
+    assert archive_attempts(0, 2, 1, tmpdir, now) == (2, True)
+    assert archive_attempts(0, 2, None, tmpdir, now) == (1, False)
+    assert archive_attempts(0, 2, None, tmpdir, now) == (0, False)
+    assert sorted(os.listdir(tmpdir)) == [
+        'attempts_2000_01.jsonl.gz', 'attempts_2000_02.jsonl.gz'
+    ]
+    archived = get_archived_attempts(tmpdir)
+    assert [row[1] for row in archived] == [user_id] * 3
+    assert all(attempt[0][0] != user_id for attempt in _get_attempts())
+
+
+def test_rebuild_with_archived_attempts(tmpdir):
+    user_id = 303
+    _insert_old_attempts(user_id)
+    user_stats = get_user_stats(user_id)
+    archive_attempts(0, 10, None, tmpdir, datetime(2000, 3, 1).timestamp())
+
+    # the replay of the db only loses the archived answers
+    rebuild_user_stats()
+    assert get_user_stats(user_id) == []
+    rebuild_user_stats(get_archived_attempts(tmpdir))
+    assert get_user_stats(user_id) == user_stats
+
+
+def test_archive_newest_attempt(tmpdir):
+    user_id = 304
+    question_id = get_language_test(user_id, 10, 1, 4, 1)[0][0]
+    insert_user_answers([(user_id, question_id, 0, '2000-01-01 12:00:00')])
+    now = datetime(2000, 3, 1).timestamp()
+    assert archive_attempts(0, 10, None, tmpdir, now) == (1, False)
+    # the id of the archived attempt is not given to the new one
+    insert_user_answers([(user_id, question_id, 1, '2021-01-01 12:00:00')])
+    archived = get_archived_attempts(tmpdir)
+    attempts = [i for i in _get_attempts(archived) if i[0][0] == user_id]
+    assert [attempt[0][2] for attempt in attempts] == [0, 1]
+    rows = get_old_attempts(int(datetime(2100, 1, 1).timestamp()), 10 ** 6)
+    assert archived[0][0] not in [row[0] for row in rows if row[1] == user_id]
+
+
+def test_archiver(monkeypatch):
+    archiver = Archiver()
+    monkeypatch.setattr(retention, 'archive_attempts', lambda: (5, False))
+    assert not archiver.start()
+    assert archiver.request(1)
+    assert not archiver.request(2)
+    assert archiver.start()
+    assert not archiver.start()
+    assert asyncio.run(archiver.run()) == (1, 'Архивировано попыток: 5.')
+    assert not archiver.enabled
+
+    def fail():
+        raise OSError
+
+    monkeypatch.setattr(retention, 'archive_attempts', fail)
+    assert archiver.request(2) and archiver.start()
+    user_id, text = asyncio.run(archiver.run())
+    assert user_id == 2 and 'не удалась' in text
+    assert archiver.request(3)
+
+
+def test_archiver_run_periodically(monkeypatch):
+    archiver = Archiver()
+    runs = []
+    monkeypatch.setattr(
+        retention, 'archive_attempts', lambda: runs.append(1) or (0, False)
+    )
+
+    async def run():
+        task = asyncio.ensure_future(archiver.run_periodically(0.01))
+        await asyncio.sleep(0.1)
+        task.cancel()
+
+    asyncio.run(run())
+    assert len(runs) > 1
+    assert not archiver.enabled
+
+
+def test_get_archived_attempts(tmpdir):
+    row = [1, 302, 946724400, '[1]', '[0]']
+    file_path = os.path.join(tmpdir, 'attempts_2000_01.jsonl.gz')
+    # the same batch written again after a crash before the delete
+    for _ in range(2):
+        with gzip.open(file_path, mode='at', encoding='utf-8') as file:
+            file.write(f'{json.dumps(row)}\n')
+    assert get_archived_attempts(tmpdir) == [tuple(row)]
+    assert get_archived_attempts(os.path.join(tmpdir, 'missing')) == []
+
+
+def test_get_archive_report():
+    assert get_archive_report(5, False) == 'Архивировано попыток: 5.'
+    assert '/archive_attempts' in get_archive_report(5, True)
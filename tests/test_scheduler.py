@@ -0,0 +1,28 @@
+import pytest
+
+from core.scheduler import DAY, DEFAULT_EASE, get_next_review, MIN_EASE, Review
+
+
+def test_first_answer():
+    review = get_next_review(None, True, 0.0)
+    assert review == Review(DEFAULT_EASE + 0.1, 1.0, 1, DAY)
+    review = get_next_review(None, False, 0.0)
+    assert review == Review(DEFAULT_EASE - 0.2, 0.0, 0, 0.0)
+
+
+def test_intervals():
+    review, date = None, 0.0
+    intervals = []
+    for _ in range(4):
+        review = get_next_review(review, True, date)
+        intervals.append(review.interval)
+        date = review.due
+    assert intervals[:2] == [1.0, 6.0]
+    assert intervals[2] == pytest.approx(6.0 * (DEFAULT_EASE + 0.2))
+    assert intervals[3] > intervals[2]
+
+
+def test_wrong_answer():
+    review = Review(MIN_EASE, 15.0, 3, 100.0)
+    review = get_next_review(review, False, 50.0)
+    assert review == Review(MIN_EASE, 0.0, 0, 50.0)
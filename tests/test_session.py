@@ -0,0 +1,37 @@
+import pytest
+
+from core.types import (
+    get_session_size,
+    LanguageTestCreatorSession,
+    Session,
+    UserSession
+)
+
+
+@pytest.mark.parametrize(
+    'session_class',
+    (
+        Session,
+        UserSession,
+        LanguageTestCreatorSession,
+    )
+)
+def test_session_has_no_dict(session_class):
+    session = session_class(1, 1)
+    assert not hasattr(session, '__dict__')
+    assert isinstance(session.created, float)
+    with pytest.raises(AttributeError):
+        session.unknown_attribute = 1
+
+
+def test_session_eq():
+    assert UserSession(1, 1, 1.0) == UserSession(1, 1, 1.0)
+    assert UserSession(1, 1, 1.0) != UserSession(1, 2, 1.0)
+    assert UserSession(1, 1, 1.0) != LanguageTestCreatorSession(1, 1, 1.0)
+
+
+def test_get_session_size():
+    session = UserSession(1, 1)
+    size = get_session_size(session)
+    session.language_id = 10 ** 30
+    assert get_session_size(session) > size
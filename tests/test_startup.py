@@ -0,0 +1,41 @@
+import subprocess
+import sys
+from typing import Dict
+
+from core.config import BASE_DIR
+from core.db import get_number_questions
+from core.init_db import check_db_exists
+
+
+# generous limit of the cumulative core import time, microseconds
+IMPORT_TIME_LIMIT = 1_000_000
+
+
+def _get_import_times(module: str) -> Dict[str, int]:
+    """Returns {module: cumulative import time} from python -X importtime."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=BASE_DIR, capture_output=True, text=True, check=True
+    )
+    import_times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        import_times[name.strip()] = int(cumulative)
+    return import_times
+
+
+def test_core_import_without_aiogram():
+    for module in ('core.dispatcher', 'core.init_db', 'core.uploads',
+                   'core.workers'):
+        import_times = _get_import_times(module)
+        assert not any(name.startswith('aiogram') for name in import_times)
+        assert import_times[module] < IMPORT_TIME_LIMIT
+
+
+def test_check_db_exists():
+    # the test db is up to date, nothing is applied or inserted
+    number_questions = get_number_questions()
+    check_db_exists()
+    assert get_number_questions() == number_questions
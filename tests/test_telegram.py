@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+from aiogram import Bot
+from aiogram.types import ReplyKeyboardMarkup, ReplyKeyboardRemove
+
+from core.keyboard import get_keyboard
+from core.telegram import PooledBot, PoolStats, TelegramAdapter
+from core.types import Answer
+
+
+class _Bot(Bot):
+
+    def __init__(self):
+        self.messages = []
+
+    async def send_message(self, **kwargs):
+        self.messages.append(kwargs)
+
+    async def send_document(self, **kwargs):
+        kwargs['document'] = kwargs['document'].file.read()
+        self.messages.append(kwargs)
+
+
+def test_get_reply_markup():
+    telegram = TelegramAdapter(_Bot())
+    assert isinstance(telegram.get_reply_markup(None), ReplyKeyboardRemove)
+    markup = telegram.get_reply_markup(get_keyboard([1, 2, 3], row_width=2))
+    assert isinstance(markup, ReplyKeyboardMarkup)
+    assert [[button.text for button in row] for row in markup.keyboard] == [
+        ['1', '2'], ['3']
+    ]
+    assert telegram.get_reply_markup(get_keyboard([1, 2, 3], row_width=2)) is markup
+    assert telegram.get_reply_markup.cache_info().hits == 1
+
+
+def test_send():
+    bot = _Bot()
+    telegram = TelegramAdapter(bot)
+    answer = Answer(text='text', keyboard=get_keyboard(['a', 'b']))
+    asyncio.run(telegram.send(1, answer))
+    assert bot.messages == [{
+        'chat_id': 1,
+        'text': 'text',
+        'reply_markup': telegram.get_reply_markup(answer.keyboard),
+    }]
+
+
+def test_send_document(tmpdir):
+    bot, upload_bot = _Bot(), _Bot()
+    telegram = TelegramAdapter(bot, upload_bot)
+    path = tmpdir.join('profile.prof')
+    path.write_binary(b'data')
+    asyncio.run(telegram.send_document(1, str(path), 'caption'))
+    assert bot.messages == []
+    assert upload_bot.messages == [
+        {'chat_id': 1, 'document': b'data', 'caption': 'caption'}
+    ]
+
+
+def test_pooled_bot():
+    bot = PooledBot('1:token', pool_size=4, timeout=5, dns_cache_ttl=60)
+
+    async def get_session():
+        session = bot.session
+        connector = session.connector
+        await session.close()
+        return session, connector
+
+    session, connector = asyncio.run(get_session())
+    assert connector.limit == connector.limit_per_host == 4
+    assert bot.timeout.total == 5
+    assert len(session.trace_configs) == 1
+
+
+def test_pool_stats():
+    stats = PoolStats()
+    assert stats.get_stats()['avg_wait'] == 0.0
+    stats.register_wait(0.1)
+    stats.register_wait(0.3)
+    assert stats.get_stats()['waits'] == 2
+    assert stats.get_stats()['avg_wait'] == pytest.approx(0.2)
+    assert stats.get_stats()['max_wait'] == 0.3
+
+
+def test_get_pool_stats():
+    telegram = TelegramAdapter(
+        PooledBot('1:token'), PooledBot('1:token', pool_size=1)
+    )
+    assert set(telegram.get_pool_stats()) == {'messages', 'uploads'}
+    assert TelegramAdapter(_Bot()).get_pool_stats() == {}
@@ -0,0 +1,50 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pytest
+
+from core.threads import (
+    benchmark_dispatch,
+    DispatcherThreadPool,
+    get_benchmark_texts
+)
+from core.types import Answer
+
+
+@pytest.mark.parametrize('number_threads', (1, 4, 8))
+def test_benchmark_dispatch(dispatcher, number_threads):
+    # a smoke test, the numbers: python -m core.threads
+    user_ids = [200000 + number_threads * 1000 + i for i in range(50)]
+    texts = get_benchmark_texts()
+    result = benchmark_dispatch(dispatcher, number_threads, user_ids, texts)
+    assert result['updates'] == len(user_ids) * len(texts)
+    assert result['updates_per_second'] > 0
+    assert all(dispatcher.get_session(user_id) is None for user_id in user_ids)
+
+
+def test_session_lock(dispatcher):
+    """Only one of concurrent /begin_test of one user creates a session."""
+    user_id = 3
+
+    def begin_test(_):
+        return dispatcher.handle_text_message(user_id, '/begin_test', datetime.now())
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        answers = list(executor.map(begin_test, range(16)))
+    texts = {answer.text for answer in answers}
+    assert len(texts) == 2  # the first step and the unclosed session error
+    dispatcher.close_session(user_id)
+
+
+@pytest.mark.parametrize('number_threads', (0, 2))
+def test_dispatcher_thread_pool(dispatcher, number_threads):
+    pool = DispatcherThreadPool(dispatcher, number_threads)
+    answer = asyncio.run(pool.handle_text_message(1, '/stats', datetime.now()))
+    pool.shutdown()
+    assert isinstance(answer, Answer)
+
+
+def test_register_handlers(dispatcher):
+    with pytest.raises(TypeError):
+        dispatcher._handlers['handler'] = None
@@ -0,0 +1,65 @@
+import asyncio
+import io
+import threading
+
+import pytest
+
+from core.db import get_number_questions
+from core.uploads import get_upload_report, UploadLimitError, UploadProcessor
+
+
+async def _download() -> io.BytesIO:
+    return io.BytesIO(b'document')
+
+
+def test_process():
+    uploads = UploadProcessor(max_workers=1)
+    main_thread = threading.get_ident()
+
+    def handle(document):
+        assert threading.get_ident() != main_thread
+        return document.read(), get_number_questions()
+
+    (data, number_questions), elapsed = asyncio.run(
+        uploads.process(1, _download, handle)
+    )
+    uploads.shutdown()
+    assert data == b'document'
+    assert number_questions == get_number_questions()
+    assert elapsed >= 0
+    assert not uploads.is_busy(1)
+
+
+def test_per_user_limit():
+    uploads = UploadProcessor(max_workers=2, per_user_limit=1)
+    event = threading.Event()
+    acknowledged = []
+
+    async def acknowledge():
+        acknowledged.append(True)
+
+    async def process():
+        first = asyncio.ensure_future(
+            uploads.process(1, _download, lambda _: event.wait(5), acknowledge)
+        )
+        await asyncio.sleep(0.01)
+        assert uploads.is_busy(1)
+        assert not uploads.is_busy(2)
+        with pytest.raises(UploadLimitError):
+            await uploads.process(1, _download, lambda _: None, acknowledge)
+        other_user, _ = await uploads.process(2, _download, lambda _: 2)
+        event.set()
+        result, _ = await first
+        return result, other_user
+
+    assert asyncio.run(process()) == (True, 2)
+    assert acknowledged == [True]
+    uploads.shutdown()
+
+
+def test_get_upload_report(language_test_creator_session_handler):
+    session = language_test_creator_session_handler.get_data_class(1)
+    session.number_processed, session.number_missed = 3, 1
+    report = get_upload_report(session, 0.5)
+    assert '0.50' in report
+    assert '3' in report and '1' in report
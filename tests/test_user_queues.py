@@ -0,0 +1,94 @@
+import asyncio
+import functools
+import random
+from datetime import datetime
+
+import pytest
+
+from core.db import get_current_languages
+from core.types import Answer, CloseSession
+from core.user_queues import UserQueues
+
+
+def test_order_and_concurrency():
+    number_users, number_updates, max_concurrency = 2000, 5, 16
+    queues = UserQueues(max_concurrency)
+    handled = {user_id: [] for user_id in range(number_users)}
+    running, max_running = 0, 0
+
+    async def handle(user_id, index):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        for _ in range(random.randint(0, 2)):
+            await asyncio.sleep(0)
+        handled[user_id].append(index)
+        running -= 1
+        return index
+
+    async def main():
+        futures = [
+            queues.submit(user_id, functools.partial(handle, user_id, index))
+            for index in range(number_updates)
+            for user_id in range(number_users)
+        ]
+        await queues.join()
+        return [future.result() for future in futures]
+
+    results = asyncio.run(main())
+    assert len(results) == number_users * number_updates
+    assert all(i == list(range(number_updates)) for i in handled.values())
+    assert 1 < max_running <= max_concurrency
+    assert queues.number_users == 0
+
+
+def test_error():
+    queues = UserQueues()
+
+    async def fail():
+        raise ValueError
+
+    async def succeed():
+        return 1
+
+    async def main():
+        with pytest.raises(ValueError):
+            await queues.run(1, fail)
+        # the error doesn't stop the user's queue
+        return await queues.run(1, succeed)
+
+    assert asyncio.run(main()) == 1
+
+
+def test_dispatcher_stress(dispatcher):
+    """Concurrent chats get all their answers, in order."""
+    number_users = 1000
+    texts = ('/start', '/begin_test', get_current_languages()[0], '/reset')
+    queues = UserQueues(32)
+    answers = {}
+
+    async def handle(user_id, text):
+        result = dispatcher.handle_text_message(user_id, text, datetime.now())
+        results = result if isinstance(result, tuple) else (result,)
+        for answer in results:
+            await asyncio.sleep(0)  # sending the answer
+            if isinstance(answer, Answer):
+                answers.setdefault(user_id, []).append(answer.text)
+            elif isinstance(answer, CloseSession):
+                dispatcher.close_session(user_id)
+
+    async def main():
+        for text in texts:
+            for user_id in range(1, number_users + 1):
+                queues.submit(
+                    100000 + user_id,
+                    functools.partial(handle, 100000 + user_id, text)
+                )
+            await asyncio.sleep(0)
+        await queues.join()
+
+    asyncio.run(main())
+    assert len(answers) == number_users
+    expected = answers[100001]
+    assert len(expected) == len(texts)
+    assert all(i == expected for i in answers.values())
@@ -0,0 +1,61 @@
+import asyncio
+import time
+
+from core.watchdog import LoopLagMonitor, SlowHandlerWatchdog
+
+
+def test_loop_lag_monitor():
+    monitor = LoopLagMonitor(interval=0.01, threshold=0.05)
+
+    async def block_loop():
+        task = asyncio.get_event_loop().create_task(monitor.run())
+        await asyncio.sleep(0.02)
+        time.sleep(0.1)  # blocks the loop
+        await asyncio.sleep(0.02)
+        task.cancel()
+
+    asyncio.run(block_loop())
+    stats = monitor.get_stats()
+    assert stats['samples'] > 1
+    assert stats['slow'] >= 1
+    assert stats['max_lag'] >= 0.05
+
+
+def test_slow_handler_watchdog():
+    watchdog = SlowHandlerWatchdog(threshold=0.05, check_interval=0.01)
+    watchdog.start()
+    with watchdog.watch('process_message', 1, 'user_session_handler.begin'):
+        pass
+    with watchdog.watch('process_message', 2, 'user_session_handler.test'):
+        time.sleep(0.2)
+    watchdog.stop()
+    assert watchdog.get_stats()['invocations'] == 2
+    assert watchdog.get_stats()['slow'] == 1
+    sample = watchdog.samples[-1]
+    assert (sample['user_id'], sample['step']) == (2, 'user_session_handler.test')
+    # the stack was sampled while the handler was running
+    assert 'test_slow_handler_watchdog' in sample['stack']
+
+
+def test_slow_handler_watchdog_awaiting():
+    watchdog = SlowHandlerWatchdog(threshold=0.05, check_interval=0.01)
+
+    async def awaiting_handler():
+        with watchdog.watch('process_message', 3):
+            await asyncio.sleep(0.2)
+
+    watchdog.start()
+    asyncio.run(awaiting_handler())
+    watchdog.stop()
+    # the stack of the handler's task, not of the idle event loop
+    stack = watchdog.samples[-1]['stack']
+    assert 'awaiting_handler' in stack
+    assert 'select' not in stack
+
+
+def test_slow_handler_without_sampling():
+    watchdog = SlowHandlerWatchdog(threshold=0.01)
+    with watchdog.watch('process_document', 1):
+        time.sleep(0.02)
+    assert watchdog.get_stats()['slow'] == 1
+    assert watchdog.samples[-1]['stack'] is None
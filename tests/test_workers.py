@@ -0,0 +1,67 @@
+import asyncio
+import functools
+import time
+from datetime import datetime
+
+import pytest
+
+from core.db import get_db_path
+from core.threads import get_benchmark_texts
+from core.workers import (
+    benchmark_workers,
+    process_updates,
+    _run_benchmark_worker,
+    Update,
+    WorkerPool
+)
+
+
+def _run_worker(queue, counter):
+    async def handle_update(update):
+        pass
+
+    asyncio.run(process_updates(queue, counter, handle_update))
+
+
+@pytest.mark.parametrize('number_workers', (1, 2, 4))
+def test_route(number_workers):
+    pool = WorkerPool(number_workers, _run_worker)
+    routes = [pool.route(user_id) for user_id in range(-100, 1000)]
+    assert set(routes) == set(range(number_workers))
+    assert routes == [pool.route(user_id) for user_id in range(-100, 1000)]
+
+
+def test_number_workers_error():
+    with pytest.raises(ValueError):
+        WorkerPool(0, _run_worker)
+
+
+def test_worker_pool():
+    pool = WorkerPool(2, _run_worker)
+    pool.start()
+    number_updates = 100
+    for user_id in range(number_updates):
+        pool.put(Update('message', user_id, '/start', datetime.now()))
+    deadline = time.monotonic() + 10
+    while sum(pool.get_stats()['processed']) < number_updates:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    pool.stop()
+    processed = pool.get_stats()['processed']
+    assert processed == [
+        sum(pool.route(user_id) == index for user_id in range(number_updates))
+        for index in range(2)
+    ]
+
+
+def test_benchmark_workers():
+    # a smoke test, the numbers: python -m core.workers
+    updates = [
+        Update('message', user_id, text, datetime.now())
+        for text in get_benchmark_texts() for user_id in range(100000, 100010)
+    ]
+    # the workers connect to the test db
+    target = functools.partial(_run_benchmark_worker, get_db_path())
+    result = benchmark_workers(2, target, updates, timeout=60)
+    assert result['updates'] == len(updates)
+    assert result['updates_per_second'] > 0